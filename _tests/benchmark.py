@@ -0,0 +1,651 @@
+#!/usr/bin/env python
+
+#
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file
+# except in compliance with the License. A copy of the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+"""
+Offline benchmarks for the awscfnctl commands
+
+Each scenario runs a command's main() against awscfnctl.fakeaws, no AWS account or network
+is needed.  Every API call is answered in memory after an artificial latency, and the
+time.sleep() waits in the commands advance the fake's virtual clock instead of waiting, the
+virtual seconds are reported separately.
+
+  python _tests/benchmark.py                               # all scenarios, default scale
+  python _tests/benchmark.py -s list -s getinstinfo --instances 20000 --latency 0.02
+  python _tests/benchmark.py --json out.json               # save results
+  python _tests/benchmark.py --compare out.json            # exit 1 on a regression
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+import contextlib
+
+from awscfnctl import CfnControl
+from awscfnctl import ApiStats
+from awscfnctl.fakeaws import FakeAws
+
+progname = 'benchmark'
+
+REGION = 'us-east-1'
+BENCH_STACK = 'bench-stack'
+CLUSTER_SIZE = 64
+
+
+def arg_parse():
+
+    parser = argparse.ArgumentParser(prog=progname, description='Benchmark the awscfnctl commands offline')
+
+    parser.add_argument('-s', dest='scenarios', action='append', required=False,
+                        help='Scenario to run, repeat for more than one (default all): {0}'.format(
+                            ', '.join(sorted(SCENARIOS))))
+    parser.add_argument('--stacks', dest='stacks', type=int, default=500, help='Number of stacks (default 500)')
+    parser.add_argument('--instances', dest='instances', type=int, default=1000,
+                        help='Number of instances (default 1000)')
+    parser.add_argument('--regions', dest='regions', type=int, default=16, help='Number of regions (default 16)')
+    parser.add_argument('--latency', dest='latency', type=float, default=0.0,
+                        help='Artificial latency added to each API call, in seconds (default 0)')
+    parser.add_argument('--repeat', dest='repeat', type=int, default=1,
+                        help='Run each scenario this many times, best wall time is reported')
+    parser.add_argument('--quick', dest='quick', action='store_true',
+                        help='Small scale smoke run (10 stacks, 20 instances, 3 regions)')
+    parser.add_argument('--json', dest='json_out', required=False, help='Write the results to a JSON file')
+    parser.add_argument('--compare', dest='compare', required=False,
+                        help='Compare with a previous --json file, exit 1 on a regression')
+    parser.add_argument('--tolerance', dest='tolerance', type=float, default=0.25,
+                        help='Allowed wall time and memory growth for --compare (default 0.25)')
+
+    args = parser.parse_args()
+
+    if args.quick:
+        args.stacks = 10
+        args.instances = 20
+        args.regions = 3
+
+    return args
+
+
+def make_fake(args):
+
+    """
+    returns a FakeAws with args.stacks stacks, the first one owning an ASG of args.instances instances
+    """
+
+    regions = [REGION] + ['region-{0:02d}'.format(n) for n in range(1, args.regions)]
+    fake = FakeAws(regions=regions, latency=args.latency)
+
+    stack = fake.add_stack(BENCH_STACK, asg_size=args.instances, outputs={'ClusterName': BENCH_STACK},
+                           tags=[{'Key': 'cfnctl_param_file', 'Value': 'bench.json.' + BENCH_STACK}])
+    fake.asg = stack['resources'][0]['PhysicalResourceId']
+
+    for n in range(1, args.stacks):
+        stack_name = 'stack-{0:05d}'.format(n)
+        fake.add_stack(stack_name, outputs={'ClusterName': stack_name},
+                       tags=[{'Key': 'cfnctl_param_file', 'Value': 'bench.json.' + stack_name}])
+
+    return fake
+
+
+@contextlib.contextmanager
+def command_line(argv):
+
+    saved_argv = sys.argv
+    sys.argv = argv
+    try:
+        yield
+    finally:
+        sys.argv = saved_argv
+
+
+def template_files(workdir):
+
+    template = os.path.join(workdir, 'bench.json')
+    with open(template, 'w') as f:
+        json.dump({'Description': 'benchmark template',
+                   'Parameters': {'KeyName': {'Type': 'String', 'Default': 'bench'}},
+                   'Resources': {}}, f)
+
+    param_file = os.path.join(workdir, 'bench.json.default')
+    with open(param_file, 'w') as f:
+        f.write('[AWS-Config]\nTemplateBody = {0}\n\n[Paramters]\nKeyName = bench\n'.format(template))
+
+    return param_file
+
+
+def run_cfnctl(*cli_args):
+
+    from awscfnctl import cfnctl
+
+    with command_line(['cfnctl'] + list(cli_args)):
+        cfnctl.main()
+
+
+def scenario_list(fake, workdir):
+
+    run_cfnctl('list', '-r', REGION)
+
+
+def scenario_list_detail(fake, workdir):
+
+    run_cfnctl('list', '-d', '-r', REGION)
+
+
+def scenario_list_long(fake, workdir):
+
+    # tags, parameters and outputs of every stack from describe_stacks pages, not a call per stack
+    run_cfnctl('list', '-l', '--tag', 'cfnctl_param_file', '-r', REGION)
+
+
+def scenario_list_sweep(fake, workdir):
+
+    # three accounts in every region, only CloudFormation clients are made
+    run_cfnctl('list', '--profiles', 'prod,staging,dev', '--all-regions', '-r', REGION)
+
+
+def setup_build_offline(fake):
+
+    # the inventory saved while online, not timed
+    with fake.installed(), contextlib.redirect_stdout(io.StringIO()):
+        run_cfnctl('snapshot', '-r', REGION)
+
+
+def scenario_build_offline(fake, workdir):
+
+    from unittest import mock
+
+    # the defaults are the fake account's resources, so every prompt is answered with enter
+    r = fake.region(REGION)
+    template = os.path.join(workdir, 'offline.json')
+    with open(template, 'w') as f:
+        json.dump({'Description': 'offline build template',
+                   'Parameters': {'KeyName': {'Type': 'AWS::EC2::KeyPair::KeyName', 'Default': r.key_pairs[0]},
+                                  'VpcId': {'Type': 'AWS::EC2::VPC::Id', 'Default': r.vpc_id},
+                                  'Subnet': {'Type': 'AWS::EC2::Subnet::Id', 'Default': r.subnets[0]},
+                                  'SecurityGroup': {'Type': 'AWS::EC2::SecurityGroup::Id',
+                                                    'Default': r.security_group},
+                                  'ClusterSize': {'Type': 'String', 'Default': '4'}},
+                   'Resources': {}}, f)
+
+    with mock.patch('builtins.input', return_value=''):
+        run_cfnctl('build', '-r', REGION, '-t', template, '--offline')
+
+
+def scenario_create(fake, workdir):
+
+    run_cfnctl('create', '-r', REGION, '-n', 'bench-create', '-f', template_files(workdir))
+
+
+def cluster_files(workdir):
+
+    template = os.path.join(workdir, 'cluster.json')
+    parameters = ['KeyName', 'EnableEnaVfi', 'AddNetInterfaces', 'TotalNetInterfaces', 'Subnet', 'SecurityGroups']
+    with open(template, 'w') as f:
+        json.dump({'Description': 'benchmark cluster template',
+                   'Parameters': dict((p, {'Type': 'String'}) for p in parameters),
+                   'Resources': {'Cluster': {'Type': 'AWS::AutoScaling::AutoScalingGroup',
+                                             'Properties': {'DesiredCapacity': CLUSTER_SIZE}},
+                                 'EIP': {'Type': 'AWS::EC2::EIP'}},
+                   'Outputs': {'ElasticIP': {'Value': {'Ref': 'EIP'}}}}, f)
+
+    param_file = os.path.join(workdir, 'cluster.json.default')
+    with open(param_file, 'w') as f:
+        f.write('[AWS-Config]\nTemplateBody = {0}\n\n[Paramters]\nKeyName = bench\nEnableEnaVfi = true\n'
+                'AddNetInterfaces = true\nTotalNetInterfaces = 2\nSubnet = subnet-1\n'
+                'SecurityGroups = sg-1\n'.format(template))
+
+    return param_file
+
+
+def scenario_create_cluster(fake, workdir):
+
+    # ENA/VFI and an extra network interface on every instance, after the stack is created
+    run_cfnctl('create', '-r', REGION, '-n', 'bench-cluster', '-f', cluster_files(workdir))
+
+
+def scenario_asgctl_stop(fake, workdir):
+
+    from awscfnctl import asgctl
+
+    with command_line(['asgctl', 'stop', '-a', fake.asg, '-r', REGION]):
+        asgctl.main()
+
+
+def scenario_asgctl_status(fake, workdir):
+
+    from awscfnctl import asgctl
+
+    with command_line(['asgctl', 'status', '-n', BENCH_STACK, '-r', REGION]):
+        asgctl.main()
+
+
+def scenario_asgctl_restart(fake, workdir):
+
+    from awscfnctl import asgctl
+
+    # rolling, up to 4 batches of 10% of the instances at once, with at most 30% out of service
+    size = len(fake.region(REGION).asgs[fake.asg]['lifecycle'])
+    batch_size = max(1, size // 10)
+    with command_line(['asgctl', 'restart', '-a', fake.asg, '-r', REGION, '--batch-size', str(batch_size),
+                       '--concurrency', '4', '--max-unavailable', str(3 * batch_size)]):
+        asgctl.main()
+
+
+def setup_asgctl_start(fake):
+
+    # leave the ASG the way "asgctl stop" does
+    r = fake.region(REGION)
+    for instance_id in r.asgs[fake.asg]['lifecycle']:
+        r.asgs[fake.asg]['lifecycle'][instance_id] = 'Standby'
+        r.instances[instance_id]['State'] = 'stopped'
+
+
+def scenario_asgctl_start(fake, workdir):
+
+    from awscfnctl import asgctl
+
+    with command_line(['asgctl', 'start', '-a', fake.asg, '-r', REGION]):
+        asgctl.main()
+
+
+def scenario_getinstinfo(fake, workdir):
+
+    from awscfnctl import getinstinfo
+
+    with command_line(['getinstinfo', '-r', REGION]):
+        getinstinfo.main()
+
+
+def scenario_getinstinfo_jsonl(fake, workdir):
+
+    from awscfnctl import getinstinfo
+
+    # streamed as the pages arrive, nothing is collected or sorted
+    with command_line(['getinstinfo', '--output', 'jsonl', '-r', REGION]):
+        getinstinfo.main()
+
+
+def scenario_getinstinfo_top(fake, workdir):
+
+    from awscfnctl import getinstinfo
+
+    # filtered by EC2, and only the 10 newest kept while reading
+    with command_line(['getinstinfo', '-s', 'running', '-a', fake.asg, '--sort', 'LaunchTime', '--reverse',
+                       '--top', '10', '-r', REGION]):
+        getinstinfo.main()
+
+
+def scenario_getinstinfo_regions(fake, workdir):
+
+    from awscfnctl import getinstinfo
+
+    # every region at once, merged into one table
+    with command_line(['getinstinfo', '--all-regions', '-s', 'running', '-r', REGION]):
+        getinstinfo.main()
+
+
+def scenario_list_jsonl(fake, workdir):
+
+    run_cfnctl('list', '--output', 'jsonl', '--fields', 'StackName,StackStatus', '-r', REGION)
+
+
+def scenario_getstackinfo(fake, workdir):
+
+    from awscfnctl import getstackinfo
+
+    # every stack-0000N, the stacks are complete so each one is polled once
+    with command_line(['getstackinfo', '-p', 'stack-0000', '-r', REGION]):
+        getstackinfo.main()
+
+
+def scenario_getstackinfo_watch(fake, workdir):
+
+    from awscfnctl import getstackinfo
+
+    # all of the stacks, the API calls depend on the number of list_stacks pages, not of stacks
+    with command_line(['getstackinfo', '-w', '-p', 'stack-', '-r', REGION]):
+        getstackinfo.main()
+
+
+def scenario_getstacktopo(fake, workdir):
+
+    from awscfnctl import getstacktopo
+
+    # ASGs, instances with their network interfaces and the Elastic IPs, batched at each level
+    with command_line(['getstacktopo', '-n', BENCH_STACK, '-r', REGION, '--save',
+                       os.path.join(workdir, 'topology.json')]):
+        getstacktopo.main()
+
+
+def scenario_coalesce_error(fake, workdir):
+
+    """
+    the same call failing twice in a before-call handler after the coalescer, the second call must
+    not wait for the first one's flight
+    """
+
+    from awscfnctl.coalesce import CallCoalescer
+    from awscfnctl.fakeaws import FakeAwsError
+
+    c = CfnControl(region=REGION, coalescer=CallCoalescer(wait_timeout=30))
+
+    def fail(model, **kwargs):
+        if model.name == 'DescribeStacks':
+            raise FakeAwsError('injected failure')
+
+    # after the coalescer, which is first, and ahead of the fake
+    c.client_cfn.meta.events.register_first('before-call', fail)
+
+    for n in range(2):
+        start = time.monotonic()
+        try:
+            c.client_cfn.describe_stacks(StackName=BENCH_STACK)
+        except FakeAwsError:
+            pass
+        else:
+            raise ValueError('call {0} did not fail'.format(n + 1))
+        if time.monotonic() - start > 5:
+            raise ValueError('call {0} waited for the failed call before it'.format(n + 1))
+        if c.coalescer.in_flight:
+            raise ValueError('call {0} left its flight behind'.format(n + 1))
+
+
+def scenario_build_ami_maps(fake, workdir):
+
+    from awscfnctl import build_ami_maps
+
+    with command_line(['build_ami_maps', '--amzn2', 'ami-0123456789abcdef0', '--centos7', 'ami-0fedcba987654321']):
+        build_ami_maps.main()
+
+
+COMPLETION_CHECK = r"""
+source "$1"
+complete_words() {
+    COMP_WORDS=("$@")
+    COMP_CWORD=$(( ${#COMP_WORDS[@]} - 1 ))
+    local start=$EPOCHREALTIME
+    _awscfnctl_complete
+    echo "$(( ${EPOCHREALTIME/./} - ${start/./} )) ${#COMPREPLY[@]} ${COMP_WORDS[*]}"
+}
+complete_words cfnctl delete -r us-east-1 -n stack-0000
+complete_words asgctl status -n ''
+complete_words asgctl status -a bench
+complete_words getstackinfo -s stack-
+complete_words cfnctl -r ''
+complete_words cfnctl de
+"""
+
+
+def scenario_completion(fake, workdir):
+
+    """
+    index the stacks, ASGs and key pairs, then complete from the index in bash, fails if a
+    completion takes 50ms or more
+    """
+
+    from awscfnctl import completion
+
+    cfn_param_dir = os.path.join(workdir, '.cfnparam')
+    completion.refresh(cfn_param_dir, 'default', [REGION], session=CfnControl.session_factory(profile_name='default'))
+
+    script = os.path.join(workdir, 'completion.bash')
+    with open(script, 'w') as f:
+        f.write(completion.shell_script())
+
+    env = dict(os.environ)
+    env['HOME'] = workdir
+    env.pop('AWS_DEFAULT_REGION', None)
+    p = subprocess.run(['bash', '-c', COMPLETION_CHECK, 'bash', script], env=env, stdout=subprocess.PIPE,
+                       stderr=subprocess.PIPE, universal_newlines=True)
+    if p.returncode:
+        raise ValueError('completion failed: {0}'.format(p.stderr.strip()))
+
+    for line in p.stdout.strip().split('\n'):
+        usecs, found, words = line.split(' ', 2)
+        print('{0:>6.1f}ms {1:>6} {2}'.format(int(usecs) / 1000.0, found, words))
+        if not int(found):
+            raise ValueError('nothing completed for "{0}"'.format(words))
+        if int(usecs) >= 50000:
+            raise ValueError('"{0}" took {1:.0f}ms'.format(words, int(usecs) / 1000.0))
+
+
+# modules the commands must not load just to print their help
+HEAVY_MODULES = ['boto3', 'botocore', 'cfn_flip']
+
+STARTUP_CHECK = """
+import sys
+sys.argv = [{0!r}, '-h']
+import awscfnctl.{0} as command
+try:
+    command.main()
+except SystemExit:
+    pass
+sys.stderr.write('\\nloaded: ' + ' '.join(m for m in {1!r} if m in sys.modules))
+"""
+
+
+def scenario_startup(fake, workdir):
+
+    """
+    "<command> -h" for every command, each in a new interpreter, fails if one loads a heavy module
+    """
+
+    import awscfnctl
+    from awscfnctl.cassette import COMMANDS
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([os.path.dirname(os.path.dirname(awscfnctl.__file__))] +
+                                        [p for p in [env.get('PYTHONPATH')] if p])
+
+    for command in COMMANDS:
+        p = subprocess.run([sys.executable, '-c', STARTUP_CHECK.format(command, HEAVY_MODULES)], env=env,
+                           stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        print(p.stdout)
+        loaded = p.stderr.rstrip().split('\n')[-1]
+        if not loaded.startswith('loaded:'):
+            raise ValueError('{0} -h failed: {1}'.format(command, p.stderr.strip()))
+        if loaded.split()[1:]:
+            raise ValueError('{0} -h imports {1}'.format(command, ', '.join(loaded.split()[1:])))
+
+
+SCENARIOS = {
+    'list': scenario_list,
+    'list-detail': scenario_list_detail,
+    'list-long': scenario_list_long,
+    'list-sweep': scenario_list_sweep,
+    'build-offline': scenario_build_offline,
+    'create': scenario_create,
+    'create-cluster': scenario_create_cluster,
+    'asgctl-stop': scenario_asgctl_stop,
+    'asgctl-start': scenario_asgctl_start,
+    'asgctl-restart': scenario_asgctl_restart,
+    'asgctl-status': scenario_asgctl_status,
+    'getinstinfo': scenario_getinstinfo,
+    'getinstinfo-jsonl': scenario_getinstinfo_jsonl,
+    'getinstinfo-top': scenario_getinstinfo_top,
+    'getinstinfo-regions': scenario_getinstinfo_regions,
+    'list-jsonl': scenario_list_jsonl,
+    'getstackinfo': scenario_getstackinfo,
+    'getstackinfo-watch': scenario_getstackinfo_watch,
+    'getstacktopo': scenario_getstacktopo,
+    'coalesce-error': scenario_coalesce_error,
+    'build_ami_maps': scenario_build_ami_maps,
+    'completion': scenario_completion,
+    'startup': scenario_startup,
+}
+
+# state a scenario needs before it starts, not timed
+SETUP = {
+    'asgctl-start': setup_asgctl_start,
+    'build-offline': setup_build_offline,
+}
+
+
+def run_scenario(name, args, workdir, trace_memory=False):
+
+    """
+    run one scenario against a new FakeAws, returns a dictionary of results
+
+    tracemalloc slows everything down, so memory is measured in its own run
+    """
+
+    fake = make_fake(args)
+    if name in SETUP:
+        SETUP[name](fake)
+
+    api_stats = ApiStats()
+    fake.session_hooks.append(api_stats.register)
+
+    output = io.StringIO()
+    error = None
+    peak = 0
+
+    if trace_memory:
+        tracemalloc.start()
+    start = time.monotonic()
+    try:
+        with fake.installed(), fake.patched_sleep(), contextlib.redirect_stdout(output):
+            SCENARIOS[name](fake, workdir)
+    except SystemExit as e:
+        if e.code:
+            error = 'exit {0}: {1}'.format(e.code, output.getvalue().strip().split('\n')[-1])
+    except Exception as e:
+        error = '{0}: {1}'.format(type(e).__name__, e)
+    wall = time.monotonic() - start
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {
+        'scenario': name,
+        'wall': wall,
+        'calls': api_stats.total_calls(),
+        'sleep': fake.clock.slept,
+        'peak_mb': peak / (1024.0 * 1024.0),
+        'output_lines': output.getvalue().count('\n'),
+        'error': error,
+    }
+
+
+def print_results(results):
+
+    line_fmt = '{0:<20} {1:>10} {2:>8} {3:>10} {4:>10} {5:>8}  {6}'
+
+    print(line_fmt.format('Scenario', 'Wall s', 'Calls', 'Slept s', 'Peak MB', 'Lines', 'Error'))
+    print(84 * '-')
+    for r in results:
+        print(line_fmt.format(r['scenario'], '{0:.3f}'.format(r['wall']), r['calls'],
+                              '{0:.0f}'.format(r['sleep']), '{0:.2f}'.format(r['peak_mb']),
+                              r['output_lines'], r['error'] or ''))
+
+
+def compare_results(results, baseline_file, tolerance):
+
+    """
+    returns a list of regressions against a previous --json run
+    """
+
+    with open(baseline_file) as f:
+        baseline = dict((r['scenario'], r) for r in json.load(f)['results'])
+
+    regressions = list()
+
+    for r in results:
+        b = baseline.get(r['scenario'])
+        if b is None:
+            continue
+        if r['error'] and not b['error']:
+            regressions.append('{0}: now fails with {1}'.format(r['scenario'], r['error']))
+        if r['calls'] > b['calls']:
+            regressions.append('{0}: API calls {1} -> {2}'.format(r['scenario'], b['calls'], r['calls']))
+        if r['sleep'] > b['sleep']:
+            regressions.append('{0}: fixed sleeps {1:.0f}s -> {2:.0f}s'.format(r['scenario'], b['sleep'], r['sleep']))
+        if r['wall'] > b['wall'] * (1 + tolerance) and r['wall'] - b['wall'] > 0.25:
+            regressions.append('{0}: wall time {1:.3f}s -> {2:.3f}s'.format(r['scenario'], b['wall'], r['wall']))
+        if r['peak_mb'] > b['peak_mb'] * (1 + tolerance) and r['peak_mb'] - b['peak_mb'] > 1.0:
+            regressions.append('{0}: peak memory {1:.2f}MB -> {2:.2f}MB'.format(r['scenario'], b['peak_mb'],
+                                                                               r['peak_mb']))
+
+    return regressions
+
+
+def main():
+
+    rc = 0
+
+    args = arg_parse()
+
+    # nothing here may refresh a completion index from a real account
+    CfnControl.completion_refresh = False
+
+    scenarios = args.scenarios or sorted(SCENARIOS)
+    for name in scenarios:
+        if name not in SCENARIOS:
+            raise ValueError('Unknown scenario "{0}", choose from {1}'.format(name, ', '.join(sorted(SCENARIOS))))
+
+    print('Stacks: {0}  Instances: {1}  Regions: {2}  Latency: {3}s'.format(
+        args.stacks, args.instances, args.regions, args.latency))
+
+    # the commands run in this process, against the fake backend, never in a daemon
+    os.environ.pop('AWSCFNCTL_DAEMON', None)
+
+    results = list()
+    workdir = tempfile.mkdtemp(prefix='awscfnctl-bench-')
+    saved_home = os.environ.get('HOME')
+    # keep ~/.cfnparam lookups inside the work directory
+    os.environ['HOME'] = workdir
+    try:
+        for name in scenarios:
+            runs = [run_scenario(name, args, workdir) for n in range(max(1, args.repeat))]
+            result = min(runs, key=lambda r: r['wall'])
+            result['peak_mb'] = run_scenario(name, args, workdir, trace_memory=True)['peak_mb']
+            results.append(result)
+    finally:
+        if saved_home is not None:
+            os.environ['HOME'] = saved_home
+
+    print_results(results)
+
+    if any(r['error'] for r in results):
+        rc = 1
+
+    if args.json_out:
+        with open(args.json_out, 'w') as f:
+            json.dump({'stacks': args.stacks, 'instances': args.instances, 'regions': args.regions,
+                       'latency': args.latency, 'results': results}, f, indent=2)
+
+    if args.compare:
+        regressions = compare_results(results, args.compare, args.tolerance)
+        for r in regressions:
+            print('REGRESSION: {0}'.format(r))
+        if regressions:
+            rc = 1
+
+    return rc
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print('\nReceived Keyboard interrupt.')
+        print('Exiting...')
+    except ValueError as e:
+        print('ERROR: {0}'.format(e))
+        sys.exit(1)
@@ -1 +1,8 @@
+# run from anywhere, against the awscfnctl in this tree
+cd "$(dirname "$0")/.." || exit 1
+PYTHONPATH="aws-cfn-control${PYTHONPATH:+:$PYTHONPATH}"
+export PYTHONPATH
+
+python -m unittest discover -s _tests || exit 1
+python _tests/benchmark.py --quick || exit 1
 echo "testing complete"
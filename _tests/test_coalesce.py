@@ -0,0 +1,90 @@
+#
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file
+# except in compliance with the License. A copy of the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+import time
+import threading
+import unittest
+
+from awscfnctl.coalesce import CallCoalescer
+from awscfnctl.fakeaws import FakeAws
+from awscfnctl.fakeaws import FakeAwsError
+
+REGION = 'us-east-1'
+
+
+class CoalesceFailureTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.fake = FakeAws(regions=[REGION])
+        self.coalescer = CallCoalescer(wait_timeout=30)
+        self.client = self.coalescer.register(self.fake.session().client('cloudformation', region_name=REGION))
+        self.fail_in = set()
+        self.before_failing = None
+
+        def fail(model, **kwargs):
+            if threading.current_thread() in self.fail_in:
+                if self.before_failing is not None:
+                    self.before_failing()
+                raise FakeAwsError('injected failure')
+
+        # after the coalescer and ahead of the fake, skipping after-call and after-call-error
+        self.client.meta.events.register_first('before-call', fail)
+
+    def test_failing_call_twice(self):
+
+        self.fail_in.add(threading.current_thread())
+
+        for n in range(2):
+            start = time.monotonic()
+            with self.assertRaises(FakeAwsError):
+                self.client.describe_stacks()
+            self.assertLess(time.monotonic() - start, 5)
+            self.assertEqual(self.coalescer.in_flight, dict())
+
+    def test_waiter_makes_its_own_call(self):
+
+        self.fail_in.add(threading.current_thread())
+        results = list()
+
+        def follower():
+            results.append(self.client.describe_stacks())
+
+        t = threading.Thread(target=follower)
+
+        def wait_for_follower():
+            # the first call leads, fail it once the second one waits for it
+            t.start()
+            deadline = time.monotonic() + 5
+            while time.monotonic() < deadline:
+                with self.coalescer.lock:
+                    if any(f.waiters for f in self.coalescer.in_flight.values()):
+                        return
+                time.sleep(0.01)
+            self.fail('the second call did not wait for the first')
+
+        self.before_failing = wait_for_follower
+
+        with self.assertRaises(FakeAwsError):
+            self.client.describe_stacks()
+        t.join(10)
+
+        self.assertFalse(t.is_alive())
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['Stacks'], list())
+        self.assertEqual(self.coalescer.shared, 0)
+        self.assertEqual(self.coalescer.in_flight, dict())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+#
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file
+# except in compliance with the License. A copy of the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+import os
+import sys
+import time
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from awscfnctl import daemon
+
+
+class DaemonFallbackTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.workdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.workdir, 'daemon.sock')
+        self.env = mock.patch.dict(os.environ, {daemon.DAEMON_ENV: '1', daemon.DAEMON_SOCKET_ENV: self.path})
+        self.env.start()
+        self.argv = mock.patch.object(sys, 'argv', ['getec2keys', '-r', 'us-east-1'])
+        self.argv.start()
+        self.daemon = None
+
+    def tearDown(self):
+
+        if self.daemon is not None:
+            self.daemon.stopping = True
+            self.daemon.server.close()
+        self.argv.stop()
+        self.env.stop()
+        shutil.rmtree(self.workdir)
+
+    def start_daemon(self):
+
+        # answers requests, no commands are run without serve()
+        self.daemon = daemon.Daemon(path=self.path)
+        self.daemon.bind()
+        threading.Thread(target=self.daemon.accept, daemon=True).start()
+
+        return self.daemon
+
+    def test_not_enabled(self):
+
+        os.environ[daemon.DAEMON_ENV] = '0'
+        self.start_daemon()
+
+        self.assertIsNone(daemon.run_in_daemon('getec2keys'))
+        self.assertEqual(self.daemon.served + self.daemon.fallbacks, 0)
+
+    def test_no_daemon(self):
+
+        self.assertIsNone(daemon.run_in_daemon('getec2keys'))
+
+    def test_busy(self):
+
+        self.start_daemon().busy = True
+
+        self.assertIsNone(daemon.run_in_daemon('getec2keys'))
+        self.assertEqual(self.daemon.fallbacks, 1)
+
+    def test_other_code(self):
+
+        self.start_daemon().stamp = 0
+
+        self.assertIsNone(daemon.run_in_daemon('getec2keys'))
+        self.assertTrue(self.daemon.stopping)
+
+    def test_silent_client(self):
+
+        self.start_daemon()
+
+        with mock.patch.object(daemon, 'REQUEST_TIMEOUT', 0.5):
+            silent = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            silent.connect(self.path)
+
+            # answered while the first caller says nothing
+            start = time.monotonic()
+            self.assertEqual(daemon.request({'ping': True}, self.path)['pid'], os.getpid())
+            self.assertLess(time.monotonic() - start, 0.5)
+
+            # and the silent one is hung up on
+            silent.settimeout(5)
+            self.assertEqual(silent.recv(10), b'')
+            silent.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+#
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file
+# except in compliance with the License. A copy of the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+import datetime
+import unittest
+
+from awscfnctl.inventory import DEFAULT_INSTANCE_FIELDS
+from awscfnctl.inventory import record_class
+
+LAUNCH_TIME = datetime.datetime(2024, 1, 2, 3, 4, 5)
+
+INSTANCE = {
+    'InstanceId': 'i-0123456789abcdef0',
+    'InstanceType': 'c5.large',
+    'State': {'Name': 'running'},
+    'PrivateIpAddress': '10.0.1.23',
+    'LaunchTime': LAUNCH_TIME,
+    'Placement': {'AvailabilityZone': 'us-east-1a'},
+    'Tags': [{'Key': 'Name', 'Value': 'node1'}, {'Key': 'aws:autoscaling:groupName', 'Value': 'asg1'}],
+}
+
+
+class InstanceRecordTest(unittest.TestCase):
+
+    def test_default_fields(self):
+
+        record = record_class()(INSTANCE)
+
+        self.assertEqual(tuple(record), DEFAULT_INSTANCE_FIELDS)
+        self.assertEqual(record['Name'], 'node1')
+        self.assertEqual(record['State'], 'running')
+        self.assertEqual(record['LaunchTime'], LAUNCH_TIME)
+        self.assertIsNone(record['PublicIpAddress'])
+
+    def test_projection(self):
+
+        record = record_class(['InstanceId', 'AutoScalingGroup', 'AvailabilityZone', 'Region'])(INSTANCE,
+                                                                                              region='us-east-1')
+
+        self.assertEqual(record.as_dict(), {'InstanceId': 'i-0123456789abcdef0', 'AutoScalingGroup': 'asg1',
+                                            'AvailabilityZone': 'us-east-1a', 'Region': 'us-east-1'})
+        self.assertRaises(KeyError, lambda: record['Name'])
+        self.assertEqual(record.get('Name', 'NULL'), 'NULL')
+        self.assertFalse(hasattr(record, '__dict__'))
+
+    def test_one_class_per_projection(self):
+
+        self.assertIs(record_class(['InstanceId', 'Name']), record_class(('InstanceId', 'Name')))
+        self.assertIsNot(record_class(['InstanceId', 'Name']), record_class(['Name', 'InstanceId']))
+
+    def test_unknown_field(self):
+
+        self.assertRaises(ValueError, record_class, ['InstanceId', 'Owner'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+#
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file
+# except in compliance with the License. A copy of the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from awscfnctl.stackcache import OutputCache
+
+REGION = 'us-east-1'
+
+
+def described(status='CREATE_COMPLETE', outputs=None):
+
+    return {'StackName': 'cluster1', 'StackId': 'arn:aws:cloudformation:us-east-1:123456789012:stack/cluster1/1',
+            'StackStatus': status,
+            'Outputs': [{'OutputKey': k, 'OutputValue': v} for k, v in (outputs or {'ElasticIP': '1.2.3.4'}).items()]}
+
+
+class OutputCacheTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.workdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.workdir, '.cache', 'stack-outputs-default.json')
+
+    def tearDown(self):
+
+        shutil.rmtree(self.workdir)
+
+    def test_ttl_zero_writes_nothing(self):
+
+        cache = OutputCache(self.path, ttl=0)
+        cache.put(REGION, described())
+        cache.forget(REGION, 'cluster1')
+
+        self.assertIsNone(cache.get(REGION, 'cluster1'))
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_saved_for_ttl(self):
+
+        with mock.patch('time.time', return_value=1000.0):
+            OutputCache(self.path, ttl=60).put(REGION, described())
+
+        # later runs read the file
+        with mock.patch('time.time', return_value=1059.0):
+            cache = OutputCache(self.path, ttl=60)
+            self.assertEqual(cache.get(REGION, 'cluster1'), {'ElasticIP': '1.2.3.4'})
+            self.assertIsNone(cache.get('us-west-2', 'cluster1'))
+
+        with mock.patch('time.time', return_value=1061.0):
+            self.assertIsNone(OutputCache(self.path, ttl=60).get(REGION, 'cluster1'))
+
+    def test_not_settled_is_forgotten(self):
+
+        cache = OutputCache(self.path, ttl=60)
+        cache.put(REGION, described())
+        cache.put(REGION, described(status='UPDATE_IN_PROGRESS'))
+
+        self.assertIsNone(cache.get(REGION, 'cluster1'))
+        self.assertIsNone(OutputCache(self.path, ttl=60).get(REGION, 'cluster1'))
+
+    def test_forget(self):
+
+        cache = OutputCache(self.path, ttl=60)
+        cache.put(REGION, described())
+        cache.forget(REGION, 'cluster1')
+
+        self.assertIsNone(OutputCache(self.path, ttl=60).get(REGION, 'cluster1'))
+
+    def test_ttl_from_environment(self):
+
+        with mock.patch.dict(os.environ, {'AWSCFNCTL_OUTPUT_CACHE_TTL': '30'}):
+            self.assertEqual(OutputCache(self.path).ttl, 30)
+        with mock.patch.dict(os.environ, {'AWSCFNCTL_OUTPUT_CACHE_TTL': 'soon'}):
+            self.assertRaises(ValueError, OutputCache, self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
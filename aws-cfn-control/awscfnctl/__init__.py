@@ -11,4 +11,15 @@
 # License for the specific language governing permissions and limitations under the License.
 #
 
-from .awscfnctl import CfnControl
+from .apistats import ApiStats
+
+
+def __getattr__(name):
+
+    # CfnControl pulls in boto3, import it on first use so the commands can parse their
+    # arguments and print help without it
+    if name == 'CfnControl':
+        from .awscfnctl import CfnControl
+        return CfnControl
+
+    raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
@@ -0,0 +1,325 @@
+#
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file
+# except in compliance with the License. A copy of the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+import sys
+import math
+import time
+import atexit
+import threading
+from .timing import count_call
+
+
+THROTTLE_ERROR_CODES = [
+    'Throttling',
+    'ThrottlingException',
+    'ThrottledException',
+    'RequestThrottledException',
+    'TooManyRequestsException',
+    'RequestLimitExceeded',
+    'BandwidthLimitExceeded',
+    'SlowDown',
+    'RequestThrottled',
+    'PriorRequestNotComplete',
+]
+
+
+def is_throttle_error(parsed):
+    """
+    returns True if a parsed botocore response is a throttling error
+
+    :param parsed:  parsed response dictionary
+    """
+
+    try:
+        return parsed['Error']['Code'] in THROTTLE_ERROR_CODES
+    except (KeyError, TypeError):
+        return False
+
+
+def event_op(event_name):
+    """
+    returns (service id, operation) from a botocore event name
+
+    :param event_name:  <event>.<service id>.<operation>, e.g. after-call.cloudformation.DescribeStacks
+    """
+
+    event_parts = event_name.split('.')
+
+    return event_parts[1], event_parts[2]
+
+
+def percentile(values, pct):
+    """
+    nearest-rank percentile of a sorted list
+
+    :param values:  sorted list of numbers
+    :param pct:  percentile, 0-100
+    """
+
+    if not values:
+        return 0.0
+
+    rank = int(math.ceil(pct / 100.0 * len(values)))
+    rank = max(1, min(rank, len(values)))
+
+    return values[rank - 1]
+
+
+class ApiStats:
+
+    def __init__(self):
+
+        """
+        Collects per service/operation call statistics from botocore events
+
+        Register it on a session before clients are created from that session, clients
+        copy the session event handlers when they are built.
+        """
+
+        self.lock = threading.Lock()
+        self.ops = dict()
+        self.api_time = 0.0
+        self.started = time.monotonic()
+
+    def register(self, session=None):
+        """
+        hook the botocore events on a session
+
+        :param session:  boto3 session, if None the boto3 default session is used
+        :return:  the session
+        """
+
+        if session is None:
+            import boto3
+            if boto3.DEFAULT_SESSION is None:
+                boto3.setup_default_session()
+            session = boto3.DEFAULT_SESSION
+
+        events = session.events
+
+        # unique ids per collector, several collectors can watch the same session
+        uid = 'awscfnctl-stats-{0}-'.format(id(self))
+
+        # register first, so the start time is recorded even when a later
+        # before-call handler short circuits the request
+        events.register_first('before-call', self._before_call, unique_id=uid + 'before-call')
+        events.register('before-send', self._before_send, unique_id=uid + 'before-send')
+        events.register('response-received', self._response_received, unique_id=uid + 'response-received')
+        events.register('needs-retry', self._needs_retry, unique_id=uid + 'needs-retry')
+        events.register('after-call', self._after_call, unique_id=uid + 'after-call')
+        events.register('after-call-error', self._after_call_error, unique_id=uid + 'after-call-error')
+
+        return session
+
+    def _op(self, service, operation):
+
+        key = (service, operation)
+
+        try:
+            return self.ops[key]
+        except KeyError:
+            self.ops[key] = {
+                'calls': 0,
+                'coalesced': 0,
+                'errors': 0,
+                'retries': 0,
+                'throttles': 0,
+                'bytes_sent': 0,
+                'bytes_received': 0,
+                'latencies': list(),
+            }
+            return self.ops[key]
+
+    def _before_call(self, event_name, context, **kwargs):
+
+        context['awscfnctl_start'] = time.monotonic()
+
+    def _before_send(self, event_name, request, **kwargs):
+
+        body = request.body
+        if not isinstance(body, (bytes, bytearray, str)):
+            return
+
+        with self.lock:
+            self._op(*event_op(event_name))['bytes_sent'] += len(body)
+
+    def _response_received(self, event_name, response_dict, **kwargs):
+
+        if response_dict is None:
+            return
+
+        body = response_dict.get('body')
+        if not isinstance(body, (bytes, bytearray)):
+            # streaming bodies are left alone so they can still be read by the caller
+            return
+
+        with self.lock:
+            self._op(*event_op(event_name))['bytes_received'] += len(body)
+
+    def _needs_retry(self, event_name, response, request_dict, **kwargs):
+
+        request_dict.get('context', dict())['awscfnctl_retry_checked'] = True
+
+        if response is None:
+            return
+
+        if is_throttle_error(response[1]):
+            with self.lock:
+                self._op(*event_op(event_name))['throttles'] += 1
+
+    def _after_call(self, event_name, parsed, context, **kwargs):
+
+        self._record(event_name, context, parsed=parsed)
+
+    def _after_call_error(self, event_name, context, exception, **kwargs):
+
+        self._record(event_name, context, exception=exception)
+
+    def _record(self, event_name, context, parsed=None, exception=None):
+
+        now = time.monotonic()
+        start = context.get('awscfnctl_start', now)
+
+        with self.lock:
+            op = self._op(*event_op(event_name))
+
+            # answered by an identical call already in flight, see CallCoalescer
+            if context.get('awscfnctl_coalesced'):
+                op['coalesced'] += 1
+                return
+
+            op['calls'] += 1
+            op['latencies'].append(now - start)
+            self.api_time += now - start
+
+        # once per call, however many collectors watch the session
+        if not context.get('awscfnctl_phase_counted'):
+            context['awscfnctl_phase_counted'] = True
+            count_call(now - start)
+
+        with self.lock:
+            if exception is not None:
+                op['errors'] += 1
+                return
+
+            try:
+                op['retries'] += parsed['ResponseMetadata']['RetryAttempts']
+            except (KeyError, TypeError):
+                pass
+
+            if 'Error' in parsed:
+                op['errors'] += 1
+                # responses that never went through the retry handler (stubbed, or
+                # retries disabled) still need their throttle counted
+                if is_throttle_error(parsed) and not context.get('awscfnctl_retry_checked'):
+                    op['throttles'] += 1
+
+    def summary(self):
+        """
+        returns a dictionary, keyed by (service, operation), of call statistics
+
+          calls, coalesced, errors, retries, throttles, bytes_sent, bytes_received,
+          p50, p90, p99, max, total  (latencies in seconds)
+        """
+
+        summary = dict()
+
+        with self.lock:
+            for key, op in self.ops.items():
+                latencies = sorted(op['latencies'])
+                summary[key] = {
+                    'calls': op['calls'],
+                    'coalesced': op['coalesced'],
+                    'errors': op['errors'],
+                    'retries': op['retries'],
+                    'throttles': op['throttles'],
+                    'bytes_sent': op['bytes_sent'],
+                    'bytes_received': op['bytes_received'],
+                    'p50': percentile(latencies, 50),
+                    'p90': percentile(latencies, 90),
+                    'p99': percentile(latencies, 99),
+                    'max': latencies[-1] if latencies else 0.0,
+                    'total': sum(latencies),
+                }
+
+        return summary
+
+    def total_calls(self):
+
+        with self.lock:
+            return sum(op['calls'] for op in self.ops.values())
+
+    def total_time(self):
+        """
+        returns the seconds spent in API calls, summed over all calls
+        """
+
+        with self.lock:
+            return self.api_time
+
+    def reset(self):
+
+        with self.lock:
+            self.ops = dict()
+            self.api_time = 0.0
+            self.started = time.monotonic()
+
+    def format_table(self):
+        """
+        returns the statistics as a printable table
+        """
+
+        line_fmt = '{0:<16.16} {1:<34.34} {2:>6} {3:>6} {4:>9} {5:>9} {6:>9} {7:>7} {8:>9} {9:>10} {10:>10}'
+
+        lines = list()
+        lines.append(line_fmt.format('Service', 'Operation', 'Calls', 'Errors', 'p50 ms', 'p90 ms', 'p99 ms',
+                                     'Retries', 'Throttles', 'Sent', 'Received'))
+        lines.append(128 * '-')
+
+        totals = dict(calls=0, coalesced=0, errors=0, retries=0, throttles=0, bytes_sent=0, bytes_received=0,
+                      total=0.0)
+
+        for (service, operation), s in sorted(self.summary().items()):
+            lines.append(line_fmt.format(service, operation, s['calls'], s['errors'],
+                                         '{0:.1f}'.format(s['p50'] * 1000),
+                                         '{0:.1f}'.format(s['p90'] * 1000),
+                                         '{0:.1f}'.format(s['p99'] * 1000),
+                                         s['retries'], s['throttles'], s['bytes_sent'], s['bytes_received']))
+            for k in totals:
+                totals[k] += s[k]
+
+        lines.append(128 * '-')
+        lines.append(line_fmt.format('Total', '', totals['calls'], totals['errors'], '', '', '',
+                                     totals['retries'], totals['throttles'],
+                                     totals['bytes_sent'], totals['bytes_received']))
+        lines.append('API time {0:.2f}s, wall time {1:.2f}s'.format(totals['total'],
+                                                                     time.monotonic() - self.started))
+        if totals['coalesced']:
+            lines.append('{0} more calls shared an identical call already in flight'.format(totals['coalesced']))
+
+        return '\n'.join(lines)
+
+    def print_table(self, out=None):
+
+        if out is None:
+            out = sys.stderr
+
+        print('\nAWS API call statistics:', file=out)
+        print(self.format_table(), file=out)
+
+    def print_at_exit(self):
+        """
+        print the table when the interpreter exits, on stderr so command output can still be piped
+        """
+
+        atexit.register(self.print_table)
@@ -15,52 +15,95 @@
 
 import sys
 import argparse
-from awscfnctl import CfnControl
+from awscfnctl.daemon import run_in_daemon
 
 progname = 'asgctl'
 
+# steps of each action, see CfnControl.asg_rolling()
+ACTION_STEPS = {
+    'enter-stby': ['enter-stby'],
+    'stop': ['enter-stby', 'stop'],
+    'start': ['start', 'exit-stby'],
+    'exit-stby': ['exit-stby'],
+    'restart': ['enter-stby', 'stop', 'start', 'exit-stby'],
+}
+
 def arg_parse():
 
     parser = argparse.ArgumentParser(prog=progname,
-                                     description='Control the instances in an ASG',
-                                     epilog='Example:  {} <action> -a <asg_name> -r <region>'.format(progname)
+                                     description='Control the instances in one or more ASGs',
+                                     epilog='Example:  {0} <action> -a <asg_name> -r <region>, or '
+                                            '{0} <action> -n <stack_name> -r <region>'.format(progname)
                                      )
 
     opt_group = parser.add_argument_group('optional arguments')
     opt_group.add_argument('-r', dest='region', required=False, help="Region name")
+    opt_group.add_argument('--stats', dest='stats', required=False, help='Print AWS API call statistics at exit', action='store_true')
+    opt_group.add_argument('--batch-size', dest='batch_size', type=int, required=False,
+                           help='Instances per batch for stop, start and restart (default all of them at once)')
+    opt_group.add_argument('--concurrency', dest='concurrency', type=int, default=1, required=False,
+                           help='Batches running at the same time, in each ASG (default 1)')
+    opt_group.add_argument('--max-unavailable', dest='max_unavailable', type=int, required=False,
+                           help='Most instances out of service at once, in each ASG '
+                                '(default batch size * concurrency)')
 
     req_group = parser.add_argument_group('required arguments')
     req_group.add_argument('action', help='Action to take: '
-                                          'status, enter-stby, exit-stby, stop, start (stop will enter standby first, '
-                                          'and start will exit standby after start is complete')
-    req_group.add_argument('-a', dest='asg', required=True)
+                                          'status, enter-stby, exit-stby, stop, start, restart (stop will enter standby '
+                                          'first, start will exit standby after start is complete, and restart does a '
+                                          'stop and start of each batch)')
+
+    asg_group = parser.add_argument_group('ASGs (at least one of)')
+    asg_group.add_argument('-a', dest='asg', action='append', required=False,
+                           help='ASG name, repeat for more than one')
+    asg_group.add_argument('-n', dest='stack_name', required=False, help='Stack name, all of the ASGs in the stack')
+
+    args = parser.parse_args()
 
-    return parser.parse_args()
+    if not args.asg and not args.stack_name:
+        parser.error('an ASG (-a) or a stack (-n) is required')
+
+    return args
 
 
 def main():
 
+    # run by the daemon, if AWSCFNCTL_DAEMON is set and it is running
+    rc = run_in_daemon(progname)
+    if rc is not None:
+        return rc
+
     args = arg_parse()
 
+    from awscfnctl import CfnControl
+
     region = args.region
-    asg = args.asg
+    asg = list(args.asg or list())
     action = args.action
 
-    i = CfnControl(region=region, asg=asg)
-
-    if action == 'enter-stby':
-        i.asg_enter_standby()
-    elif action == 'stop':
-        i.asg_enter_standby()
-        i.stop_instances()
-    elif action == 'start':
-        i.start_instances()
-        i.asg_exit_standby()
-    elif action == 'exit-stby':
-        i.asg_exit_standby()
+    i = CfnControl(region=region)
+
+    if args.stats:
+        i.api_stats.print_at_exit()
+
+    # keep the shell completion index of this region fresh
+    i.schedule_completion_refresh()
+
+    if args.stack_name:
+        stack_asg = i.get_asg_from_stack(stack_name=args.stack_name)
+        if not stack_asg:
+            raise ValueError('No ASGs found in stack {0}'.format(args.stack_name))
+        asg.extend([a for a in stack_asg if a not in asg])
+
+    i.asg = asg
+
+    if action in ACTION_STEPS:
+        i.asg_multi(ACTION_STEPS[action], batch_size=args.batch_size, concurrency=args.concurrency,
+                    max_unavailable=args.max_unavailable)
     elif action == 'status':
-        i.ck_asg_status()
-        i.ck_inst_status()
+        i.asg_status()
+    else:
+        raise ValueError('Unknown action "{0}"'.format(action))
 
 if __name__ == "__main__":
     try:
@@ -69,5 +112,6 @@ if __name__ == "__main__":
         print('\nReceived Keyboard interrupt.')
         print('Exiting...')
     except ValueError as e:
+        # e.g. an ASG that failed in a rolling or multi-ASG run
         print('ERROR: {0}'.format(e))
-
+        sys.exit(1)
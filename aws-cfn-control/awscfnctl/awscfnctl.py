@@ -14,9 +14,11 @@
 
 import os
 import sys
+import copy
 import time
 import json
 import errno
+import threading
 import boto3
 import botocore
 import operator
@@ -26,11 +28,81 @@ import configparser
 from urllib.parse import urlparse
 from botocore.exceptions import ClientError
 from botocore.exceptions import EndpointConnectionError
-from cfn_flip import flip, to_yaml, to_json
+from botocore.config import Config
+from .apistats import ApiStats
+from .ratelimit import shared_rate_limiter
+from .coalesce import CallCoalescer
+from .timing import PhaseTimer
+from .pipeline import chunked
+from .pipeline import TaskPipeline
+from .pipeline import ContextThreadPoolExecutor
+from .stackcache import OutputCache
+from .stackcache import output_cache_path
+from .inventory import record_class
+from .inventory import instance_filters
+from .topology import StackTopology
+from .offline import ACCOUNT_PARAM_TYPES
+from .offline import INVENTORY_TAKEN_KEY
+from .offline import REVALIDATE_KEY
+from .offline import InventorySnapshot
+from .offline import block_api_calls
+from .offline import snapshot_path
+from .completion import schedule_refresh
+from .completion import update_names
+
+
+# the per instance steps asg_rolling() can take, in the order a stop and start goes through them
+ASG_STEPS = ['enter-stby', 'stop', 'start', 'exit-stby']
+
+INSTANCE_STATES = ['pending', 'running', 'shutting-down', 'terminated', 'stopping', 'stopped']
+
+# stack ID -> (last updated time, resource summaries), shared by every CfnControl in the process
+_stack_resources_cache = dict()
+_stack_resources_lock = threading.Lock()
+
+# (profile, AWS_* variables, what) -> (time saved, value), kept for CfnControl.warm_cache_ttl seconds
+# by every CfnControl in the process: the credential check, key pairs and S3 templates
+_warm_cache = dict()
+_warm_cache_lock = threading.Lock()
+
+
+def iter_stack_summaries(client_cfn, show_deleted=False):
+    """
+    yields a dictionary per stack from a CloudFormation client, as the list_stacks pages arrive,
+    see CfnControl.iter_stacks()
+    """
+
+    paginator = client_cfn.get_paginator('list_stacks')
+
+    for page in paginator.paginate():
+        for r in page['StackSummaries']:
+            if r['StackStatus'] == "DELETE_COMPLETE" and not show_deleted:
+                continue
+            yield {
+                'StackName': r['StackName'],
+                'StackId': r['StackId'],
+                'StackStatus': r['StackStatus'],
+                'CreationTime': r['CreationTime'],
+                'LastUpdatedTime': r.get('LastUpdatedTime'),
+                'TemplateDescription': r.get('TemplateDescription'),
+            }
 
 
 class CfnControl:
 
+    # Callable taking profile_name and returning a boto3 session.  Benchmarks and tests set this
+    # to run the commands against stubbed AWS responses, None uses boto3.session.Session
+    session_factory = None
+
+    # Seconds that later CfnControls in the same process reuse the credential check and the key
+    # pairs of an earlier one, and S3 templates (revalidated by ETag).  0 keeps nothing, the daemon
+    # sets it since it runs one command after another
+    warm_cache_ttl = 0
+
+    # False stops the background refresh of the shell completion index after a command, set
+    # while the commands run against a fake or recorded AWS (FakeAws.installed(), cassettes)
+    completion_refresh = True
+
     def __init__(self, **kwords):
 
         """
@@ -52,11 +124,40 @@ class CfnControl:
 
             instances:     list() of instances
 
-            cfn_action:    Action:  build|create|list|delete
+            cfn_action:    Action:  build|create|list|delete|snapshot
+
+            api_stats:     ApiStats() to collect AWS API call statistics in,
+                             one is created if this is not given
+
+            rate_limiter:  RateLimiter() shared by all clients, if this is not
+                             given the process wide rate limiter is used
+
+            rate_limits:   dict() of "<service>[.<Operation>]" -> requests per
+                             second, e.g. {'cloudformation.DescribeStacks': 2}
+
+            session:       boto3 session to use instead of creating one
+
+            coalescer:     CallCoalescer() the clients share identical concurrent
+                             read calls through, one is created if not given
+
+            max_workers:   threads used for per-instance work, default 16
+
+            quiet:         don't print the profile and region in use, for
+                             machine readable output
+
+            offline:       build parameters files from the inventory snapshot
+                             saved by "cfnctl snapshot", no AWS calls are made
+
+            stack_outputs: get_stack_output() returns the stack outputs, which
+                             also sets the stack's ElasticIP output on an instance
+                             after create, default False (an empty dictionary)
 
         """
 
         self.cfn_action = kwords.get('cfn_action')
+        self.quiet = kwords.get('quiet', False)
+        self.offline = kwords.get('offline', False)
+        self.stack_outputs = kwords.get('stack_outputs', False)
 
         self.aws_profile = kwords.get('aws_profile')
         if not self.aws_profile:
@@ -64,9 +165,41 @@ class CfnControl:
         elif self.aws_profile == None:
             self.aws_profile = 'default'
 
-        print('Using AWS credentials profile "{0}"'.format(self.aws_profile))
+        if not self.quiet:
+            print('Using AWS credentials profile "{0}"'.format(self.aws_profile))
+
+        self.session = kwords.get('session')
+        if self.session is None:
+            if CfnControl.session_factory is not None:
+                self.session = CfnControl.session_factory(profile_name=self.aws_profile)
+            else:
+                self.session = boto3.session.Session(profile_name=self.aws_profile)
+
+        # API call statistics, hooked before any clients are created from the session
+        self.api_stats = kwords.get('api_stats')
+        if self.api_stats is None:
+            self.api_stats = ApiStats()
+        self.api_stats.register(self.session)
+
+        # Client side rate limiting, shared by every client created through CfnControl.  Clients use
+        # the botocore standard retry mode, the shared buckets slow everyone down when throttled
+        self.rate_limiter = kwords.get('rate_limiter')
+        if self.rate_limiter is None:
+            self.rate_limiter = shared_rate_limiter()
+        for name, rate in (kwords.get('rate_limits') or dict()).items():
+            self.rate_limiter.configure(name, rate)
+
+        # Identical describe/list calls made by several threads at once go out as one call
+        self.coalescer = kwords.get('coalescer')
+        if self.coalescer is None:
+            self.coalescer = CallCoalescer()
+
+        # Per-instance work (attribute changes, ENIs) runs on this many threads, each needs a connection
+        self.max_workers = kwords.get('max_workers') or 16
+        self.client_config = Config(retries={'max_attempts': 10, 'mode': 'standard'},
+                                    max_pool_connections=max(10, self.max_workers))
+        self.print_lock = threading.Lock()
 
-        self.session = boto3.session.Session(profile_name=self.aws_profile)
         self.region = kwords.get('region')
 
         if not self.region and not self.session.region_name:
@@ -76,26 +209,35 @@ class CfnControl:
         if not self.region:
             self.region = self.session.region_name
 
-        print("Looks like we're in {0}".format(self.region))
+        if not self.quiet:
+            print("Looks like we're in {0}".format(self.region))
+
+        # nothing may go out, whatever asks for it
+        if self.offline:
+            block_api_calls(self.session)
 
         # boto resources
-        self.s3 = self.session.resource('s3')
-        self.ec2 = self.session.resource('ec2', region_name=self.region)
+        self.s3 = self.new_resource('s3')
+        self.ec2 = self.new_resource('ec2')
 
-        # test api connection
+        # test api connection, skipped when an earlier CfnControl of the process did (see
+        # warm_cache_ttl) and the credentials are still there
         try:
-            for bucket in self.s3.buckets.all():
-                pass
+            warm = self.warm_get('credentials') and self.session.get_credentials() is not None
+            if not self.offline and not warm:
+                for bucket in self.s3.buckets.all():
+                    pass
+                self.warm_put(True, 'credentials')
         except botocore.exceptions.NoCredentialsError as e:
             print(e, '"' + self.aws_profile + '", exiting...')
             sys.exit(1) 
              
 
         # boto clients
-        self.client_ec2 = self.session.client('ec2', region_name=self.region)
-        self.client_asg = self.session.client('autoscaling', region_name=self.region)
-        self.client_cfn = self.session.client('cloudformation', region_name=self.region)
-        self.client_s3  = self.session.client('s3', region_name=self.region)
+        self.client_ec2 = self.new_client('ec2')
+        self.client_asg = self.new_client('autoscaling')
+        self.client_cfn = self.new_client('cloudformation')
+        self.client_s3  = self.new_client('s3')
 
         # grab passed arguments
         self.asg = kwords.get('asg')
@@ -131,6 +273,18 @@ class CfnControl:
         self.cfn_param_base_dir = ".cfnparam"
         self.cfn_param_file_dir = os.path.join(self.homedir, self.cfn_param_base_dir)
 
+        # describe_stacks results of this run, by stack name, see describe_stack()
+        self.stack_memo = dict()
+        self.stack_memo_lock = threading.Lock()
+        self.output_cache = OutputCache(output_cache_path(self.cfn_param_file_dir, self.aws_profile))
+
+        # key pairs, VPCs, subnets, security groups and S3 templates saved by "cfnctl snapshot", used offline
+        self.inventory = None
+        if self.offline:
+            self.inventory = InventorySnapshot(snapshot_path(self.cfn_param_file_dir, self.aws_profile,
+                                                             self.region)).load()
+            print('Offline, using the inventory of {0} saved {1}'.format(self.region, self.inventory.taken))
+
         ## For future release
         ## Check for global defaults file
         ##
@@ -152,9 +306,15 @@ class CfnControl:
         # First API call - grab key pairs, this will determine if we can talk to the API
         #
         try:
-            key_pairs_response = self.client_ec2.describe_key_pairs()
-            for pair in (key_pairs_response['KeyPairs']):
-                self.key_pairs.append(pair['KeyName'])
+            if self.inventory is not None:
+                self.key_pairs = self.inventory.key_pairs()
+            elif self.warm_get('key_pairs', self.region) is not None:
+                self.key_pairs = list(self.warm_get('key_pairs', self.region))
+            else:
+                key_pairs_response = self.client_ec2.describe_key_pairs()
+                for pair in (key_pairs_response['KeyPairs']):
+                    self.key_pairs.append(pair['KeyName'])
+                self.warm_put(list(self.key_pairs), 'key_pairs', self.region)
         except EndpointConnectionError as e:
             errmsg = "Please make sure that the region specified ({0}) is valid\n".format(self.region)
             raise ValueError(errmsg + str(e))
@@ -181,14 +341,12 @@ class CfnControl:
         # If the `asg` keyword was passed, then build an instance list from the ASG
         #
         if self.asg:
-            response = self.client_asg.describe_auto_scaling_groups(AutoScalingGroupNames=[self.asg])
-
-            print('Gathering instances from ASG {0}'.format(self.asg))
+            if isinstance(self.asg, list):
+                print('Gathering instances from ASGs {0}'.format(', '.join(self.asg)))
+            else:
+                print('Gathering instances from ASG {0}'.format(self.asg))
 
-            # Build instance IDs list
-            for r in response['AutoScalingGroups']:
-                for i in r['Instances']:
-                    self.instances.append(self.ec2.Instance(i['InstanceId']).instance_id)
+            self.instances.extend(self.get_asg_lifecycle(self.asg))
 
             if not self.instances:
                 print("Instance list is null, continuing...")
@@ -220,6 +378,101 @@ class CfnControl:
 
         return log, proc.returncode
 
+    def warm_key(self, *what):
+
+        env = tuple(sorted((k, v) for k, v in os.environ.items() if k.startswith('AWS')))
+
+        return (self.aws_profile, env) + what
+
+    def warm_get(self, *what):
+        """
+        returns what an earlier CfnControl of the process saved with warm_put() less than
+        warm_cache_ttl seconds ago, None if nothing
+        """
+
+        if not CfnControl.warm_cache_ttl:
+            return None
+
+        with _warm_cache_lock:
+            entry = _warm_cache.get(self.warm_key(*what))
+
+        if entry is None or time.monotonic() - entry[0] > CfnControl.warm_cache_ttl:
+            return None
+
+        return entry[1]
+
+    def warm_put(self, value, *what):
+
+        if CfnControl.warm_cache_ttl:
+            with _warm_cache_lock:
+                _warm_cache[self.warm_key(*what)] = (time.monotonic(), value)
+
+    def new_client(self, service_name, region_name=None):
+        """
+        creates a boto client with the shared retry config, rate limiter and call coalescer
+
+        :param service_name:  e.g. cloudformation
+        :param region_name:  defaults to the CfnControl region
+        :return:  boto client
+        """
+
+        if region_name is None:
+            region_name = self.region
+
+        client = self.session.client(service_name, region_name=region_name, config=self.client_config)
+        self.coalescer.register(client)
+
+        return self.rate_limiter.register(client)
+
+    def new_resource(self, service_name, region_name=None):
+        """
+        creates a boto resource, rate limited the same as new_client()
+        """
+
+        if region_name is None:
+            region_name = self.region
+
+        resource = self.session.resource(service_name, region_name=region_name, config=self.client_config)
+        self.coalescer.register(resource.meta.client)
+        self.rate_limiter.register(resource.meta.client)
+
+        return resource
+
+    def schedule_completion_refresh(self):
+        """
+        refresh the shell completion index of this region when the command ends, if it is older than
+        completion.DEFAULT_MAX_AGE.  Called by the commands, not when offline or completion_refresh
+        is turned off (e.g. a fake AWS)
+        """
+
+        if not self.offline and CfnControl.completion_refresh:
+            schedule_refresh(self.cfn_param_file_dir, self.aws_profile, self.region)
+
+    def for_region(self, region):
+        """
+        returns a copy of this CfnControl working in another region.  It shares the session, API
+        statistics and rate limiter, and only makes new EC2, Auto Scaling and CloudFormation
+        clients, so no API calls are made.  Make the copies before handing them to other threads.
+
+        :param region:  region name
+        """
+
+        regional = copy.copy(self)
+        regional.region = region
+        regional.ec2 = self.new_resource('ec2', region_name=region)
+        regional.client_ec2 = self.new_client('ec2', region_name=region)
+        regional.client_asg = self.new_client('autoscaling', region_name=region)
+        regional.client_cfn = self.new_client('cloudformation', region_name=region)
+        regional.print_lock = self.print_lock
+
+        return regional
+
+    def get_api_stats(self):
+        """
+        returns dictionary of AWS API call statistics, keyed by (service, operation)
+        """
+        return self.api_stats.summary()
+
     def instanace_list(self):
         """
         returns list() of instance IDs
@@ -247,30 +500,138 @@ class CfnControl:
         l = s.split("\n")
         return l
 
+    def describe_stack(self, stack_name=None):
+        """
+        returns the describe_stacks description of a stack, described once per CfnControl until
+        invalidate_stack() is called for it.  Anything that changes the stack has to call
+        invalidate_stack().  Raises ClientError if the stack doesn't exist, that isn't remembered.
+
+        :param stack_name:  stack name or ID
+        """
+
+        if stack_name is None:
+            stack_name = self.stack_name
+
+        with self.stack_memo_lock:
+            stack = self.stack_memo.get(stack_name)
+        if stack is not None:
+            return stack
+
+        stack = self.client_cfn.describe_stacks(StackName=stack_name)['Stacks'][0]
+
+        # a stack that is still changing is described again next time
+        if not stack['StackStatus'].endswith('_IN_PROGRESS'):
+            with self.stack_memo_lock:
+                self.stack_memo[stack_name] = stack
+                self.stack_memo[stack['StackId']] = stack
+        self.output_cache.put(self.region, stack)
+
+        return stack
+
+    def invalidate_stack(self, stack_name=None):
+        """
+        forget what describe_stack() returned for a stack, or for every stack if stack_name is None
+        """
+
+        with self.stack_memo_lock:
+            if stack_name is None:
+                self.stack_memo.clear()
+                return
+            stack = self.stack_memo.pop(stack_name, None)
+            if stack is not None:
+                self.stack_memo.pop(stack['StackId'], None)
+                self.stack_memo.pop(stack['StackName'], None)
+
+        # e.g. a stack that was deleted and created again, its saved outputs are from the old one
+        self.output_cache.forget(self.region, stack_name)
+
     def get_asg_from_stack(self, stack_name=None):
 
-        # returns a list of ASG names for a given stack
+        # returns a list of ASG names for a given stack, including its nested stacks
+
+        self.asg = [r['PhysicalResourceId'] for r in
+                    self.get_stack_resources(stack_name).get('AWS::AutoScaling::AutoScalingGroup', list())]
+
+        return self.asg
 
-        self.asg = list()
+    def list_stack_resources(self, stack_id, last_updated=None):
+        """
+        returns list() of the resource summaries of one stack, not including its nested stacks
+
+        :param stack_id:  stack ID (or name)
+        :param last_updated:  when the stack last changed, if given the resources are cached
+                              until it changes again
+        """
+
+        if last_updated is not None:
+            with _stack_resources_lock:
+                cached = _stack_resources_cache.get(stack_id)
+            if cached and cached[0] == last_updated:
+                return cached[1]
+
+        resources = list()
+
+        try:
+            paginator = self.client_cfn.get_paginator('list_stack_resources')
+            for page in paginator.paginate(StackName=stack_id):
+                resources.extend(page['StackResourceSummaries'])
+        except ClientError as e:
+            raise ValueError(e)
+
+        if last_updated is not None:
+            with _stack_resources_lock:
+                _stack_resources_cache[stack_id] = (last_updated, resources)
+
+        return resources
+
+    def get_stack_resources(self, stack_name=None):
+        """
+        Returns the resources of a stack and of all of its nested stacks, as a dictionary of
+        resource type -> list() of resource summaries, each with the StackId it belongs to.  The
+        nested stacks of each level are listed at the same time.
+
+        Stacks that aren't being changed are cached by stack ID and last updated time, looking up
+        the same stack again only takes the describe_stacks call, and none within one run.
+        """
 
         if stack_name is None:
             stack_name = self.stack_name
 
-        # Debug
-        # print('Getting ASG name(s) from stack {0} (returns a list)'.format(stack_name))
-
         try:
-            stk_response = self.client_cfn.describe_stack_resources(StackName=stack_name)
+            stack = self.describe_stack(stack_name)
         except ClientError as e:
             raise ValueError(e)
 
-        for resp in stk_response['StackResources']:
-            for resrc_type in resp:
-                if resrc_type == "ResourceType":
-                    if resp[resrc_type] == "AWS::AutoScaling::AutoScalingGroup":
-                        self.asg.append(resp['PhysicalResourceId'])
+        last_updated = stack.get('LastUpdatedTime', stack['CreationTime'])
+        if stack['StackStatus'].endswith('_IN_PROGRESS'):
+            last_updated = None
 
-        return self.asg
+        index = dict()
+        level = [(stack['StackId'], last_updated)]
+        seen = set([stack['StackId']])
+
+        while level:
+            with ContextThreadPoolExecutor(max_workers=min(self.max_workers, len(level))) as pool:
+                listed = list(pool.map(lambda s: self.list_stack_resources(*s), level))
+
+            nested = list()
+            for (stack_id, updated), resources in zip(level, listed):
+                for r in resources:
+                    r = dict(r, StackId=stack_id)
+                    index.setdefault(r['ResourceType'], list()).append(r)
+
+                    child_id = r.get('PhysicalResourceId')
+                    if r['ResourceType'] == 'AWS::CloudFormation::Stack' and child_id and child_id not in seen \
+                            and not r['ResourceStatus'].startswith('DELETE'):
+                        seen.add(child_id)
+                        # a nested stack's resource is updated whenever the stack itself is
+                        child_updated = r['LastUpdatedTimestamp'] if r['ResourceStatus'].endswith('_COMPLETE') \
+                            else None
+                        nested.append((child_id, child_updated))
+
+            level = nested
+
+        return index
 
     def get_inst_from_asg(self, asg=None):
 
@@ -280,16 +641,7 @@ class CfnControl:
         # Debug
         # print('Getting ASG instances from {0}'.format(asg))
 
-        if type(asg) is list:
-            response = self.client_asg.describe_auto_scaling_groups(AutoScalingGroupNames=asg)
-        else:
-            response = self.client_asg.describe_auto_scaling_groups(AutoScalingGroupNames=[asg])
-
-        self.instances = list()
-        # Build instance IDs list
-        for r in response['AutoScalingGroups']:
-            for i in r['Instances']:
-                self.instances.append(self.ec2.Instance(i['InstanceId']).instance_id)
+        self.instances = list(self.get_asg_lifecycle(asg))
 
         return self.instances
 
@@ -367,6 +719,421 @@ class CfnControl:
 
         return response
 
+    def print_line(self, line):
+        """
+        print from a worker thread, without the lines of other threads running in to it
+        """
+
+        with self.print_lock:
+            print(line)
+
+    def map_instances(self, func, instances):
+        """
+        calls func(instance_id) for each instance, max_workers at a time
+
+        :return:  list() of the results, in the order of instances
+        """
+
+        if not instances:
+            return list()
+
+        with ContextThreadPoolExecutor(max_workers=min(self.max_workers, len(instances))) as pool:
+            return list(pool.map(func, instances))
+
+    def get_asg_lifecycle(self, asg=None):
+        """
+        returns dictionary of instance ID -> (ASG name, LifecycleState)
+
+        :param asg:  ASG name or list of ASG names, defaults to self.asg
+        """
+
+        if asg is None:
+            asg = self.asg
+        if not isinstance(asg, list):
+            asg = [asg]
+
+        lifecycle = dict()
+
+        for r in self.describe_asgs(asg):
+            for i in r['Instances']:
+                lifecycle[i['InstanceId']] = (r['AutoScalingGroupName'], i['LifecycleState'])
+
+        return lifecycle
+
+    def describe_asgs(self, asg=None):
+        """
+        returns list() of the AutoScalingGroups from describe_auto_scaling_groups, ASGs that don't exist are left out
+
+        :param asg:  ASG name or list of ASG names, defaults to self.asg
+        """
+
+        if asg is None:
+            asg = self.asg
+        if not isinstance(asg, list):
+            asg = [asg]
+
+        groups = list()
+
+        paginator = self.client_asg.get_paginator('describe_auto_scaling_groups')
+        for names in chunked(asg, 50):
+            for page in paginator.paginate(AutoScalingGroupNames=names):
+                groups.extend(page['AutoScalingGroups'])
+
+        return groups
+
+    def poll_until(self, get_waiting, what, timeout):
+        """
+        calls get_waiting() with a growing delay until it returns an empty list
+
+        :param get_waiting:  returns the list() of IDs that aren't ready yet
+        :param what:  what the IDs are waiting for, for the timeout error
+        :param timeout:  seconds, raises ValueError when they are not ready by then
+        """
+
+        delay = 2
+        waited = 0
+
+        while True:
+            waiting = get_waiting()
+            if not waiting:
+                return
+            if waited >= timeout:
+                errmsg = '{0} instances not {1} after {2} seconds, e.g. {3}'.format(
+                    len(waiting), what, timeout, waiting[0])
+                raise ValueError(errmsg)
+            time.sleep(delay)
+            waited += delay
+            delay = min(delay * 2, 15)
+
+    def wait_for_asg_lifecycle(self, instances, lifecycle_state, asg=None, timeout=600):
+        """
+        polls the ASG until all of the instances are in lifecycle_state, e.g. Standby or InService
+        """
+
+        def get_waiting():
+            lifecycle = self.get_asg_lifecycle(asg)
+            return [i for i in instances if lifecycle.get(i, (None, None))[1] != lifecycle_state]
+
+        self.poll_until(get_waiting, lifecycle_state, timeout)
+
+    def wait_for_instance_state(self, instances, state, timeout=900):
+        """
+        polls describe_instances until all of the instances are in state, e.g. running or stopped
+        """
+
+        def get_waiting():
+            return [i for i, i_state in self.get_instance_states(instances).items() if i_state != state]
+
+        self.poll_until(get_waiting, state, timeout)
+
+    def wait_for_instance_status_ok(self, instances, timeout=900):
+        """
+        polls describe_instance_status until the instance and system status checks of all of the
+        instances pass, by then they have finished booting, one call per 100 instances
+        """
+
+        def get_waiting():
+            ok = set()
+            for ids in chunked(instances, 100):
+                response = self.client_ec2.describe_instance_status(InstanceIds=ids)
+                for i in response['InstanceStatuses']:
+                    if i['InstanceStatus']['Status'] == 'ok' and i['SystemStatus']['Status'] == 'ok':
+                        ok.add(i['InstanceId'])
+            return [i for i in instances if i not in ok]
+
+        self.poll_until(get_waiting, 'status ok', timeout)
+
+    def get_instance_states(self, instances):
+        """
+        returns dictionary of instance ID -> state name, e.g. running, one call per 1000 instances
+        """
+
+        states = dict()
+
+        for ids in chunked(instances, 1000):
+            response = self.client_ec2.describe_instances(InstanceIds=ids)
+            for r in response['Reservations']:
+                for i in r['Instances']:
+                    states[i['InstanceId']] = i['State']['Name']
+
+        return states
+
+    def set_asg_standby(self, instances, standby=True, asg=None):
+        """
+        moves instances in to (or out of) ASG standby, and waits until they get there
+
+        :param instances:  list() of instance IDs, in any of the ASGs
+        :param standby:  True to enter standby, False to exit
+        :param asg:  ASG name or list of ASG names, defaults to self.asg
+        """
+
+        lifecycle = self.get_asg_lifecycle(asg)
+
+        by_asg = dict()
+        for i in instances:
+            try:
+                by_asg.setdefault(lifecycle[i][0], list()).append(i)
+            except KeyError:
+                errmsg = 'Instance {0} is not in ASG {1}'.format(i, asg or self.asg)
+                raise ValueError(errmsg)
+
+        if standby:
+            self.print_line("Setting {0} instances to ASG standby".format(len(instances)))
+        else:
+            self.print_line("{0} instances are exiting from ASG standby".format(len(instances)))
+
+        # EnterStandby and ExitStandby take at most 20 instances
+        for asg_name, asg_instances in by_asg.items():
+            for ids in chunked(asg_instances, 20):
+                if standby:
+                    self.client_asg.enter_standby(InstanceIds=ids, AutoScalingGroupName=asg_name,
+                                                  ShouldDecrementDesiredCapacity=True)
+                else:
+                    self.client_asg.exit_standby(InstanceIds=ids, AutoScalingGroupName=asg_name)
+
+        self.wait_for_asg_lifecycle(instances, 'Standby' if standby else 'InService', asg=list(by_asg))
+
+    def set_instances_state(self, instances, running=True):
+        """
+        starts (or stops) instances, and waits until they are running (or stopped)
+        """
+
+        if running:
+            self.print_line("Starting {0} instances".format(len(instances)))
+        else:
+            self.print_line("Stopping {0} instances".format(len(instances)))
+
+        for ids in chunked(instances, 1000):
+            if running:
+                self.client_ec2.start_instances(InstanceIds=ids, DryRun=False)
+            else:
+                self.client_ec2.stop_instances(InstanceIds=ids, DryRun=False)
+
+        self.wait_for_instance_state(instances, 'running' if running else 'stopped')
+
+    def asg_batch(self, steps, batch, asg=None):
+        """
+        runs the steps on one batch of ASG instances, each step waits for the instances to get
+        there before the next one starts.  Instances that are already there are left alone, so a
+        step can be run again after a failure.
+
+        :param steps:  list() of ASG_STEPS, in order
+        :param batch:  list() of instance IDs
+        :param asg:  ASG name or list of ASG names the instances are in, defaults to self.asg
+        """
+
+        for step in steps:
+            if step in ('enter-stby', 'exit-stby'):
+                lifecycle = self.get_asg_lifecycle(asg)
+                from_state = 'InService' if step == 'enter-stby' else 'Standby'
+                todo = [i for i in batch if lifecycle.get(i, (None, None))[1] == from_state]
+                if todo:
+                    self.set_asg_standby(todo, standby=(step == 'enter-stby'), asg=asg)
+                continue
+
+            states = self.get_instance_states(batch)
+            stopping = [i for i in batch if states.get(i) == 'stopping']
+
+            if step == 'stop':
+                todo = [i for i in batch if states.get(i) in ('pending', 'running')]
+                if todo:
+                    self.set_instances_state(todo, running=False)
+                if stopping:
+                    self.wait_for_instance_state(stopping, 'stopped')
+            else:
+                if stopping:
+                    self.wait_for_instance_state(stopping, 'stopped')
+                todo = [i for i in batch if states.get(i) in ('stopped', 'stopping')]
+                pending = [i for i in batch if states.get(i) == 'pending']
+                if todo:
+                    self.set_instances_state(todo, running=True)
+                if pending:
+                    self.wait_for_instance_state(pending, 'running')
+
+    def asg_rolling(self, steps, instances=None, batch_size=None, concurrency=1, max_unavailable=None, asg=None):
+        """
+        Runs the steps on the ASG instances batch by batch.  A batch starts once a worker is free
+        and the instances out of service would stay within max_unavailable.  After a failed batch
+        no new batches are started.
+
+        :param steps:  list() of ASG_STEPS, e.g. ['enter-stby', 'stop']
+        :param instances:  list() of instance IDs, defaults to self.instances
+        :param batch_size:  instances per batch, defaults to all of them in one batch
+        :param concurrency:  batches running at the same time
+        :param max_unavailable:  instances in running batches at any time, defaults to batch_size * concurrency
+        :param asg:  ASG name or list of ASG names the instances are in, defaults to self.asg
+        :return:  number of batches
+        """
+
+        for step in steps:
+            if step not in ASG_STEPS:
+                errmsg = 'Unknown ASG step "{0}", choose from {1}'.format(step, ', '.join(ASG_STEPS))
+                raise ValueError(errmsg)
+
+        if instances is None:
+            instances = self.instances
+
+        if not instances:
+            print("Instance list is null, exiting")
+            return 0
+
+        if not batch_size:
+            batch_size = len(instances)
+        if not concurrency or concurrency < 1:
+            concurrency = 1
+        if not max_unavailable:
+            max_unavailable = batch_size * concurrency
+
+        if batch_size > max_unavailable:
+            errmsg = 'Batch size {0} is larger than max unavailable {1}'.format(batch_size, max_unavailable)
+            raise ValueError(errmsg)
+
+        batches = chunked(instances, batch_size)
+        label = '{0}: '.format(asg) if asg and not isinstance(asg, list) else ''
+        cond = threading.Condition()
+        state = {'unavailable': 0, 'failed': list(), 'skipped': 0}
+
+        def run_batch(n, batch):
+            with cond:
+                while state['unavailable'] + len(batch) > max_unavailable and not state['failed']:
+                    cond.wait()
+                if state['failed']:
+                    state['skipped'] += 1
+                    return
+                state['unavailable'] += len(batch)
+
+            self.print_line("{0}Batch {1}/{2}: {3} instances".format(label, n, len(batches), len(batch)))
+            try:
+                self.asg_batch(steps, batch, asg=asg)
+                self.print_line("{0}Batch {1}/{2} done".format(label, n, len(batches)))
+            except Exception as e:
+                with cond:
+                    state['failed'].append('batch {0}: {1}'.format(n, e))
+            finally:
+                with cond:
+                    state['unavailable'] -= len(batch)
+                    cond.notify_all()
+
+        with ContextThreadPoolExecutor(max_workers=concurrency) as pool:
+            for f in [pool.submit(run_batch, n + 1, b) for n, b in enumerate(batches)]:
+                f.result()
+
+        if state['failed']:
+            errmsg = '; '.join(state['failed'])
+            if state['skipped']:
+                errmsg += '; {0} batches not started'.format(state['skipped'])
+            raise ValueError(errmsg)
+
+        return len(batches)
+
+    def asg_multi(self, steps, asg=None, batch_size=None, concurrency=1, max_unavailable=None):
+        """
+        Runs asg_rolling() on each ASG at the same time, batch size, concurrency and max unavailable
+        apply to each ASG on its own.  Prints one report for all of them at the end, and raises
+        ValueError if any of them failed.
+
+        :param asg:  list of ASG names, defaults to self.asg
+        :return:  list() of dictionaries, one per ASG: asg, instances, batches, seconds, error
+        """
+
+        if asg is None:
+            asg = self.asg
+        if not isinstance(asg, list):
+            asg = [asg]
+
+        by_asg = dict()
+        for r in self.describe_asgs(asg):
+            by_asg[r['AutoScalingGroupName']] = [i['InstanceId'] for i in r['Instances']]
+
+        def run(asg_name):
+            if asg_name not in by_asg:
+                return {'asg': asg_name, 'instances': 0, 'batches': 0, 'seconds': 0.0, 'error': 'ASG not found'}
+
+            report = {'asg': asg_name, 'instances': len(by_asg[asg_name]), 'batches': 0, 'seconds': 0.0,
+                      'error': None}
+            start = time.monotonic()
+            try:
+                if by_asg[asg_name]:
+                    report['batches'] = self.asg_rolling(steps, instances=by_asg[asg_name], batch_size=batch_size,
+                                                         concurrency=concurrency, max_unavailable=max_unavailable,
+                                                         asg=asg_name)
+            except Exception as e:
+                report['error'] = str(e)
+            report['seconds'] = time.monotonic() - start
+            return report
+
+        with ContextThreadPoolExecutor(max_workers=min(self.max_workers, len(asg))) as pool:
+            reports = list(pool.map(run, asg))
+
+        line_fmt = '{0:<48} {1:>9} {2:>7} {3:>9}  {4}'
+
+        print("\n{0}:".format(' / '.join(steps)))
+        print(line_fmt.format('ASG', 'Instances', 'Batches', 'Seconds', 'Result'))
+        print(88 * '-')
+        for r in reports:
+            print(line_fmt.format(r['asg'], r['instances'], r['batches'], '{0:.1f}'.format(r['seconds']),
+                                  r['error'] or 'OK'))
+
+        failed = [r['asg'] for r in reports if r['error']]
+        if failed:
+            errmsg = '{0} of {1} ASGs failed: {2}'.format(len(failed), len(reports), ', '.join(failed))
+            raise ValueError(errmsg)
+
+        return reports
+
+    def asg_status(self, asg=None):
+        """
+        Prints the capacity, lifecycle states and instance states of each ASG, with totals
+
+        :param asg:  ASG name or list of ASG names, defaults to self.asg
+        :return:  list() of dictionaries, one per ASG
+        """
+
+        if asg is None:
+            asg = self.asg
+        if not isinstance(asg, list):
+            asg = [asg]
+
+        reports = list()
+        instances = dict()
+
+        for r in self.describe_asgs(asg):
+            report = {'asg': r['AutoScalingGroupName'], 'desired': r['DesiredCapacity'],
+                      'min': r['MinSize'], 'max': r['MaxSize'], 'InService': 0, 'Standby': 0,
+                      'other_lifecycle': 0, 'running': 0, 'stopped': 0, 'other_state': 0}
+            for i in r['Instances']:
+                if i['LifecycleState'] in ('InService', 'Standby'):
+                    report[i['LifecycleState']] += 1
+                else:
+                    report['other_lifecycle'] += 1
+                instances[i['InstanceId']] = report
+            reports.append(report)
+
+        for inst_id, state in self.get_instance_states(list(instances)).items():
+            if state in ('running', 'stopped'):
+                instances[inst_id][state] += 1
+            else:
+                instances[inst_id]['other_state'] += 1
+
+        missing = [a for a in asg if a not in [r['asg'] for r in reports]]
+        for a in missing:
+            print('ASG {0} not found'.format(a))
+
+        keys = ['desired', 'min', 'max', 'InService', 'Standby', 'other_lifecycle', 'running', 'stopped',
+                'other_state']
+        line_fmt = '{0:<48} {1:>7} {2:>5} {3:>5} {4:>9} {5:>7} {6:>6} {7:>7} {8:>7} {9:>6}'
+
+        print(line_fmt.format('ASG', 'Desired', 'Min', 'Max', 'InService', 'Standby', 'Other', 'Running',
+                              'Stopped', 'Other'))
+        print(118 * '-')
+        for r in reports:
+            print(line_fmt.format(r['asg'], *[r[k] for k in keys]))
+        if len(reports) > 1:
+            print(118 * '-')
+            print(line_fmt.format('Total', *[sum(r[k] for r in reports) for k in keys]))
+
+        return reports
+
     def ck_inst_status(self):
 
         response = self.client_ec2.describe_instance_status(InstanceIds=self.instances, IncludeAllInstances=True)
@@ -386,20 +1153,14 @@ class CfnControl:
 
     def ck_asg_inst_status(self, asg=None):
 
-        if asg is None:
-            asg = self.asg
-
-        response = self.client_asg.describe_auto_scaling_groups(AutoScalingGroupNames=[asg])
         in_service = list()
         not_in_service = list()
 
-        # Build instance IDs list
-        for r in response['AutoScalingGroups']:
-            for i in r['Instances']:
-                if self.ec2.Instance(i['LifecycleState']).instance_id == 'InService':
-                    in_service.append(self.ec2.Instance(i['InstanceId']).instance_id)
-                else:
-                    not_in_service.append(self.ec2.Instance(i['InstanceId']).instance_id)
+        for inst_id, (asg_name, lifecycle_state) in self.get_asg_lifecycle(asg).items():
+            if lifecycle_state == 'InService':
+                in_service.append(inst_id)
+            else:
+                not_in_service.append(inst_id)
 
         print("ASG instances status:")
         print(" {0:3d}   InService".format(len(in_service)))
@@ -408,65 +1169,63 @@ class CfnControl:
         return in_service, not_in_service
 
     def enable_ena_vfi(self, instances=None):
+        """
+        Enables ENA and VFI on the instances that don't have VFI yet.  They are taken out of the ASG
+        (standby), stopped, changed and started again, waiting on each step instead of sleeping.
+        """
 
         if instances is None:
-            all_instances = self.instances
-        else:
-            all_instances = instances
-
-        inst_add_ena_vfi = list()
+            instances = self.instances
 
         print("Checking if instances are ENA/VFI enabled")
 
-        for inst_id in all_instances:
-
+        def needs_vfi(inst_id):
             response_vfi = self.client_ec2.describe_instance_attribute(
                 Attribute='sriovNetSupport',
                 InstanceId=inst_id
             )
-
             try:
-                if (response_vfi['SriovNetSupport']['Value']) == 'simple':
-                    pass
+                return response_vfi['SriovNetSupport']['Value'] != 'simple'
             except KeyError:
-                if inst_id not in inst_add_ena_vfi:
-                    inst_add_ena_vfi.append(inst_id)
+                return True
 
-                    # Attribute='enaSupport' is not currently supported
+        # Attribute='enaSupport' is not currently supported
+        inst_add_ena_vfi = [i for i, needed in zip(instances, self.map_instances(needs_vfi, instances)) if needed]
 
         if not inst_add_ena_vfi:
             print("All instances are VFI enabled (Can't check for ENA)")
             return
 
-        print("Enabling ENA and VFI on instances")
+        print("Enabling ENA and VFI on {0} instances".format(len(inst_add_ena_vfi)))
 
-        self.instances = inst_add_ena_vfi
-
-        (inst_in_service, inst_in_standby) = self.ck_asg_inst_status()
+        # only instances that are in service go through standby, and come back
+        inst_in_service = list()
+        if self.asg:
+            lifecycle = self.get_asg_lifecycle()
+            inst_in_service = [i for i in inst_add_ena_vfi if lifecycle.get(i, (None, None))[1] == 'InService']
 
         if inst_in_service:
-            self.asg_enter_standby(inst_in_service)
+            self.set_asg_standby(inst_in_service, standby=True)
 
-        self.stop_instances()
+        self.set_instances_state(inst_add_ena_vfi, running=False)
 
-        response_ec2_vfi = None
-        response_ec2_ena = None
-
-        for inst_id in self.instances:
-            print('Enabling ENA/VFI on ' + inst_id)
+        def modify(inst_id):
             response_ec2_vfi = self.client_ec2.modify_instance_attribute(InstanceId=inst_id,
                                                                          SriovNetSupport={'Value': 'simple'}
                                                                          )
             response_ec2_ena = self.client_ec2.modify_instance_attribute(InstanceId=inst_id,
                                                                          EnaSupport={'Value': True},
                                                                          )
+            return response_ec2_vfi, response_ec2_ena
 
-        self.start_instances()
-        self.asg_exit_standby()
-        if instances is None:
-            self.instances = all_instances
+        responses = self.map_instances(modify, inst_add_ena_vfi)
+
+        self.set_instances_state(inst_add_ena_vfi, running=True)
+
+        if inst_in_service:
+            self.set_asg_standby(inst_in_service, standby=False)
 
-        return response_ec2_vfi, response_ec2_ena
+        return responses[-1]
 
     def get_param_files(self, os_dir):
 
@@ -520,7 +1279,9 @@ class CfnControl:
                               'AddNetInterfaces',
                               'TotalNetInterfaces',
                               'TemplateURL',
-                              'TemplateBody'
+                              'TemplateBody',
+                              REVALIDATE_KEY,
+                              INVENTORY_TAKEN_KEY
                               ]
 
         for section_name in parser.sections():
@@ -543,10 +1304,48 @@ class CfnControl:
 
         return params
 
+    def revalidate_params(self, param_keys):
+        """
+        checks that the key pairs, VPCs, subnets and security groups of a parameters file built
+        offline still exist, one call per resource type.  Raises ValueError naming the ones that don't.
+
+        :param param_keys:  list() of parameter names, the values are those of the parameters file read last
+        """
+
+        values = dict()
+        for p in param_keys:
+            for v in str(self.cfn_param_file_values.get(p, '')).split(','):
+                v = v.strip()
+                if v and v != '<VALUE_NEEDED>':
+                    values[v] = p
+
+        lookups = [
+            ('vpc-', 'vpc-id', self.client_ec2.describe_vpcs, 'Vpcs', 'VpcId'),
+            ('subnet-', 'subnet-id', self.client_ec2.describe_subnets, 'Subnets', 'SubnetId'),
+            ('sg-', 'group-id', self.client_ec2.describe_security_groups, 'SecurityGroups', 'GroupId'),
+        ]
+
+        found = set(v for v in values if v in self.key_pairs)
+        for prefix, filter_name, describe, list_key, id_key in lookups:
+            wanted = [v for v in values if v.startswith(prefix)]
+            if wanted:
+                try:
+                    for r in describe(Filters=[{'Name': filter_name, 'Values': wanted}])[list_key]:
+                        found.add(r[id_key])
+                except ClientError as e:
+                    raise ValueError(e)
+
+        missing = ['{0} = {1}'.format(p, v) for v, p in sorted(values.items()) if v not in found]
+        if missing:
+            errmsg = 'The parameters file was built offline from an inventory saved {0}, these no longer ' \
+                     'exist in {1}: {2}'.format(self.cfn_param_file_values.get(INVENTORY_TAKEN_KEY), self.region,
+                                               ', '.join(missing))
+            raise ValueError(errmsg)
+
     @staticmethod
     def url_check(url):
         try:
-            result = urlparse.urlparse(url)
+            result = urlparse(url)
             return result.scheme and result.netloc and result.path
         except:
             return False
@@ -559,6 +1358,8 @@ class CfnControl:
         2. Build parameters file
         3. Launch Stack
 
+        Each phase is timed, the breakdown is printed at the end and kept in self.cr_stack_timer
+
         :param stack_name:
         :param cfn_param_file:
         :param verbose:
@@ -567,35 +1368,59 @@ class CfnControl:
         :return:
         """
 
+        timer = PhaseTimer(self.api_stats)
+        self.cr_stack_timer = timer
+
+        try:
+            return self.cr_stack_phases(timer, stack_name, cfn_param_file, verbose=verbose,
+                                        set_rollback=set_rollback, template=template)
+        finally:
+            # nothing worth reporting when the stack already existed
+            if 'create_stack' in timer.phases:
+                timer.print_table()
+
+    def cr_stack_phases(self, timer, stack_name, cfn_param_file, verbose=False, set_rollback='ROLLBACK',
+                        template=None):
 
         response = None
 
-        try:
-            stk_response = self.client_cfn.describe_stacks(StackName=stack_name)
-            print('The stack "{0}" exists.  Exiting...'.format(stack_name))
-            sys.exit()
-        except ValueError as e:
-            raise ValueError
-        except ClientError as e:
-            pass
+        with timer.phase('check_exists'):
+            try:
+                self.describe_stack(stack_name)
+                print('The stack "{0}" exists.  Exiting...'.format(stack_name))
+                sys.exit()
+            except ValueError as e:
+                raise ValueError
+            except ClientError as e:
+                pass
 
         if template is not None:
             # check if the template is a URL, or a local file
             if self.url_check(template):
                 self.template_url = template
-                self.validate_cfn_template(template_url=self.template_url)
+                with timer.phase('validate_template'):
+                    self.validate_cfn_template(template_url=self.template_url)
                 if not cfn_param_file:
-                    cfn_param_file = self.build_cfn_param(stack_name, self.template_url, cli_template=template, verbose=verbose)
+                    with timer.phase('build_parameters'):
+                        cfn_param_file = self.build_cfn_param(stack_name, self.template_url, cli_template=template, verbose=verbose)
             else:
                 template_path = os.path.abspath(template)
-                self.validate_cfn_template(template_body=template_path)
+                with timer.phase('validate_template'):
+                    self.validate_cfn_template(template_body=template_path)
                 if not cfn_param_file:
-                    cfn_param_file = self.build_cfn_param(stack_name, template_path, cli_template=template, verbose=verbose)
-                self.template_body = self.parse_cfn_template(template_path)
+                    with timer.phase('build_parameters'):
+                        cfn_param_file = self.build_cfn_param(stack_name, template_path, cli_template=template, verbose=verbose)
+                with timer.phase('read_template'):
+                    self.template_body = self.parse_cfn_template(template_path)
 
-        cfn_params = self.read_cfn_param_file(cfn_param_file)
+        with timer.phase('read_parameters'):
+            cfn_params = self.read_cfn_param_file(cfn_param_file)
         self.cfn_param_file = cfn_param_file
 
+        if cfn_params is not None and self.cfn_param_file_values.get(REVALIDATE_KEY):
+            with timer.phase('revalidate_parameters'):
+                self.revalidate_params(self.cfn_param_file_values[REVALIDATE_KEY].split(','))
+
         print("Attempting to launch {}".format(stack_name))
 
         cfn_param_file_location = None 
@@ -616,119 +1441,147 @@ class CfnControl:
             # set the location of cfnctl_param_file 
             template_tags[1]['Value'] = self.cfn_param_file 
             try:
-                if self.template_url:
-                    response = self.client_cfn.create_stack(
-                        StackName=stack_name,
-                        TemplateURL=self.template_url,
-                        TimeoutInMinutes=600,
-                        Capabilities=['CAPABILITY_IAM'],
-                        OnFailure=set_rollback,
-                        Tags=template_tags
-                    )
-                elif self.template_body:
-                    response = self.client_cfn.create_stack(
-                        StackName=stack_name,
-                        TemplateBody=self.template_body,
-                        TimeoutInMinutes=600,
-                        Capabilities=['CAPABILITY_IAM'],
-                        OnFailure=set_rollback,
-                        Tags=template_tags
-                    )
+                with timer.phase('create_stack'):
+                    if self.template_url:
+                        response = self.client_cfn.create_stack(
+                            StackName=stack_name,
+                            TemplateURL=self.template_url,
+                            TimeoutInMinutes=600,
+                            Capabilities=['CAPABILITY_IAM'],
+                            OnFailure=set_rollback,
+                            Tags=template_tags
+                        )
+                    elif self.template_body:
+                        response = self.client_cfn.create_stack(
+                            StackName=stack_name,
+                            TemplateBody=self.template_body,
+                            TimeoutInMinutes=600,
+                            Capabilities=['CAPABILITY_IAM'],
+                            OnFailure=set_rollback,
+                            Tags=template_tags
+                        )
             except ClientError as e:
                 print(e.response['Error']['Message'])
                 return
 
         else:
             # The parameters file exists
-            try:
-                if self.cfn_param_file_values['TemplateURL']:
-                    self.template_url = self.cfn_param_file_values['TemplateURL']
-                    print("Using template from URL: {}".format(self.template_url))
-            except Exception as e:
-                if "TemplateURL" in str(e):
-                    try:
-                        if self.cfn_param_file_values['TemplateBody']:
-                            self.template_body = self.cfn_param_file_values['TemplateBody']
-                            print("Using template file: {}".format(self.template_body))
-                            self.template_body = self.parse_cfn_template(self.template_body)
-                    except Exception as e:
+            with timer.phase('read_template'):
+                try:
+                    if self.cfn_param_file_values['TemplateURL']:
+                        self.template_url = self.cfn_param_file_values['TemplateURL']
+                        print("Using template from URL: {}".format(self.template_url))
+                except Exception as e:
+                    if "TemplateURL" in str(e):
+                        try:
+                            if self.cfn_param_file_values['TemplateBody']:
+                                self.template_body = self.cfn_param_file_values['TemplateBody']
+                                print("Using template file: {}".format(self.template_body))
+                                self.template_body = self.parse_cfn_template(self.template_body)
+                        except Exception as e:
+                            raise ValueError(e)
+                    else:
                         raise ValueError(e)
-                else:
-                    raise ValueError(e)
             
             # set the location of cfnctl_param_file 
             template_tags[1]['Value'] = os.path.basename(self.cfn_param_file)
             try:
-                if self.template_url:
-                    response = self.client_cfn.create_stack(
-                        StackName=stack_name,
-                        TemplateURL=self.template_url,
-                        Parameters=cfn_params,
-                        TimeoutInMinutes=600,
-                        Capabilities=['CAPABILITY_IAM'],
-                        OnFailure=set_rollback,
-                        Tags=template_tags
-                    )
-                elif self.template_body:
-                    response = self.client_cfn.create_stack(
-                        StackName=stack_name,
-                        TemplateBody=self.template_body,
-                        Parameters=cfn_params,
-                        TimeoutInMinutes=600,
-                        Capabilities=['CAPABILITY_IAM'],
-                        OnFailure=set_rollback,
-                        Tags=template_tags
-                    )
+                with timer.phase('create_stack'):
+                    if self.template_url:
+                        response = self.client_cfn.create_stack(
+                            StackName=stack_name,
+                            TemplateURL=self.template_url,
+                            Parameters=cfn_params,
+                            TimeoutInMinutes=600,
+                            Capabilities=['CAPABILITY_IAM'],
+                            OnFailure=set_rollback,
+                            Tags=template_tags
+                        )
+                    elif self.template_body:
+                        response = self.client_cfn.create_stack(
+                            StackName=stack_name,
+                            TemplateBody=self.template_body,
+                            Parameters=cfn_params,
+                            TimeoutInMinutes=600,
+                            Capabilities=['CAPABILITY_IAM'],
+                            OnFailure=set_rollback,
+                            Tags=template_tags
+                        )
             except ClientError as e:
                 print(e.response['Error']['Message'])
                 return
             
-        stack_rc = self.stack_status(stack_name=stack_name)
+        # the stack exists now, nothing described before create_stack holds
+        self.invalidate_stack(stack_name)
+        update_names(self.cfn_param_file_dir, self.aws_profile, self.region, 'stacks', add=stack_name)
+
+        with timer.phase('wait_for_stack'):
+            stack_rc = self.stack_status(stack_name=stack_name)
 
         if stack_rc != 'CREATE_COMPLETE':
             print('Stack creation failed with {0}'.format(stack_rc))
             return
 
-        self.asg = self.get_asg_from_stack(stack_name=stack_name)
-        self.instances = self.get_inst_from_asg(self.asg)
+        with timer.phase('get_instances'):
+            self.asg = self.get_asg_from_stack(stack_name=stack_name)
+            self.instances = self.get_inst_from_asg(self.asg)
 
-        try:
-            if self.cfn_param_file_values['EnableEnaVfi']:
-                print("Instances finishing booting")
-                time.sleep(60)
-                self.enable_ena_vfi(self.instances)
-        except KeyError:
-            pass
+        self.stack_name = stack_name
+        self.post_create(timer, stack_name, list(self.instances))
 
-        try:
-            if self.cfn_param_file_values['AddNetInterfaces']:
-                self.add_net_dev()
-        except KeyError:
-            pass
+        with timer.phase('stack_info'):
+            self.get_stack_info(stack_name=stack_name)
 
-        stk_output = self.get_stack_output(stack_name)
+        return response
 
-        try:
-            eip = stk_output['ElasticIP']
-            self.set_elastic_ip(stack_eip=eip)
-        except KeyError:
-            pass
+    def post_create(self, timer, stack_name, instances):
+        """
+        Runs the steps after the stack is created as a TaskPipeline.  ENA/VFI stops the instances, so
+        it waits until they have finished booting (their status checks pass).  The extra network
+        interfaces come after ENA/VFI, and the elastic IP after the last of them, as before, because
+        stopping and starting the instances changes the launch times it picks the instance by; only
+        the stack outputs it needs are read while they run.
+
+        :param timer:  PhaseTimer, each step is a phase
+        :param instances:  list() of the stack instance IDs
+        """
 
-        self.stack_name = stack_name
-        self.get_stack_info(stack_name=stack_name)
+        pipeline = TaskPipeline(max_workers=self.max_workers, timer=timer)
+        net_requires = list()
 
-        return response
+        pipeline.add('stack_output', lambda: self.get_stack_output(stack_name))
+
+        if self.cfn_param_file_values.get('EnableEnaVfi'):
+            print("Waiting for instances to finish booting")
+            pipeline.add('wait_for_boot', lambda: self.wait_for_instance_status_ok(instances))
+            pipeline.add('enable_ena_vfi', lambda: self.enable_ena_vfi(instances), requires=['wait_for_boot'])
+            net_requires = ['enable_ena_vfi']
+
+        eip_requires = list(net_requires)
+        if self.cfn_param_file_values.get('AddNetInterfaces'):
+            pipeline.add('add_net_interfaces', self.add_net_dev, requires=net_requires)
+            eip_requires = ['add_net_interfaces']
+
+        def elastic_ip(required):
+            try:
+                return self.set_elastic_ip(instances=instances, stack_eip=required['stack_output']['ElasticIP'])
+            except KeyError:
+                pass
+
+        pipeline.add('elastic_ip', elastic_ip, requires=['stack_output'] + eip_requires, with_results=True)
+
+        return pipeline.run()
 
     def del_stack(self,stack_name, no_prompt=None):
 
         try:
-            stk_response = self.client_cfn.describe_stacks(StackName=stack_name)
+            stack = self.describe_stack(stack_name)
 
-            if stk_response['Stacks'][0]['StackStatus'] == "DELETE_IN_PROGRESS":
+            if stack['StackStatus'] == "DELETE_IN_PROGRESS":
                 print('{0} already being deleted'.format(stack_name))
                 return
 
-            for t in (stk_response['Stacks'][0]['Tags']):
+            for t in stack.get('Tags', list()):
                 if t['Key'] == "cfnctl_param_file":
                     f_path = os.path.join(self.cfn_param_file_dir, t['Value'])
                     if os.path.isfile(f_path):
@@ -761,6 +1614,8 @@ class CfnControl:
             response = self.client_cfn.delete_stack(StackName=stack_name)
         except Exception as e:
             raise ValueError(e)
+        finally:
+            self.invalidate_stack(stack_name)
 
         sc = response['ResponseMetadata']['HTTPStatusCode']
 
@@ -768,6 +1623,8 @@ class CfnControl:
             errmsg = 'Problem deleting stack, status code {}'.format(sc)
             raise ValueError(errmsg)
 
+        update_names(self.cfn_param_file_dir, self.aws_profile, self.region, 'stacks', remove=stack_name)
+
         return
 
     def ls_stacks(self, stack_name=None, show_deleted=False):
@@ -779,35 +1636,66 @@ class CfnControl:
 
         """
 
-        all_stacks = list()
-
-        paginator = self.client_cfn.get_paginator('list_stacks')
-        response_iterator = paginator.paginate()
-
         stacks = dict()
-        show_stack = False
-
-        for page in response_iterator:
-            all_stacks = page['StackSummaries']
-            for r in all_stacks:
-
-                if [r['StackName']] == stack_name:
-                    show_stack = True
-                elif show_deleted and r['StackStatus'] == "DELETE_COMPLETE":
-                    show_stack = True
-                elif r['StackStatus'] == "DELETE_COMPLETE":
-                    show_stack = False
-                else:
-                    show_stack = True
 
-                if show_stack:
-                    try:
-                        stacks[r['StackName']] = [str(r['CreationTime']), r['StackStatus'], r['TemplateDescription']]
-                    except Exception as e:
-                        stacks[r['StackName']] = [str(r['CreationTime']), r['StackStatus'], "No Description"]
+        for r in self.iter_stacks(show_deleted=show_deleted):
+            description = r['TemplateDescription']
+            if description is None:
+                description = "No Description"
+            stacks[r['StackName']] = [str(r['CreationTime']), r['StackStatus'], description]
 
         return stacks
 
+    def iter_stacks(self, show_deleted=False):
+        """
+        yields a dictionary per stack, as the list_stacks pages arrive
+
+          StackName, StackId, StackStatus, CreationTime, LastUpdatedTime, TemplateDescription
+
+        :param show_deleted:  include deleted stacks, StackStatus == DELETE_COMPLETE
+        """
+
+        return iter_stack_summaries(self.client_cfn, show_deleted=show_deleted)
+
+    def iter_stack_details(self, tags=None):
+        """
+        yields a dictionary per stack with its tags, parameters and outputs, from describe_stacks
+        without a stack name, which returns every stack in pages of up to 100.  Deleted stacks are
+        not included.
+
+          StackName, StackId, StackStatus, CreationTime, LastUpdatedTime, Description,
+          Tags, Parameters, Outputs (each a dictionary of key -> value)
+
+        :param tags:  dictionary of tag key -> value, only stacks with all of these tags are
+                      yielded, a value of None matches any value.  The filter is applied here,
+                      describe_stacks has none.
+        """
+
+        tags = tags or dict()
+
+        paginator = self.client_cfn.get_paginator('describe_stacks')
+
+        try:
+            for page in paginator.paginate():
+                for s in page['Stacks']:
+                    stack_tags = dict((t['Key'], t['Value']) for t in s.get('Tags', list()))
+                    if not all(k in stack_tags and (v is None or stack_tags[k] == v) for k, v in tags.items()):
+                        continue
+                    yield {
+                        'StackName': s['StackName'],
+                        'StackId': s['StackId'],
+                        'StackStatus': s['StackStatus'],
+                        'CreationTime': s['CreationTime'],
+                        'LastUpdatedTime': s.get('LastUpdatedTime'),
+                        'Description': s.get('Description'),
+                        'Tags': stack_tags,
+                        'Parameters': dict((p['ParameterKey'], p.get('ParameterValue'))
+                                           for p in s.get('Parameters', list())),
+                        'Outputs': dict((o['OutputKey'], o['OutputValue']) for o in s.get('Outputs', list())),
+                    }
+        except ClientError as e:
+            raise ValueError(e)
+
     def create_net_dev(self, subnet_id_n, desc, sg):
         """
         Creates a network device, returns the id
@@ -830,37 +1718,100 @@ class CfnControl:
 
         return response['AttachmentId']
 
-    def add_net_dev(self):
+    def get_net_devs(self, instances, filters=None):
+        """
+        returns dictionary of instance ID -> list() of its attached network interfaces, one
+        describe_network_interfaces call per 200 instances
+
+        :param filters:  more describe_network_interfaces filters, e.g. attachment.status
+        """
+
+        net_devs = dict((i, list()) for i in instances)
+
+        paginator = self.client_ec2.get_paginator('describe_network_interfaces')
+        for ids in chunked(instances, 200):
+            all_filters = [{'Name': 'attachment.instance-id', 'Values': ids}] + list(filters or list())
+            for page in paginator.paginate(Filters=all_filters):
+                for r_net in page['NetworkInterfaces']:
+                    net_devs[r_net['Attachment']['InstanceId']].append(r_net)
+
+        return net_devs
+
+    def add_net_dev(self, instances=None, total=None, timeout=600):
+        """
+        Attaches new network interfaces until each instance has total of them.  The instances are
+        done at the same time, max_workers at a time.  Running it again only adds what is missing,
+        and interfaces created by an earlier run that never got attached are used first.
+
+        :param instances:  list() of instance IDs, defaults to self.instances
+        :param total:  network interfaces per instance, defaults to TotalNetInterfaces from the parameters file
+        :return:  the last attachment ID, or None if nothing was attached
+        """
+
+        if instances is None:
+            instances = self.instances
+        if total is None:
+            total = int(self.cfn_param_file_values['TotalNetInterfaces'])
+
+        subnet_id = self.cfn_param_file_values['Subnet']
+        sg = self.cfn_param_file_values['SecurityGroups']
+        desc = self.stack_name + "-net_dev"
 
         print("Adding network interfaces")
-        attach_resp = None
 
-        for i in self.instances:
+        net_devs = self.get_net_devs(instances)
+        num_interfaces_b = dict((i, len(net_devs[i])) for i in instances)
 
-            instance = self.ec2.Instance(i)
+        # the free device indexes each instance needs filled
+        to_attach = dict()
+        for i in instances:
+            in_use = set(n['Attachment']['DeviceIndex'] for n in net_devs[i])
+            free = [d for d in range(total) if d not in in_use]
+            to_attach[i] = free[:max(0, total - len(in_use))]
 
-            num_interfaces_b = (len(instance.network_interfaces))
-            num_interfaces = num_interfaces_b
+        num_needed = sum(len(d) for d in to_attach.values())
+        if not num_needed:
+            print("All instances have {0} network interfaces".format(total))
+            return
 
-            num_int_count = 0
+        # left over from an earlier run that stopped between create and attach
+        response = self.client_ec2.describe_network_interfaces(
+            Filters=[{'Name': 'status', 'Values': ['available']},
+                     {'Name': 'subnet-id', 'Values': [subnet_id]},
+                     {'Name': 'description', 'Values': [desc]}])
+        unused = [n['NetworkInterfaceId'] for n in response['NetworkInterfaces']]
+        unused_lock = threading.Lock()
+
+        print("Attaching {0} network interfaces to {1} instances ({2} already created)".format(
+            num_needed, len([i for i in instances if to_attach[i]]), min(num_needed, len(unused))))
+
+        def attach(i):
+            attach_resp = None
+            for dev_num in to_attach[i]:
+                with unused_lock:
+                    net_dev = unused.pop() if unused else None
+                if net_dev is None:
+                    net_dev = self.create_net_dev(subnet_id, desc, sg)
+                response = self.client_ec2.attach_network_interface(
+                    DeviceIndex=dev_num,
+                    InstanceId=i,
+                    NetworkInterfaceId=net_dev
+                )
+                attach_resp = response['AttachmentId']
+            return attach_resp
 
-            while num_interfaces < int(self.cfn_param_file_values['TotalNetInterfaces']):
-                attach_resp = self.attach_new_dev(i,
-                                                  num_interfaces_b + num_int_count,
-                                                  self.cfn_param_file_values['Subnet'],
-                                                  self.stack_name + "-net_dev",
-                                                  self.cfn_param_file_values['SecurityGroups']
-                                                  )
+        attach_resp = [a for a in self.map_instances(attach, instances) if a]
 
-                instance = self.ec2.Instance(i)
+        def get_waiting():
+            attached = self.get_net_devs(instances, filters=[{'Name': 'attachment.status', 'Values': ['attached']}])
+            return [i for i in instances if len(attached[i]) < num_interfaces_b[i] + len(to_attach[i])]
 
-                num_interfaces = (len(instance.network_interfaces))
-                num_int_count += 1
+        self.poll_until(get_waiting, 'attached to {0} network interfaces'.format(total), timeout)
 
-            print(" {0} {1} {2}".format(instance.id, num_interfaces_b, num_interfaces))
-            time.sleep(10)
+        for i in instances:
+            print(" {0} {1} {2}".format(i, num_interfaces_b[i], num_interfaces_b[i] + len(to_attach[i])))
 
-        return attach_resp
+        return attach_resp[-1] if attach_resp else None
 
     def get_stack_events(self, stack_name):
 
@@ -910,24 +1861,16 @@ class CfnControl:
             print("Instance list is null, exiting")
             return
 
-        if inst_arg is not None:
-            self.instances = inst_arg
-
-        for i in self.instances:
-            response = self.client_ec2.describe_instances(InstanceIds=[i], DryRun=False)
-            for r in response['Reservations']:
-                for s in (r['Instances']):
-                    for interface in s['NetworkInterfaces']:
-                        response = self.client_ec2.describe_network_interfaces(
-                            NetworkInterfaceIds=[interface['NetworkInterfaceId']],
-                            DryRun=False)
+        if inst_arg is None:
+            inst_arg = self.instances
 
-                        for r_net in response['NetworkInterfaces']:
-                            try:
-                                if r_net['Association'].get('AllocationId'):
-                                    return r_net['Association'].get('PublicIp')
-                            except KeyError:
-                                pass
+        for net_devs in self.get_net_devs(inst_arg).values():
+            for r_net in net_devs:
+                try:
+                    if r_net['Association'].get('AllocationId'):
+                        return r_net['Association'].get('PublicIp')
+                except KeyError:
+                    pass
 
     def get_netdev0_id(self, instance=None):
 
@@ -954,16 +1897,21 @@ class CfnControl:
             print('Elastic IP already allocated: ' + has_eip)
             return has_eip
         else:
-            response = self.client_ec2.describe_instances(InstanceIds=instances, DryRun=False)
-            for r in response['Reservations']:
-                for resp_i in (r['Instances']):
-                    i = resp_i['InstanceId']
-                    time_tuple = (resp_i['LaunchTime'].timetuple())
-                    launch_time_secs = time.mktime(time_tuple)
-                    launch_time[i] = launch_time_secs
+            for ids in chunked(instances, 1000):
+                response = self.client_ec2.describe_instances(InstanceIds=ids, DryRun=False)
+                for r in response['Reservations']:
+                    for resp_i in (r['Instances']):
+                        i = resp_i['InstanceId']
+                        time_tuple = (resp_i['LaunchTime'].timetuple())
+                        launch_time_secs = time.mktime(time_tuple)
+                        launch_time[i] = launch_time_secs
+
+        if not launch_time:
+            print("No instances to allocate an Elastic IP to")
+            return
 
         launch_time_list = sorted(launch_time.items(), key=operator.itemgetter(1))
-        inst_to_alloc_eip = launch_time_list[1][0]
+        inst_to_alloc_eip = launch_time_list[min(1, len(launch_time_list) - 1)][0]
 
         netdev0 = self.get_netdev0_id(inst_to_alloc_eip)
 
@@ -994,25 +1942,38 @@ class CfnControl:
         return response
 
     def get_stack_output(self, stack_name=None):
+        """
+        returns dictionary of output key -> value, empty unless CfnControl was created with
+        stack_outputs=True.  Outputs saved by an earlier run are used if AWSCFNCTL_OUTPUT_CACHE_TTL
+        allows it, see OutputCache.
+        """
 
         if stack_name is None:
             stack_name = self.stack_name
 
-        stk_response = None
+        if not self.stack_outputs:
+            try:
+                self.describe_stack(stack_name)
+            except ClientError as e:
+                print(e)
+            return dict()
+
+        with self.stack_memo_lock:
+            described = stack_name in self.stack_memo
+        if not described:
+            stk_output = self.output_cache.get(self.region, stack_name)
+            if stk_output is not None:
+                return dict(stk_output)
 
         try:
-            stk_response = self.client_cfn.describe_stacks(StackName=stack_name)
+            stack = self.describe_stack(stack_name)
         except ClientError as e:
             print(e)
+            return dict()
 
         stk_output = dict()
-
-        #for i in stk_response['Stacks']:
-        #    try:
-        #        for r in i['Outputs']:
-        #            stk_output[r['OutputKey']] = r['OutputValue']
-        #    except KeyError:
-        #        print("No Outputs found")
+        for o in stack.get('Outputs', list()):
+            stk_output[o['OutputKey']] = o['OutputValue']
 
         return stk_output
 
@@ -1031,41 +1992,152 @@ class CfnControl:
         if stack_name is None:
             stack_name = self.stack_name
 
-        stack_status = self.ls_stacks(stack_name=stack_name)
-        for stack, i in sorted(stack_status.items()):
-            if stack == stack_name:
-                print("\nStatus:")
-                print('{0:<40.38} {1:<21.19} {2:<30.28} {3:<.30}'.format(stack, str(i[0]), i[1], i[2]))
-                print("")
+        try:
+            i = self.describe_stack(stack_name)
+        except ClientError as e:
+            raise ValueError(e)
 
-        response = self.client_cfn.describe_stacks(StackName=stack_name)
+        description = i.get('Description')
+        if description is None:
+            description = "No Description"
 
-        for i in response['Stacks']:
+        print("\nStatus:")
+        print('{0:<40.38} {1:<21.19} {2:<30.28} {3:<.30}'.format(i['StackName'], str(i['CreationTime']),
+                                                                   i['StackStatus'], description))
+        print("")
 
-            print('[Parameters]')
-            try:
-                for p in i['Parameters']:
-                    print('{0:<38} = {1:<30}'.format(p['ParameterKey'], p['ParameterValue']))
-            except Exception as e:
-                print("No Parameters found")
-                pass
+        print('[Parameters]')
+        try:
+            for p in i['Parameters']:
+                print('{0:<38} = {1:<30}'.format(p['ParameterKey'], p['ParameterValue']))
+        except Exception as e:
+            print("No Parameters found")
+            pass
 
-            print("")
+        print("")
 
-            print('[Outputs]')
-            try:
-                for o in i['Outputs']:
-                    print('{0:<38} = {1:<30}'.format(o['OutputKey'], o['OutputValue']))
-            except Exception as e:
-                print("No Outputs found")
+        print('[Outputs]')
+        try:
+            for o in i['Outputs']:
+                print('{0:<38} = {1:<30}'.format(o['OutputKey'], o['OutputValue']))
+        except Exception as e:
+            print("No Outputs found")
 
         print("")
         return
 
+    def describe_instances_by_id(self, instances):
+        """
+        returns list() of the describe_instances descriptions of instances, 200 instances per call.
+        Instances that no longer exist are left out instead of failing the call.
+        """
+
+        described = list()
+
+        paginator = self.client_ec2.get_paginator('describe_instances')
+        for ids in chunked(instances, 200):
+            for page in paginator.paginate(Filters=[{'Name': 'instance-id', 'Values': ids}]):
+                for r in page['Reservations']:
+                    described.extend(r['Instances'])
+
+        return described
+
+    def get_stack_topology(self, stack_name=None):
+        """
+        Returns the StackTopology of a stack: its ASGs (including those of nested stacks) and
+        standalone instances, their instances, network interfaces and Elastic IPs.  Each level is
+        read with as few calls as the API allows: the nested stacks are listed at the same time,
+        the ASGs 50 per call, and the instances (which come with their network interfaces) 200
+        per call on the thread pool while the Elastic IPs are read alongside.
+
+        :param stack_name:  stack name or ID
+        """
+
+        if stack_name is None:
+            stack_name = self.stack_name
+
+        resources = self.get_stack_resources(stack_name)
+        stack = self.describe_stack(stack_name)
+
+        asg_stack = dict()
+        for r in resources.get('AWS::AutoScaling::AutoScalingGroup', list()):
+            if r.get('PhysicalResourceId') and not r['ResourceStatus'].startswith('DELETE'):
+                asg_stack[r['PhysicalResourceId']] = r['StackId']
+
+        asgs = dict()
+        instances = dict()
+        if asg_stack:
+            for g in self.describe_asgs(list(asg_stack)):
+                name = g['AutoScalingGroupName']
+                asgs[name] = {
+                    'StackId': asg_stack[name],
+                    'Desired': g['DesiredCapacity'],
+                    'Min': g['MinSize'],
+                    'Max': g['MaxSize'],
+                    'Instances': sorted(i['InstanceId'] for i in g['Instances']),
+                }
+                for i in g['Instances']:
+                    instances[i['InstanceId']] = {'InstanceId': i['InstanceId'], 'AutoScalingGroup': name,
+                                                  'LifecycleState': i['LifecycleState']}
+
+        for r in resources.get('AWS::EC2::Instance', list()):
+            if r.get('PhysicalResourceId') and not r['ResourceStatus'].startswith('DELETE'):
+                instances.setdefault(r['PhysicalResourceId'], {'InstanceId': r['PhysicalResourceId'],
+                                                               'AutoScalingGroup': None, 'LifecycleState': None})
+
+        chunks = chunked(sorted(instances), 200)
+        with ContextThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(chunks) + 1))) as pool:
+            addresses = pool.submit(self.client_ec2.describe_addresses)
+            described = list(pool.map(self.describe_instances_by_id, chunks))
+            addresses = addresses.result()['Addresses']
+
+        by_eni = dict((a['NetworkInterfaceId'], a) for a in addresses if a.get('NetworkInterfaceId'))
+
+        enis = dict()
+        eips = dict()
+        for i in [i for chunk in described for i in chunk]:
+            eni_ids = list()
+            for n in sorted(i.get('NetworkInterfaces', list()), key=lambda n: n['Attachment']['DeviceIndex']):
+                eni_id = n['NetworkInterfaceId']
+                private_ips = [p['PrivateIpAddress'] for p in n.get('PrivateIpAddresses', list())] or \
+                    [n['PrivateIpAddress']]
+                public_ip = n.get('Association', dict()).get('PublicIp')
+                address = by_eni.get(eni_id)
+                enis[eni_id] = {
+                    'InstanceId': i['InstanceId'],
+                    'DeviceIndex': n['Attachment']['DeviceIndex'],
+                    'SubnetId': n.get('SubnetId'),
+                    'PrivateIpAddresses': private_ips,
+                    'PublicIp': public_ip or (address['PublicIp'] if address else None),
+                    'AllocationId': address['AllocationId'] if address else None,
+                }
+                if address:
+                    eips[address['PublicIp']] = {'AllocationId': address['AllocationId'], 'NetworkInterfaceId': eni_id,
+                                                 'InstanceId': i['InstanceId']}
+                eni_ids.append(eni_id)
+
+            instances[i['InstanceId']].update({
+                'State': i['State']['Name'],
+                'InstanceType': i['InstanceType'],
+                'AvailabilityZone': i['Placement']['AvailabilityZone'],
+                'SubnetId': i.get('SubnetId'),
+                'PrivateIpAddress': i.get('PrivateIpAddress'),
+                'PublicIpAddress': i.get('PublicIpAddress'),
+                'NetworkInterfaces': eni_ids,
+            })
+
+        # instances that are gone are kept, with what the ASG or stack said about them
+        for i in instances.values():
+            i.setdefault('NetworkInterfaces', list())
+
+        return StackTopology({'StackName': stack['StackName'], 'StackId': stack['StackId'],
+                              'StackStatus': stack['StackStatus']},
+                             asgs=asgs, instances=instances, enis=enis, eips=eips, region=self.region)
+
     @staticmethod
     def get_bucket_and_key_from_url(url):
 
-        path = urlparse.urlparse(url).path
+        path = urlparse(url).path
 
         path_l = path.split('/')
 
@@ -1169,6 +2241,40 @@ class CfnControl:
         return cli_val
 
 
+    def read_template_url(self, template_url):
+        """
+        returns the content of a template in S3, from the inventory snapshot when offline
+        """
+
+        if self.inventory is not None:
+            return self.inventory.template(template_url)
+
+        (bucket, key) = self.get_bucket_and_key_from_url(template_url)
+
+        # a template read by an earlier CfnControl of the process is only read again if it changed
+        kwargs = {'Bucket': bucket, 'Key': key}
+        cached = self.warm_get('template', template_url)
+        if cached is not None:
+            kwargs['IfNoneMatch'] = cached[0]
+
+        try:
+            response = self.client_s3.get_object(**kwargs)
+            body = response['Body'].read().decode('utf-8')
+            if response.get('ETag'):
+                self.warm_put((response['ETag'], body), 'template', template_url)
+            return body
+        except ClientError as e:
+            if cached is not None and e.response['Error']['Code'] in ['304', 'NotModified']:
+                self.warm_put(cached, 'template', template_url)
+                return cached[1]
+            if e.response['Error']['Code'] == 'AccessDenied':
+                errmsg = "\nAccess Denied: Are you using the correct CFN template and region for the CFN template?"
+                raise ValueError(str(e) + errmsg)
+            elif e.response['Error']['Code'] == 'NoSuchKey':
+                errmsg = "\nCan't find {0} in bucket {1}".format(key, bucket)
+                raise ValueError(str(e) + errmsg)
+            raise ValueError(e)
+
     def build_cfn_param(self, stack_name, template, cli_template=None, verbose=False):
 
         command_line_template = cli_template
@@ -1218,19 +2324,7 @@ class CfnControl:
 
         if self.url_check(template):
             template_url = template
-
-            (bucket, key) = self.get_bucket_and_key_from_url(template_url)
-            s3_object = self.s3.Object(bucket, key)
-            try:
-                template_content = s3_object.get()['Body'].read().decode('utf-8')
-            except ClientError as e:
-                if e.response['Error']['Code'] == 'AccessDenied':
-                    errmsg = "\nAccess Denied: Are you using the correct CFN template and region for the CFN template?"
-                    raise ValueError(e[0] + errmsg)
-                elif e.response['Error']['Code'] == 'NoSuchKey':
-                    errmsg = "\nCan't find {0} in bucket {1}".format(key, bucket)
-                    raise ValueError(e[0] + errmsg)
-                raise ValueError(e)
+            template_content = self.read_template_url(template_url)
         else:
             template_path = os.path.abspath(template)
             template_body = template_path
@@ -1241,7 +2335,8 @@ class CfnControl:
             json_content = json.loads(template_content)
         except json.decoder.JSONDecodeError:
             try:
-                # this converts yaml to json using cfn_flip.to_json
+                # this converts yaml to json using cfn_flip.to_json, only needed for YAML templates
+                from cfn_flip import to_json
                 json_content = json.loads(to_json(template_content))
             except Exception as e:
                 print(e)
@@ -1501,6 +2596,15 @@ class CfnControl:
         if found_required_val:
             print('Some values are still needed, replace "<VALUE_NEEDED>" in {0}'.format(cfn_param_file))
 
+        # values picked from the inventory snapshot are checked against the account before the stack is created
+        revalidate = list()
+        if self.inventory is not None:
+            revalidate = [p for p in sorted(cfn_param_file_to_write)
+                          if json_content['Parameters'][p].get('Type') in ACCOUNT_PARAM_TYPES]
+            if revalidate:
+                print('Built offline, {0} will be checked again when the stack is created'.format(
+                    ', '.join(revalidate)))
+
         # Debug
         # print (sorted(cfn_param_file_to_write.items()))
         with open(self.cfn_param_file, 'w') as cfn_out_file:
@@ -1510,6 +2614,9 @@ class CfnControl:
                 cfn_out_file.write('{0} = {1}\n'.format('TemplateURL', template_url))
             elif template_body is not None:
                 cfn_out_file.write('{0} = {1}\n'.format('TemplateBody', template_body))
+            if revalidate:
+                cfn_out_file.write('{0} = {1}\n'.format(REVALIDATE_KEY, ','.join(revalidate)))
+                cfn_out_file.write('{0} = {1}\n'.format(INVENTORY_TAKEN_KEY, self.inventory.taken))
             cfn_out_file.write('\n')
 
             cfn_out_file.write('[Paramters]\n')
@@ -1525,53 +2632,63 @@ class CfnControl:
 
         # returns a dictionary
 
-        #  Instance state can be:  pending | running | shutting-down | terminated | stopping | stopped
+        inst_info = dict()
+        for i in self.iter_instance_info(instance_state=instance_state):
+            inst_info[i.InstanceId] = {
+                'TAG::Name': i.Name,
+                'Type': i.InstanceType,
+                'State': i.State,
+                'Private IP': i.PrivateIpAddress,
+                'Private DNS': i.PrivateDnsName,
+                'Public IP': i.PublicIpAddress,
+                'Launch Time': i.LaunchTime
+            }
 
-        instance_states = ['pending',
-                           'running',
-                           'shutting-down',
-                           'terminated',
-                           'stopping',
-                           'stopped'
-                           ]
+        return inst_info  # returns a dictionary
+
+    def iter_instance_info(self, instance_state=None, tags=None, vpc_id=None, instance_types=None, asg=None,
+                           fields=None):
+        """
+        yields an InstanceRecord per instance as the describe_instances pages arrive, only one page
+        is held at a time.  The conditions are sent to EC2 as filters, so the instances that don't
+        match are never transferred.
+
+        :param instance_state:  pending | running | shutting-down | terminated | stopping | stopped
+        :param tags:  dictionary of tag key -> value, a value of None matches any value of the key
+        :param vpc_id:  VPC ID
+        :param instance_types:  list() of instance types
+        :param asg:  list() of Auto Scaling group names
+        :param fields:  list() of the record fields, from inventory.INSTANCE_FIELDS (Region is the
+                        region of this CfnControl), default
+                        InstanceId, Name, InstanceType, State, PrivateIpAddress, PrivateDnsName,
+                        PublicIpAddress, LaunchTime
+        """
 
-        if instance_state is not None and instance_state not in instance_states:
+        if instance_state is not None and instance_state not in INSTANCE_STATES:
             errmsg = 'Instance state "{0}" not valid. ' \
                      'Choose "pending | running | shutting-down | terminated | stopping | stopped"'.format(instance_state)
             raise ValueError(errmsg)
 
-        if instance_state is None:
-            instances = self.ec2.instances.all()
-        else:
-            instances = self.ec2.instances.filter(Filters=[{
-                'Name': 'instance-state-name',
-                'Values': [instance_state]}]
-            )
+        record = record_class(fields)
+        filters = instance_filters(instance_state=instance_state, tags=tags, vpc_id=vpc_id,
+                                   instance_types=instance_types, asg=asg)
 
-        inst_info = dict()
-        for i in instances:
-            tag_name = 'NULL'
-            try:
-                for tag in i.tags:
-                    if tag['Key'] == 'Name':
-                        tag_name = tag['Value']
-            except:
-                pass
-            inst_info[i.id] = {
-                'TAG::Name': tag_name,
-                'Type': i.instance_type,
-                'State': i.state['Name'],
-                'Private IP': i.private_ip_address,
-                'Private DNS': i.private_dns_name,
-                'Public IP': i.public_ip_address,
-                'Launch Time': i.launch_time
-            }
+        paginator = self.client_ec2.get_paginator('describe_instances')
 
-        return inst_info  # returns a dictionary
+        try:
+            for page in paginator.paginate(Filters=filters, PaginationConfig={'PageSize': 1000}):
+                for r in page['Reservations']:
+                    for i in r['Instances']:
+                        yield record(i, self.region)
+        except ClientError as e:
+            raise ValueError(e)
 
     def get_vpcs(self):
 
-        response = self.client_ec2.describe_vpcs()
+        if self.inventory is not None:
+            response = {'Vpcs': self.inventory.vpcs()}
+        else:
+            response = self.client_ec2.describe_vpcs()
 
         vpc_keys_all = [
             'Tag_Name',
@@ -1619,7 +2736,10 @@ class CfnControl:
                            'AssignIpv6AddressOnCreation'
                            ]
 
-        response = self.client_ec2.describe_subnets(Filters=[{'Name': 'vpc-id', 'Values': [vpc_to_get]}])
+        if self.inventory is not None:
+            response = {'Subnets': self.inventory.subnets(vpc_to_get)}
+        else:
+            response = self.client_ec2.describe_subnets(Filters=[{'Name': 'vpc-id', 'Values': [vpc_to_get]}])
 
         all_subnets = dict()
 
@@ -1651,7 +2771,9 @@ class CfnControl:
             'GroupId',
         ]
 
-        if vpc is None:
+        if self.inventory is not None:
+            response = {'SecurityGroups': self.inventory.security_groups(vpc)}
+        elif vpc is None:
             try:
                 response = self.client_ec2.describe_security_groups()
             except Exception as e:
@@ -15,8 +15,8 @@
 
 import sys
 import json
-import boto3
 import argparse
+from awscfnctl import ApiStats
 
 #aws ec2 describe-images --owners 309956199498  --region us-west-2 --filters Name=name,Values=RHEL-7.3_HVM_GA-20161026-x86_64-1-Hourly2-GP2
 
@@ -94,10 +94,19 @@ def arg_parse():
                              ' AWS Console',
                         required=False
                         )
+    parser.add_argument('--stats', dest='stats', required=False, help='Print AWS API call statistics at exit', action='store_true')
 
     return parser.parse_args()
 
 
+def ami_args(args):
+
+    # only the AMI ID arguments, not the option flags
+    not_ami_args = ['stats']
+
+    return dict((arg_n, ami_id) for arg_n, ami_id in vars(args).items() if arg_n not in not_ami_args)
+
+
 def image_info(client, owners, ami_name, region):
 
     response = client.describe_images(
@@ -156,7 +165,7 @@ def get_image_info(client, ami_id):
 
 def print_image_info(args, client):
 
-    for arg_n, ami_id in vars(args).items():
+    for arg_n, ami_id in ami_args(args).items():
         if ami_id:
             (ami_name, owners, description, ena, sriov) = get_image_info(client, ami_id)
             print('Building mappings for:\n'
@@ -177,6 +186,13 @@ def main():
 
     args = arg_parse()
 
+    import boto3
+
+    if args.stats:
+        api_stats = ApiStats()
+        api_stats.register()
+        api_stats.print_at_exit()
+
     client_iad = boto3.client('ec2', region_name='us-east-1')
     r_response_iad = client_iad.describe_regions()
 
@@ -192,7 +208,7 @@ def main():
         response = dict()
         ami_map[region] = dict()
 
-        for arg_n, ami_id_iad in vars(args).items():
+        for arg_n, ami_id_iad in ami_args(args).items():
             if ami_id_iad:
                 (ami_name, owners, description, ena, sriov) = get_image_info(client_iad, ami_id_iad)
                 response[arg_n] = image_info(client, owners, ami_name, region)
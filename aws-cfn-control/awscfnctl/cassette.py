@@ -0,0 +1,508 @@
+#!/usr/bin/env python
+
+#
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file
+# except in compliance with the License. A copy of the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+"""
+Record the AWS responses of a real command run to a cassette file, and replay them offline
+
+  python -m awscfnctl.cassette record create.cassette cfnctl create -n cluster1 -f cluster.json
+  python -m awscfnctl.cassette replay create.cassette cfnctl create -n cluster1 -f cluster.json
+  python -m awscfnctl.cassette info create.cassette
+
+A cassette is gzipped JSON lines, one line per API call with the parameters, the parsed response
+and the latency.  On replay, calls are matched on service, region, operation and parameters, in
+the order they were recorded.  Recorded latencies and the commands' time.sleep() waits are
+multiplied by the time scale, 0 (the default) replays as fast as possible.  A call that is not in
+the cassette raises CassetteError.
+"""
+
+import sys
+import copy
+import gzip
+import json
+import time
+import base64
+import argparse
+import datetime
+import importlib
+import threading
+import contextlib
+from .apistats import event_op
+
+progname = 'cassette'
+
+# keep a reference, patched_sleep() replaces time.sleep
+_real_sleep = time.sleep
+
+CASSETTE_VERSION = 1
+
+DEFAULT_REGION = 'us-east-1'
+
+# generated for every request, never the same on replay
+IGNORED_PARAMS = ['ClientToken', 'ClientRequestToken', 'IdempotencyToken']
+
+COMMANDS = [
+    'asgctl',
+    'build_ami_maps',
+    'cfnctl',
+    'get_asg_from_stack',
+    'get_inst_from_asg',
+    'get_priv_dns_asg',
+    'getamiinfo',
+    'getec2keys',
+    'getinstinfo',
+    'getnetinfo',
+    'getstackinfo',
+    'getstacktopo',
+]
+
+
+class CassetteError(Exception):
+    pass
+
+
+def encode_value(value):
+    """
+    json.dumps() default for the non-JSON types in botocore parameters and responses
+    """
+
+    if isinstance(value, datetime.datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, (bytes, bytearray)):
+        return {'__bytes__': base64.b64encode(value).decode('ascii')}
+
+    errmsg = 'Can not record a value of type {0}'.format(type(value).__name__)
+    raise CassetteError(errmsg)
+
+
+def decode_value(obj):
+    """
+    json.loads() object_hook, reverses encode_value()
+    """
+
+    if '__datetime__' in obj:
+        return datetime.datetime.fromisoformat(obj['__datetime__'])
+    if '__bytes__' in obj:
+        return base64.b64decode(obj['__bytes__'])
+
+    return obj
+
+
+def params_key(params):
+    """
+    returns the parameters as a string that is the same on every run
+    """
+
+    return json.dumps(dict((k, v) for k, v in params.items() if k not in IGNORED_PARAMS),
+                      sort_keys=True, separators=(',', ':'), default=encode_value)
+
+
+def call_key(service, region, operation, params):
+
+    return '{0} {1} {2} {3}'.format(service, region, operation, params_key(params))
+
+
+def read_cassette(path):
+    """
+    returns (header, list of calls) from a cassette file
+    """
+
+    try:
+        with gzip.open(path, 'rt') as f:
+            header = json.loads(f.readline())
+            if header.get('cassette') != CASSETTE_VERSION:
+                errmsg = '{0} is not a version {1} cassette'.format(path, CASSETTE_VERSION)
+                raise ValueError(errmsg)
+            calls = [json.loads(line, object_hook=decode_value) for line in f if line.strip()]
+    except (IOError, OSError) as e:
+        raise ValueError(e)
+
+    return header, calls
+
+
+class Recorder:
+
+    def __init__(self, path):
+
+        """
+        Writes every AWS API call made through the registered sessions to a cassette
+
+        :param path:  cassette file, gzipped JSON lines
+        """
+
+        self.lock = threading.Lock()
+        self.path = path
+        self.calls = 0
+        self.started = time.monotonic()
+
+        self.f = gzip.open(path, 'wt')
+        header = {'cassette': CASSETTE_VERSION, 'recorded': datetime.datetime.now(datetime.timezone.utc).isoformat()}
+        self.f.write(json.dumps(header) + '\n')
+
+    def session(self, profile_name=None):
+        """
+        returns a new recording boto3 session, usable as CfnControl.session_factory
+        """
+
+        import boto3
+
+        return self.register(boto3.session.Session(profile_name=profile_name))
+
+    def register(self, session):
+
+        events = session.events
+        uid = 'awscfnctl-cassette-record-{0}-'.format(id(self))
+
+        events.register('before-parameter-build', self._before_parameter_build,
+                        unique_id=uid + 'before-parameter-build')
+        events.register_first('before-call', self._before_call, unique_id=uid + 'before-call')
+        events.register('after-call', self._after_call, unique_id=uid + 'after-call')
+
+        return session
+
+    @contextlib.contextmanager
+    def installed(self):
+        """
+        record the calls of CfnControl, and of the commands that use boto3.client() directly
+        """
+
+        with _session_factory(self.session):
+            yield self
+
+    @staticmethod
+    def _before_parameter_build(params, context, **kwargs):
+
+        context['awscfnctl_cassette_params'] = dict(params)
+
+    @staticmethod
+    def _before_call(context, request_signer, **kwargs):
+
+        context['awscfnctl_cassette_region'] = request_signer.region_name
+        context['awscfnctl_cassette_start'] = time.monotonic()
+
+    def _after_call(self, event_name, http_response, parsed, context, **kwargs):
+
+        now = time.monotonic()
+        service, operation = event_op(event_name)
+
+        response = dict((k, v) for k, v in parsed.items() if k != 'ResponseMetadata')
+        for k, v in response.items():
+            if hasattr(v, 'read'):
+                # streaming bodies belong to the caller, don't consume them
+                response[k] = None
+
+        call = {
+            'service': service,
+            'region': context.get('awscfnctl_cassette_region'),
+            'operation': operation,
+            'params': context.get('awscfnctl_cassette_params', dict()),
+            'status': http_response.status_code,
+            'at': round(context.get('awscfnctl_cassette_start', now) - self.started, 4),
+            'latency': round(now - context.get('awscfnctl_cassette_start', now), 4),
+            'response': response,
+        }
+        line = json.dumps(call, separators=(',', ':'), default=encode_value)
+
+        with self.lock:
+            self.f.write(line + '\n')
+            self.calls += 1
+
+    def close(self):
+
+        with self.lock:
+            self.f.close()
+
+
+class Player:
+
+    def __init__(self, path, time_scale=0.0, strict=True):
+
+        """
+        Answers AWS API calls from a cassette
+
+        :param path:  cassette written by Recorder
+        :param time_scale:  multiplier for the recorded latencies and for time.sleep(), 0 doesn't wait
+        :param strict:  raise CassetteError when a call was recorded fewer times than it is made,
+                        if False the last recorded response is repeated
+        """
+
+        self.lock = threading.Lock()
+        self.path = path
+        self.time_scale = time_scale
+        self.strict = strict
+        self.header, calls = read_cassette(path)
+
+        # sessions default to the region of the first call
+        self.region = None
+        self.queues = dict()
+        self.last = dict()
+        for call in calls:
+            if self.region is None:
+                self.region = call['region']
+            key = call_key(call['service'], call['region'], call['operation'], call['params'])
+            self.queues.setdefault(key, list()).append(call)
+        for queue in self.queues.values():
+            queue.reverse()
+        self.region = self.region or DEFAULT_REGION
+
+        self.played = 0
+        self.unexpected = list()
+
+    def session(self, profile_name=None):
+        """
+        returns a new boto3 session answered from the cassette, usable as CfnControl.session_factory
+        """
+
+        import boto3
+
+        session = boto3.session.Session(aws_access_key_id='AKIDCASSETTE', aws_secret_access_key='cassette',
+                                        region_name=self.region)
+
+        return self.register(session)
+
+    def register(self, session):
+
+        events = session.events
+        uid = 'awscfnctl-cassette-replay-{0}-'.format(id(self))
+
+        events.register('before-parameter-build', self._before_parameter_build,
+                        unique_id=uid + 'before-parameter-build')
+        events.register('before-call', self._before_call, unique_id=uid + 'before-call')
+
+        return session
+
+    @contextlib.contextmanager
+    def installed(self):
+        """
+        answer the calls of CfnControl, and of the commands that use boto3.client() directly
+        """
+
+        with _session_factory(self.session):
+            yield self
+
+    @contextlib.contextmanager
+    def patched_sleep(self):
+        """
+        scale time.sleep() by the time scale
+        """
+
+        def sleep(seconds):
+            if self.time_scale:
+                _real_sleep(seconds * self.time_scale)
+
+        time.sleep = sleep
+        try:
+            yield
+        finally:
+            time.sleep = _real_sleep
+
+    @staticmethod
+    def _before_parameter_build(params, context, **kwargs):
+
+        context['awscfnctl_cassette_params'] = dict(params)
+
+    def _before_call(self, event_name, context, request_signer, **kwargs):
+
+        from botocore.awsrequest import AWSResponse
+
+        service, operation = event_op(event_name)
+        params = context.get('awscfnctl_cassette_params', dict())
+        key = call_key(service, request_signer.region_name, operation, params)
+
+        with self.lock:
+            queue = self.queues.get(key)
+            if queue:
+                call = queue.pop()
+                response = call['response']
+                if not self.strict:
+                    self.last[key] = call
+            elif key in self.last and not self.strict:
+                call = self.last[key]
+                response = copy.deepcopy(call['response'])
+            else:
+                self.unexpected.append(key)
+                errmsg = 'Call not in cassette {0}: {1} {2} in {3} with {4}'.format(
+                    self.path, service, operation, request_signer.region_name, params_key(params))
+                recorded = self.recorded_params(service, operation)
+                if recorded:
+                    errmsg += '\n  recorded parameters for {0}: {1}'.format(operation, '\n    '.join(recorded))
+                raise CassetteError(errmsg)
+            self.played += 1
+
+        if self.time_scale and call['latency']:
+            _real_sleep(call['latency'] * self.time_scale)
+
+        parsed = dict(response)
+        parsed['ResponseMetadata'] = {'HTTPStatusCode': call['status'], 'RetryAttempts': 0}
+
+        return AWSResponse(None, call['status'], {}, None), parsed
+
+    def recorded_params(self, service, operation):
+
+        prefix = '{0} '.format(service)
+        recorded = set()
+        for key, queue in self.queues.items():
+            if key.startswith(prefix) and key.split(' ', 3)[2] == operation:
+                recorded.add(key.split(' ', 3)[3])
+
+        return sorted(recorded)[:5]
+
+    def unused(self):
+        """
+        returns the number of recorded calls that were not replayed
+        """
+
+        with self.lock:
+            return sum(len(queue) for queue in self.queues.values())
+
+
+@contextlib.contextmanager
+def _session_factory(factory):
+
+    import boto3
+    from .awscfnctl import CfnControl
+
+    saved_factory = CfnControl.session_factory
+    saved_default_session = boto3.DEFAULT_SESSION
+    saved_refresh = CfnControl.completion_refresh
+
+    CfnControl.session_factory = factory
+    boto3.DEFAULT_SESSION = factory()
+    # no background processes while recording or replaying
+    CfnControl.completion_refresh = False
+    try:
+        yield
+    finally:
+        CfnControl.session_factory = saved_factory
+        boto3.DEFAULT_SESSION = saved_default_session
+        CfnControl.completion_refresh = saved_refresh
+
+
+def run_command(command):
+    """
+    run one of the awscfnctl commands in this process
+
+    :param command:  command line, e.g. ['cfnctl', 'list']
+    :return:  exit code of the command
+    """
+
+    if not command or command[0] not in COMMANDS:
+        errmsg = 'Command must be one of: {0}'.format(', '.join(COMMANDS))
+        raise ValueError(errmsg)
+
+    from .daemon import in_process
+
+    module = importlib.import_module('awscfnctl.{0}'.format(command[0]))
+
+    saved_argv = sys.argv
+    sys.argv = list(command)
+    try:
+        with in_process():
+            return module.main() or 0
+    except SystemExit as e:
+        return e.code or 0
+    except ValueError as e:
+        print('ERROR: {0}'.format(e))
+        return 1
+    finally:
+        sys.argv = saved_argv
+
+
+def cassette_info(path):
+
+    header, calls = read_cassette(path)
+
+    ops = dict()
+    for call in calls:
+        key = (call['service'], call['region'], call['operation'])
+        op = ops.setdefault(key, {'calls': 0, 'errors': 0, 'latency': 0.0, 'size': 0})
+        op['calls'] += 1
+        op['latency'] += call['latency']
+        op['size'] += len(json.dumps(call['response'], separators=(',', ':'), default=encode_value))
+        if call['status'] >= 300:
+            op['errors'] += 1
+
+    line_fmt = '{0:<16.16} {1:<16.16} {2:<34.34} {3:>6} {4:>6} {5:>10} {6:>12}'
+
+    print('Recorded {0}, {1} calls, {2:.1f}s'.format(header['recorded'], len(calls),
+                                                     calls[-1]['at'] + calls[-1]['latency'] if calls else 0.0))
+    print(line_fmt.format('Service', 'Region', 'Operation', 'Calls', 'Errors', 'API s', 'Bytes'))
+    print(106 * '-')
+    for (service, region, operation), op in sorted(ops.items()):
+        print(line_fmt.format(service, region or '', operation, op['calls'], op['errors'],
+                              '{0:.2f}'.format(op['latency']), op['size']))
+
+
+def arg_parse():
+
+    parser = argparse.ArgumentParser(prog=progname,
+                                     description='Record the AWS responses of an awscfnctl command, or replay them',
+                                     epilog='Example:  {} record <file> cfnctl create -n <stack> -f <template>'.format(progname)
+                                     )
+
+    opt_group = parser.add_argument_group('optional arguments')
+    opt_group.add_argument('--time-scale', dest='time_scale', required=False, type=float, default=0.0,
+                           help='Replay: multiply recorded latencies and sleeps by this (default 0, no waiting)')
+    opt_group.add_argument('--lenient', dest='lenient', required=False, action='store_true',
+                           help='Replay: repeat the last response when a call was recorded fewer times')
+
+    req_group = parser.add_argument_group('required arguments')
+    req_group.add_argument('action', choices=['record', 'replay', 'info'], help='Action to take')
+    req_group.add_argument('cassette', help='Cassette file')
+    req_group.add_argument('command', nargs=argparse.REMAINDER, help='awscfnctl command line, e.g. cfnctl list')
+
+    return parser.parse_args()
+
+
+def main():
+
+    rc = 0
+
+    args = arg_parse()
+
+    if args.action == 'info':
+        cassette_info(args.cassette)
+        return rc
+
+    if args.action == 'record':
+        recorder = Recorder(args.cassette)
+        try:
+            with recorder.installed():
+                rc = run_command(args.command)
+        finally:
+            recorder.close()
+        print('Recorded {0} calls to {1}'.format(recorder.calls, args.cassette), file=sys.stderr)
+
+    elif args.action == 'replay':
+        player = Player(args.cassette, time_scale=args.time_scale, strict=not args.lenient)
+        with player.installed(), player.patched_sleep():
+            rc = run_command(args.command)
+        print('Replayed {0} calls, {1} recorded calls not used'.format(player.played, player.unused()),
+              file=sys.stderr)
+        if player.unexpected:
+            print('ERROR: {0} calls were not in the cassette'.format(len(player.unexpected)), file=sys.stderr)
+            rc = 1
+
+    return rc
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print('\nReceived Keyboard interrupt.')
+        print('Exiting...')
+    except ValueError as e:
+        print('ERROR: {0}'.format(e))
+        sys.exit(1)
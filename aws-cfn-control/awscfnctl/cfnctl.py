@@ -16,8 +16,13 @@
 import os
 import sys
 import argparse
-from awscfnctl import CfnControl
+from awscfnctl.timing import start_profile
+from awscfnctl.output import add_output_args
+from awscfnctl.output import parse_fields
+from awscfnctl.output import parse_tags
+from awscfnctl.fanout import add_region_args
 from argparse import RawTextHelpFormatter
+from awscfnctl.daemon import run_in_daemon
 
 progname = 'cfnctl'
 
@@ -31,11 +36,16 @@ def arg_parse():
     parser._optionals.title = "arguments"
 
     parser.add_argument('cfn_action', type=str,
-                        help="REQUIRED: Action: build|create|list|delete\n"
-                             "  build    Builds the CFN parameter file (-t required)\n"
+                        help="REQUIRED: Action: build|create|list|delete|snapshot\n"
+                             "  build    Builds the CFN parameter file (-t required, --offline\n"
+                             "           builds it from the saved inventory without AWS calls)\n"
                              "  create   Creates a new stack (-n and [-t|-f] required)\n"
-                             "  list     List all stacks (-d provides extra detail)\n"
-                             "  delete   Deletes a stack (-n is required)"
+                             "  list     List all stacks (-d provides extra detail, -l tags, parameters\n"
+                             "           and outputs, --tag filters by tag, --profiles and\n"
+                             "           --regions|--all-regions list several accounts and regions)\n"
+                             "  delete   Deletes a stack (-n is required)\n"
+                             "  snapshot Saves the key pairs, VPCs, subnets and security groups\n"
+                             "           (and the -t template if it is in S3) for build --offline"
                         )
     parser.add_argument('-r', dest='region', required=False, help="Region name")
     parser.add_argument('-n', dest='stack_name', required=False, help="Stack name")
@@ -44,6 +54,10 @@ def arg_parse():
                         help="Template parameter file")
     parser.add_argument('-d', dest='ls_all_stack_info', required=False, help='List details on all stacks',
                         action='store_true')
+    parser.add_argument('-l', dest='ls_long', required=False, action='store_true',
+                        help='List the tags, parameters and outputs of all stacks')
+    parser.add_argument('--tag', dest='tags', action='append', required=False, metavar='KEY[=VALUE]',
+                        help='list: only stacks with this tag (any value without =VALUE), can be repeated')
     parser.add_argument('-b', dest='bucket', required=False, help='Bucket to upload template to')
     parser.add_argument('-nr', dest='no_rollback', required=False, help='Do not rollback', action='store_true')
     parser.add_argument('-p', dest='aws_profile', required=False, help='AWS Profile')
@@ -51,6 +65,18 @@ def arg_parse():
                         action='store_true')
     parser.add_argument('-v', dest='verbose_param_file', required=False, help='Verbose config file',
                         action='store_true')
+    parser.add_argument('--offline', dest='offline', required=False, action='store_true',
+                        help='build: use the inventory saved by "cfnctl snapshot", no AWS calls are made')
+    parser.add_argument('--stats', dest='stats', required=False, help='Print AWS API call statistics at exit',
+                        action='store_true')
+    parser.add_argument('--profile-out', dest='profile_out', required=False,
+                        help='Write cProfile data (CPU time) to this file, view it with python -m pstats')
+    add_output_args(parser)
+    parser.add_argument('--profiles', dest='profiles', required=False,
+                        help='list: comma separated AWS profiles to list the stacks of, at the same time')
+    add_region_args(parser)
+    parser.add_argument('--sort', dest='sort', required=False,
+                        help='list with --profiles or --regions: sort by this field (default Profile, Region, StackName)')
 
     if len(sys.argv[1:]) == 0:
         parser.print_help()
@@ -59,16 +85,104 @@ def arg_parse():
     return parser.parse_args()
 
 
+def print_stack_details(records):
+    """
+    print the status, tags, parameters and outputs of each stack, as the stacks are read
+    """
+
+    for r in records:
+        print('{0:<40.38} {1:<21.19} {2:<30.28} {3:<.30}'.format(r['StackName'], str(r['CreationTime']),
+                                                                   r['StackStatus'], r['Description'] or ''))
+        for section in ('Tags', 'Parameters', 'Outputs'):
+            if r[section]:
+                print('   [{0}]'.format(section))
+                for k, v in sorted(r[section].items()):
+                    print('   {0:<38} = {1}'.format(k, v))
+        print("")
+
+
+def sweep_stacks(args, aws_profile):
+    """
+    list the stacks of several profiles and regions as one view
+    """
+
+    from awscfnctl.sweep import StackSweep
+    from awscfnctl.sweep import SWEEP_FIELDS
+    from awscfnctl.inventory import top_records
+
+    rc = 0
+
+    profiles = [aws_profile]
+    if args.profiles:
+        profiles = [p.strip() for p in args.profiles.split(',') if p.strip()]
+
+    regions = None
+    if args.regions:
+        regions = [r.strip() for r in args.regions.split(',') if r.strip()]
+    elif not args.all_regions:
+        regions = [args.region] if args.region else None
+        if regions is None:
+            errmsg = 'Give the regions to list with -r, --regions or --all-regions'
+            raise ValueError(errmsg)
+
+    sweep = StackSweep(profiles, regions=regions, max_workers=args.max_workers)
+
+    if args.stats:
+        sweep.api_stats.print_at_exit()
+
+    records = sweep.run()
+    if args.stack_name:
+        records = (r for r in records if r['StackName'] == args.stack_name)
+
+    if args.output != 'table':
+        # without --sort the records are written as they arrive
+        from awscfnctl.output import RecordWriter
+        writer = RecordWriter(args.output, fields=parse_fields(args.fields) or SWEEP_FIELDS)
+        if args.sort:
+            records = top_records(records, args.sort, fields=SWEEP_FIELDS)
+        writer.write_all(records)
+    else:
+        if args.sort:
+            records = top_records(records, args.sort, fields=SWEEP_FIELDS)
+        else:
+            records = sorted(records, key=lambda r: (r['Profile'], r['Region'], r['StackName']))
+
+        line_fmt = '{0:<16.16} {1:<14} {2:<14} {3:<42.40} {4:<30} {5:<20}'
+        print(line_fmt.format('Profile', 'Account', 'Region', 'Stack', 'Status', 'Created'))
+        print(141 * '-')
+        for r in records:
+            print(line_fmt.format(r['Profile'], r['Account'], r['Region'], r['StackName'], r['StackStatus'],
+                                  r['CreationTime'].strftime('%Y-%m-%d %H:%M:%S')))
+        print(141 * '-')
+        print('{0} stacks'.format(len(records)))
+
+    # a profile or region that fails is reported, the others are still listed
+    if sweep.print_errors():
+        rc = 1
+
+    return rc
+
+
 def main():
 
+    # run by the daemon, if AWSCFNCTL_DAEMON is set and it is running
+    rc = run_in_daemon(progname)
+    if rc is not None:
+        return rc
+
     rc = 0
     args = arg_parse()
+
+    # boto3 takes most of the start up time, only load it once the arguments are good
+    from awscfnctl import CfnControl
+
     rollback = 'ROLLBACK'
 
     create_stack = False
     del_stack = False
     ls_stacks = False
     build_param_file = False
+    take_snapshot = False
 
     cfn_action = args.cfn_action
     if cfn_action == "create":
@@ -79,10 +193,15 @@ def main():
         ls_stacks = True
     elif cfn_action == "build":
         build_param_file = True
+    elif cfn_action == "snapshot":
+        take_snapshot = True
     else:
-        print('Action has to be "build|create|list|delete"')
+        print('Action has to be "build|create|list|delete|snapshot"')
         sys.exit(1)
 
+    if args.offline and not build_param_file:
+        raise ValueError('Only build works offline (--offline)')
+
     bucket = args.bucket
     param_file = args.param_file
     ls_all_stack_info = args.ls_all_stack_info
@@ -107,13 +226,46 @@ def main():
     if args.no_rollback:
         rollback = 'DO_NOTHING'
 
-    client = CfnControl(region=region, aws_profile=aws_profile, cfn_action=cfn_action)
+    if args.profile_out:
+        start_profile(args.profile_out)
+
+    if ls_stacks and (args.profiles or args.regions or args.all_regions):
+        # only CloudFormation clients are needed, no CfnControl
+        return sweep_stacks(args, aws_profile)
+
+    client = CfnControl(region=region, aws_profile=aws_profile, cfn_action=cfn_action,
+                        quiet=(ls_stacks and args.output != 'table'), offline=args.offline)
+
+    if args.stats:
+        client.api_stats.print_at_exit()
+
+    # keep the shell completion index of this region fresh
+    client.schedule_completion_refresh()
+
+    if ls_stacks and (args.ls_long or args.tags):
+        # one describe_stacks page per 100 stacks, with everything in it
+        tags = parse_tags(args.tags)
+        records = client.iter_stack_details(tags=tags)
+        if stack_name:
+            records = (r for r in records if r['StackName'] == stack_name)
+        if args.output != 'table':
+            from awscfnctl.output import RecordWriter
+            writer = RecordWriter(args.output, fields=parse_fields(args.fields))
+            writer.write_all(records)
+        else:
+            print_stack_details(records)
+
+    elif ls_stacks and args.output != 'table':
+        # StackName, StackId, StackStatus, CreationTime, LastUpdatedTime, TemplateDescription
+        from awscfnctl.output import RecordWriter
+        writer = RecordWriter(args.output, fields=parse_fields(args.fields))
+        records = client.iter_stacks(show_deleted=False)
+        if stack_name:
+            records = (r for r in records if r['StackName'] == stack_name)
+        writer.write_all(records)
 
-    if ls_stacks and stack_name:
-        stacks = client.ls_stacks(show_deleted=False)
-        for stack, i in sorted(stacks.items()):
-            if stack_name == stack:
-                client.get_stack_info(stack_name=stack_name)
+    elif ls_stacks and stack_name:
+        client.get_stack_info(stack_name=stack_name)
 
     elif ls_all_stack_info or ls_stacks:
         if ls_all_stack_info and ls_stacks:
@@ -184,6 +336,18 @@ def main():
         client.del_stack(stack_name, no_prompt=no_prompt)
     elif build_param_file:
         client.build_cfn_param('default', template, cli_template=template)
+    elif take_snapshot:
+        from awscfnctl.offline import InventorySnapshot
+        from awscfnctl.offline import snapshot_path
+        inventory = InventorySnapshot(snapshot_path(client.cfn_param_file_dir, client.aws_profile, client.region))
+        templates = list()
+        if template and client.url_check(template):
+            templates.append(template)
+        elif template:
+            print('Local template {0} is read from disk by build, it is not saved'.format(template))
+        inventory.capture(client, templates=templates)
+        inventory.save()
+        print('Saved {0} to {1}'.format(inventory.summary(), inventory.path))
     elif param_file or stack_name:
         raise ValueError(errmsg_cr)
     else:
@@ -0,0 +1,184 @@
+#
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file
+# except in compliance with the License. A copy of the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+
+import copy
+import json
+import threading
+
+
+# operations that only read, identical ones in flight at the same time can share one call
+READ_PREFIXES = ('Describe', 'List', 'Get')
+
+
+class _Flight:
+
+    __slots__ = ('done', 'response', 'exception', 'waiters')
+
+    def __init__(self):
+
+        self.done = threading.Event()
+        self.response = None
+        self.exception = None
+        self.waiters = 0
+
+
+class CallCoalescer:
+
+    def __init__(self, prefixes=READ_PREFIXES, wait_timeout=300.0):
+
+        """
+        Collapses identical read calls (same region, operation and parameters) that are in flight
+        at the same time into one.  The first caller makes the call, the others wait for it and
+        each get their own copy of its response, or the same error.  Calls made one after the
+        other are not affected, this only removes the duplicates made by threads working at once.
+
+        Register it on every client that should share calls, clients of different credentials
+        (accounts) need their own CallCoalescer.
+
+        :param prefixes:  operation name prefixes that are safe to share
+        :param wait_timeout:  seconds a caller waits for the shared call before making its own
+        """
+
+        self.prefixes = tuple(prefixes)
+        self.wait_timeout = wait_timeout
+        self.lock = threading.Lock()
+        self.in_flight = dict()
+        self.shared = 0
+        # the flights each thread's current call leads, see register()
+        self.leading = threading.local()
+
+    def led_flights(self):
+
+        flights = getattr(self.leading, 'flights', None)
+        if flights is None:
+            flights = self.leading.flights = list()
+
+        return flights
+
+    def abandon(self, key, flight):
+        """
+        end a flight whose call failed before it was sent or answered, e.g. a before-call handler
+        after this one raised, the callers waiting for it make their own calls
+        """
+
+        with self.lock:
+            if self.in_flight.get(key) is not flight:
+                # finished normally
+                return
+            del self.in_flight[key]
+        flight.done.set()
+
+    @staticmethod
+    def request_key(region, model, params):
+
+        request = [params.get('method'), params.get('url_path'), params.get('query_string'), params.get('body')]
+
+        return region, model.service_model.service_name, model.name, json.dumps(request, sort_keys=True,
+                                                                                 default=repr)
+
+    def register(self, client):
+        """
+        share the read calls of a client with the other clients registered here
+
+        :param client:  boto3 client
+        :return:  the client
+        """
+
+        region = client.meta.region_name
+        events = client.meta.events
+
+        def before_call(model, params, context, **kwargs):
+            if not model.name.startswith(self.prefixes):
+                return None
+
+            key = self.request_key(region, model, params)
+
+            with self.lock:
+                flight = self.in_flight.get(key)
+                if flight is None:
+                    flight = self.in_flight[key] = _Flight()
+                    context['awscfnctl_coalesce_key'] = key
+                    self.led_flights().append((key, flight))
+                    return None
+                flight.waiters += 1
+
+            if not flight.done.wait(self.wait_timeout):
+                # the first call never finished, e.g. it failed before it was sent
+                with self.lock:
+                    if self.in_flight.get(key) is flight:
+                        del self.in_flight[key]
+                return None
+
+            if flight.response is None and flight.exception is None:
+                # abandoned by the first caller
+                return None
+
+            with self.lock:
+                self.shared += 1
+            # ApiStats counts this as a shared call, not an API call
+            context['awscfnctl_coalesced'] = True
+
+            if flight.exception is not None:
+                raise flight.exception
+
+            http, parsed = flight.response
+            return http, copy.deepcopy(parsed)
+
+        def finish(context, response=None, exception=None):
+            key = context.get('awscfnctl_coalesce_key')
+            if key is None:
+                return
+
+            with self.lock:
+                flight = self.in_flight.pop(key, None)
+            if flight is None:
+                return
+
+            if response is not None and flight.waiters:
+                # the first caller gets the response itself and may change it
+                response = (response[0], copy.deepcopy(response[1]))
+            flight.response = response
+            flight.exception = exception
+            flight.done.set()
+
+        def after_call(http_response, parsed, context, **kwargs):
+            finish(context, response=(http_response, parsed))
+
+        def after_call_error(exception, context, **kwargs):
+            finish(context, exception=exception)
+
+        # a before-call handler that raises skips after-call and after-call-error, so the flights
+        # a call leads are also ended when it returns or raises
+        make_api_call = client._make_api_call
+
+        def make_api_call_once(operation_name, api_params):
+            led = self.led_flights()
+            mark = len(led)
+            try:
+                return make_api_call(operation_name, api_params)
+            finally:
+                for key, flight in led[mark:]:
+                    self.abandon(key, flight)
+                del led[mark:]
+
+        if not getattr(client, '_awscfnctl_coalesced', False):
+            client._make_api_call = make_api_call_once
+            client._awscfnctl_coalesced = True
+
+        # ahead of any handler that answers the call itself
+        events.register_first('before-call', before_call, unique_id='awscfnctl-coalesce-before-call')
+        events.register('after-call', after_call, unique_id='awscfnctl-coalesce-after-call')
+        events.register('after-call-error', after_call_error, unique_id='awscfnctl-coalesce-after-call-error')
+
+        return client
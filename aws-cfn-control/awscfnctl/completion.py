@@ -0,0 +1,507 @@
+#!/usr/bin/env python
+
+#
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file
+# except in compliance with the License. A copy of the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+"""
+Shell completion of stack names, ASG names, regions, profiles and parameters files
+
+  python -m awscfnctl.completion refresh -r us-east-1    # build the first index
+  eval "$(python -m awscfnctl.completion script)"        # in ~/.bashrc, --shell zsh for zsh
+  asgctl status -n clu<TAB>
+
+The names are read from a local index, one plain text file per profile, region and kind under
+~/.cfnparam/.cache/complete/<profile>/<region>/, and matched by the shell itself, so completing
+doesn't start Python or call AWS however many stacks there are.  Parameters files are listed from
+~/.cfnparam when completing.
+
+Once the index directory exists, every command that talks to a region starts a background
+refresh of that region when it ends, if the region's index is older than DEFAULT_MAX_AGE.
+"""
+
+import os
+import sys
+import time
+import atexit
+import argparse
+import threading
+
+progname = 'completion'
+
+# seconds before a command refreshes the index of its region again
+DEFAULT_MAX_AGE = 300
+
+# seconds after which the lock of a refresh that never finished is ignored
+LOCK_MAX_AGE = 600
+
+# the kinds of names kept in the index, each one is a file in the region directory
+INDEX_KINDS = ['stacks', 'asgs', 'key-pairs']
+
+# when the region was last refreshed (or a refresh of it was started)
+STAMP_FILE = '.refreshed'
+LOCK_FILE = '.refreshing'
+
+# the region of a profile when a command doesn't say, from the AWS config
+DEFAULT_REGION_FILE = 'default-region'
+
+# command -> option -> what its value completes to
+COMPLETIONS = {
+    'cfnctl': {'-n': 'stacks', '-f': 'param-files', '-r': 'regions', '-p': 'profiles'},
+    'asgctl': {'-n': 'stacks', '-a': 'asgs', '-r': 'regions'},
+    'get_asg_from_stack': {'-s': 'stacks', '-r': 'regions'},
+    'get_inst_from_asg': {'-a': 'asgs', '-r': 'regions'},
+    'get_priv_dns_asg': {'-a': 'asgs', '-r': 'regions'},
+    'getec2keys': {'-r': 'regions'},
+    'getinstinfo': {'-a': 'asgs', '-r': 'regions'},
+    'getnetinfo': {'-r': 'regions'},
+    'getstackinfo': {'-s': 'stacks', '-p': 'stacks', '-r': 'regions'},
+    'getstacktopo': {'-n': 'stacks', '-r': 'regions'},
+}
+
+# command -> the actions its first argument completes to
+ACTIONS = {
+    'cfnctl': ['build', 'create', 'list', 'delete', 'snapshot'],
+    'asgctl': ['status', 'enter-stby', 'exit-stby', 'stop', 'start', 'restart'],
+}
+
+# the other commands always use the "default" profile
+PROFILE_OPTIONS = {'cfnctl': '-p'}
+
+BASH_SCRIPT = r'''# awscfnctl completion, from "python -m awscfnctl.completion script"
+_awscfnctl_index="$HOME/.cfnparam/.cache/complete"
+
+_awscfnctl_lines() {{
+    # the lines of file $1 that start with $2
+    [ -f "$1" ] && awk -v p="$2" 'index($0, p) == 1' "$1"
+}}
+
+_awscfnctl_complete() {{
+    local cur prev cmd profile=default region= kind= i
+    cur="${{COMP_WORDS[COMP_CWORD]}}"
+    prev="${{COMP_WORDS[COMP_CWORD-1]}}"
+    cmd="${{COMP_WORDS[0]##*/}}"
+    COMPREPLY=()
+
+    for ((i = 1; i < COMP_CWORD - 1; i++)); do
+        case "$cmd:${{COMP_WORDS[i]}}" in
+            *:-r) region="${{COMP_WORDS[i+1]}}" ;;
+{profile_cases}
+        esac
+    done
+    [ -z "$region" ] && region="$AWS_DEFAULT_REGION"
+    [ -z "$region" ] && [ -f "$_awscfnctl_index/$profile/{default_region_file}" ] && \
+        region="$(< "$_awscfnctl_index/$profile/{default_region_file}")"
+
+    case "$cmd:$prev" in
+{kind_cases}
+    esac
+
+    if [ -z "$kind" ] && [ "$COMP_CWORD" -eq 1 ]; then
+        case "$cmd" in
+{action_cases}
+        esac
+        return 0
+    fi
+
+    # names are split on new lines only, ASG names can have spaces
+    local IFS=$'\n'
+    case "$kind" in
+        stacks|asgs|key-pairs)
+            COMPREPLY=($(_awscfnctl_lines "$_awscfnctl_index/$profile/$region/$kind" "$cur")) ;;
+        regions)
+            COMPREPLY=($(cd "$_awscfnctl_index/$profile" 2>/dev/null && compgen -d -- "$cur")) ;;
+        profiles)
+            COMPREPLY=($(cd "$_awscfnctl_index" 2>/dev/null && compgen -d -- "$cur")) ;;
+        param-files)
+            COMPREPLY=($(cd "$HOME/.cfnparam" 2>/dev/null && compgen -f -X '.*' -- "$cur")) ;;
+    esac
+
+    # only file names are completed as a fallback, not in place of a name that isn't in the index
+    if [ -n "$kind" ] && [ "$kind" != param-files ]; then
+        compopt +o default 2>/dev/null
+    fi
+    return 0
+}}
+
+complete -o default -F _awscfnctl_complete {commands}
+'''
+
+# zsh runs the bash completion through its bashcompinit
+ZSH_PREAMBLE = 'autoload -U +X bashcompinit && bashcompinit\n'
+
+# (cfnctl param dir, profile) -> regions to refresh when this process ends
+_pending = dict()
+_pending_lock = threading.Lock()
+
+
+def index_root(cfn_param_dir):
+
+    return os.path.join(cfn_param_dir, '.cache', 'complete')
+
+
+def index_path(cfn_param_dir, profile, region):
+    """
+    returns the index directory of a profile and region, e.g. ~/.cfnparam/.cache/complete/default/us-east-1
+    """
+
+    return os.path.join(index_root(cfn_param_dir), profile or 'default', region)
+
+
+def shell_script(shell='bash'):
+    """
+    returns the completion script for bash or zsh
+    """
+
+    kinds = dict()
+    for command in sorted(COMPLETIONS):
+        for option, kind in sorted(COMPLETIONS[command].items()):
+            kinds.setdefault(kind, list()).append('{0}:{1}'.format(command, option))
+
+    kind_cases = ['        {0}) kind={1} ;;'.format('|'.join(p), k) for k, p in sorted(kinds.items())]
+    profile_cases = ['            {0}:{1}) profile="${{COMP_WORDS[i+1]}}" ;;'.format(c, o)
+                     for c, o in sorted(PROFILE_OPTIONS.items())]
+    action_cases = ['            {0}) COMPREPLY=($(compgen -W "{1}" -- "$cur")) ;;'.format(c, ' '.join(a))
+                    for c, a in sorted(ACTIONS.items())]
+
+    script = BASH_SCRIPT.format(profile_cases='\n'.join(profile_cases), kind_cases='\n'.join(kind_cases),
+                                action_cases='\n'.join(action_cases), default_region_file=DEFAULT_REGION_FILE,
+                                commands=' '.join(sorted(COMPLETIONS)))
+
+    if shell == 'zsh':
+        script = ZSH_PREAMBLE + script
+    elif shell != 'bash':
+        raise ValueError('Unsupported shell "{0}", use bash or zsh'.format(shell))
+
+    return script
+
+
+def read_names(path):
+    """
+    returns list() of the names in an index file, an empty list if there is none
+    """
+
+    try:
+        with open(path) as f:
+            return [line.rstrip('\n') for line in f if line.strip()]
+    except (IOError, OSError):
+        return list()
+
+
+def default_region(cfn_param_dir, profile):
+    """
+    returns the region completion uses when the command line doesn't give one, like the shell script
+    """
+
+    region = os.environ.get('AWS_DEFAULT_REGION')
+    if not region:
+        names = read_names(os.path.join(index_root(cfn_param_dir), profile, DEFAULT_REGION_FILE))
+        region = names[0] if names else None
+
+    if not region:
+        raise ValueError('No region given (-r) and no default region in the index')
+
+    return region
+
+
+def write_names(path, names):
+    """
+    replace an index file, sorted, one name per line
+    """
+
+    tmp = '{0}.{1}.tmp'.format(path, os.getpid())
+    with open(tmp, 'w') as f:
+        for name in sorted(set(names)):
+            f.write(name + '\n')
+    os.replace(tmp, path)
+
+
+def update_names(cfn_param_dir, profile, region, kind, add=None, remove=None):
+    """
+    add or remove a name in an index file that already exists, e.g. the stack a command just
+    created, so it completes before the next refresh
+    """
+
+    path = os.path.join(index_path(cfn_param_dir, profile, region), kind)
+    if not os.path.isfile(path):
+        return
+
+    names = set(read_names(path))
+    if add:
+        names.add(add)
+    names.discard(remove)
+
+    try:
+        write_names(path, names)
+    except (IOError, OSError):
+        pass
+
+
+def index_age(directory):
+    """
+    returns seconds since the index in directory was refreshed, None if it never was
+    """
+
+    try:
+        return time.time() - os.stat(os.path.join(directory, STAMP_FILE)).st_mtime
+    except OSError:
+        return None
+
+
+def touch(path):
+
+    with open(path, 'a'):
+        pass
+    os.utime(path, None)
+
+
+def schedule_refresh(cfn_param_dir, profile, region, max_age=DEFAULT_MAX_AGE):
+    """
+    refresh the index of a region in the background when this process ends, if completion is set
+    up (the index directory exists) and the region's index is older than max_age seconds
+
+    :param cfn_param_dir:  cfnctl parameters directory, ~/.cfnparam
+    :param profile:  AWS profile name
+    :param region:  region name
+    """
+
+    if not os.path.isdir(index_root(cfn_param_dir)):
+        return
+
+    age = index_age(index_path(cfn_param_dir, profile, region))
+    if age is not None and age < max_age:
+        return
+
+    with _pending_lock:
+        if not _pending:
+            atexit.register(refresh_pending)
+        _pending.setdefault((cfn_param_dir, profile or 'default'), set()).add(region)
+
+
+def refresh_pending():
+    """
+    start one background refresh per profile for the regions that schedule_refresh() collected
+    """
+
+    import subprocess
+
+    with _pending_lock:
+        pending = dict(_pending)
+        _pending.clear()
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([os.path.dirname(os.path.dirname(os.path.abspath(__file__)))] +
+                                        [p for p in [env.get('PYTHONPATH')] if p])
+
+    for (cfn_param_dir, profile), regions in sorted(pending.items()):
+        command = [sys.executable, '-m', 'awscfnctl.completion', 'refresh', '-p', profile,
+                   '--dir', cfn_param_dir]
+        for region in sorted(regions):
+            directory = index_path(cfn_param_dir, profile, region)
+            try:
+                if not os.path.isdir(directory):
+                    os.makedirs(directory)
+                # so the commands that end before this refresh does don't start another one
+                touch(os.path.join(directory, STAMP_FILE))
+            except OSError:
+                continue
+            command.extend(['-r', region])
+
+        if '-r' not in command:
+            continue
+
+        try:
+            with open(os.path.join(index_root(cfn_param_dir), 'refresh.log'), 'a') as log:
+                subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=log, stderr=log, env=env,
+                                 start_new_session=True)
+        except OSError:
+            pass
+
+
+def refresh_index(session, directory, region):
+    """
+    read the stack names, ASG names and key pairs of a region into its index, a kind that can't
+    be read keeps the names it had
+
+    :param session:  boto3 session
+    :param directory:  index directory of the region, see index_path()
+    :param region:  region name
+    :return:  dictionary of kind -> number of names, for the kinds that were read
+    """
+
+    from botocore.config import Config
+    from botocore.exceptions import BotoCoreError
+    from botocore.exceptions import ClientError
+
+    config = Config(retries={'max_attempts': 10, 'mode': 'standard'})
+    client_cfn = session.client('cloudformation', region_name=region, config=config)
+    client_asg = session.client('autoscaling', region_name=region, config=config)
+    client_ec2 = session.client('ec2', region_name=region, config=config)
+
+    def stacks():
+        names = list()
+        for page in client_cfn.get_paginator('list_stacks').paginate():
+            names.extend(s['StackName'] for s in page['StackSummaries'] if s['StackStatus'] != 'DELETE_COMPLETE')
+        return names
+
+    def asgs():
+        names = list()
+        for page in client_asg.get_paginator('describe_auto_scaling_groups').paginate(
+                PaginationConfig={'PageSize': 100}):
+            names.extend(a['AutoScalingGroupName'] for a in page['AutoScalingGroups'])
+        return names
+
+    def key_pairs():
+        return [k['KeyName'] for k in client_ec2.describe_key_pairs()['KeyPairs']]
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    counts = dict()
+    for kind, func in zip(INDEX_KINDS, [stacks, asgs, key_pairs]):
+        try:
+            names = func()
+        except (BotoCoreError, ClientError) as e:
+            print('{0} {1}: {2}'.format(region, kind, e), file=sys.stderr)
+            continue
+        write_names(os.path.join(directory, kind), names)
+        counts[kind] = len(names)
+
+    touch(os.path.join(directory, STAMP_FILE))
+
+    return counts
+
+
+def acquire_lock(directory):
+    """
+    returns True if this process may refresh directory, False if another refresh is running
+    """
+
+    path = os.path.join(directory, LOCK_FILE)
+
+    try:
+        if time.time() - os.stat(path).st_mtime > LOCK_MAX_AGE:
+            os.unlink(path)
+    except OSError:
+        pass
+
+    try:
+        os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except OSError:
+        return False
+
+    return True
+
+
+def refresh(cfn_param_dir, profile, regions, session=None):
+    """
+    refresh the index of each region, one at a time
+
+    :param regions:  list() of region names, the profile's default region if empty
+    :param session:  boto3 session, one of profile if not given
+    :return:  dictionary of region -> dictionary of kind -> number of names
+    """
+
+    if session is None:
+        import boto3
+        from botocore.exceptions import ProfileNotFound
+        try:
+            session = boto3.session.Session(profile_name=profile)
+        except ProfileNotFound as e:
+            raise ValueError(e)
+
+    profile_dir = os.path.join(index_root(cfn_param_dir), profile)
+    if not os.path.isdir(profile_dir):
+        os.makedirs(profile_dir)
+
+    if session.region_name and not os.environ.get('AWS_DEFAULT_REGION'):
+        write_names(os.path.join(profile_dir, DEFAULT_REGION_FILE), [session.region_name])
+
+    regions = list(regions or list())
+    if not regions:
+        if not session.region_name:
+            errmsg = "Must specify a region, either at the command (-r) or in your AWS CLI config"
+            raise ValueError(errmsg)
+        regions = [session.region_name]
+
+    results = dict()
+    for region in regions:
+        directory = index_path(cfn_param_dir, profile, region)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        if not acquire_lock(directory):
+            print('{0}: already being refreshed'.format(region), file=sys.stderr)
+            continue
+        try:
+            results[region] = refresh_index(session, directory, region)
+        finally:
+            os.unlink(os.path.join(directory, LOCK_FILE))
+
+    return results
+
+
+def arg_parse():
+
+    parser = argparse.ArgumentParser(prog=progname, description='Shell completion of stack names, ASG names, '
+                                                                'regions, profiles and parameters files')
+
+    opt_group = parser.add_argument_group('optional arguments')
+    opt_group.add_argument('-r', dest='region', action='append', required=False,
+                           help='Region name, can be repeated (default the region of the profile)')
+    opt_group.add_argument('-p', dest='aws_profile', default='default', required=False,
+                           help='AWS Profile (default "default")')
+    opt_group.add_argument('-k', dest='kind', choices=INDEX_KINDS, default='stacks', required=False,
+                           help='list: the names to print (default stacks)')
+    opt_group.add_argument('--shell', dest='shell', choices=['bash', 'zsh'], default='bash', required=False,
+                           help='script: the shell (default bash)')
+    opt_group.add_argument('--dir', dest='cfn_param_dir', required=False,
+                           help='cfnctl parameters directory (default ~/.cfnparam)')
+
+    req_group = parser.add_argument_group('required arguments')
+    req_group.add_argument('action', choices=['script', 'refresh', 'list'],
+                           help='print the completion script, refresh the index now, or print the indexed names')
+
+    return parser.parse_args()
+
+
+def main():
+
+    rc = 0
+
+    args = arg_parse()
+
+    cfn_param_dir = args.cfn_param_dir or os.path.join(os.path.expanduser('~'), '.cfnparam')
+
+    if args.action == 'script':
+        sys.stdout.write(shell_script(args.shell))
+
+    elif args.action == 'refresh':
+        for region, counts in sorted(refresh(cfn_param_dir, args.aws_profile, args.region).items()):
+            print('{0}: {1}'.format(region, ', '.join('{0} {1}'.format(counts[k], k) for k in INDEX_KINDS
+                                                      if k in counts) or 'nothing read'))
+
+    elif args.action == 'list':
+        for region in (args.region or [default_region(cfn_param_dir, args.aws_profile)]):
+            for name in read_names(os.path.join(index_path(cfn_param_dir, args.aws_profile, region), args.kind)):
+                print(name)
+
+    return rc
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print('\nReceived Keyboard interrupt.')
+        print('Exiting...')
+    except ValueError as e:
+        print('ERROR: {0}'.format(e))
@@ -0,0 +1,821 @@
+#!/usr/bin/env python
+
+#
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file
+# except in compliance with the License. A copy of the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+"""
+Optional local daemon that runs the awscfnctl commands in one long running process
+
+  python -m awscfnctl.daemon start
+  export AWSCFNCTL_DAEMON=1
+  cfnctl list                      # run by the daemon
+  python -m awscfnctl.daemon status
+  python -m awscfnctl.daemon stop
+
+Each command still starts its own interpreter, but only to parse nothing heavier than its
+arguments: with AWSCFNCTL_DAEMON set, it sends its command line, working directory and AWS
+environment variables over a Unix socket and prints what comes back.  The daemon has boto3 and
+the commands imported, the service models loaded and the credentials of each profile resolved,
+and keeps the in-process caches (stack resources, rate limits) from one command to the next.  The
+connections to each AWS endpoint are reused, and for WARM_CACHE_TTL seconds so are the credential
+check and the key pairs that every CfnControl starts with; S3 templates are only read again if
+their ETag changed.
+
+The daemon runs one command at a time, in its main thread.  A command that arrives while another
+is running, or when the daemon isn't running or was started from older code, runs in its own
+process as if there were no daemon.  Prompts (input()) are answered by the calling terminal.
+"""
+
+import os
+import sys
+import json
+import glob
+import time
+import socket
+import argparse
+import threading
+import contextlib
+
+progname = 'daemon'
+
+# set to use the daemon, e.g. AWSCFNCTL_DAEMON=1
+DAEMON_ENV = 'AWSCFNCTL_DAEMON'
+
+# socket path, default ~/.cfnparam/.cache/daemon.sock
+DAEMON_SOCKET_ENV = 'AWSCFNCTL_DAEMON_SOCKET'
+
+# seconds without a command before the daemon exits
+DEFAULT_IDLE_TIMEOUT = 3600
+
+# seconds the commands run by the daemon reuse the credential check and key pairs of an earlier
+# command, see CfnControl.warm_cache_ttl
+WARM_CACHE_TTL = 300
+
+# seconds a client has to send its request, so one that connects and says nothing doesn't hold
+# up the others
+REQUEST_TIMEOUT = 10
+
+# environment variables that change how connections are made: proxies and CA certificates
+CONNECTION_ENV = [
+    'HTTPS_PROXY', 'HTTP_PROXY', 'NO_PROXY', 'https_proxy', 'http_proxy', 'no_proxy',
+    'REQUESTS_CA_BUNDLE', 'SSL_CERT_FILE', 'AWS_CA_BUNDLE',
+]
+
+# environment variables the caller passes to the daemon, for the time of its command
+FORWARDED_ENV = ['HOME'] + CONNECTION_ENV
+FORWARDED_ENV_PREFIXES = ['AWS']
+
+# set while commands must run in this process: in the daemon itself, or when recording a cassette
+_in_process = False
+
+
+def socket_path():
+
+    path = os.environ.get(DAEMON_SOCKET_ENV)
+    if not path:
+        path = os.path.join(os.path.expanduser('~'), '.cfnparam', '.cache', 'daemon.sock')
+
+    return path
+
+
+def code_stamp():
+    """
+    returns the newest modification time of the awscfnctl modules, a daemon with another stamp
+    was started from other code
+    """
+
+    return max(os.stat(p).st_mtime for p in glob.glob(os.path.join(os.path.dirname(__file__), '*.py')))
+
+
+def connection_env():
+    """
+    returns tuple() of the CONNECTION_ENV variables that are set, with their values
+    """
+
+    return tuple((k, os.environ[k]) for k in CONNECTION_ENV if k in os.environ)
+
+
+def forwarded_env():
+
+    return dict((k, v) for k, v in os.environ.items()
+                if k in FORWARDED_ENV or any(k.startswith(p) for p in FORWARDED_ENV_PREFIXES))
+
+
+@contextlib.contextmanager
+def in_process():
+    """
+    run_in_daemon() returns None inside this block, so the commands run in this process
+    """
+
+    global _in_process
+
+    saved = _in_process
+    _in_process = True
+    try:
+        yield
+    finally:
+        _in_process = saved
+
+
+def send_message(f, message):
+
+    f.write(json.dumps(message) + '\n')
+    f.flush()
+
+
+def hang_up(conn, f):
+    """
+    close a connection, whatever the caller did to it
+    """
+
+    try:
+        f.close()
+    except OSError:
+        # the unsent rest of a reply to a caller that went away
+        pass
+    conn.close()
+
+
+def connect(path=None, timeout=None):
+    """
+    returns a connected socket, or None if no daemon is listening
+    """
+
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path or socket_path())
+    except OSError:
+        sock.close()
+        return None
+
+    return sock
+
+
+def request(message, path=None, timeout=5.0):
+    """
+    send one control message (ping, stop) and return the reply, or None if no daemon is listening
+    """
+
+    sock = connect(path, timeout=timeout)
+    if sock is None:
+        return None
+
+    with sock, sock.makefile('rw', encoding='utf-8', newline='\n') as f:
+        send_message(f, message)
+        line = f.readline()
+
+    return json.loads(line) if line else None
+
+
+def run_in_daemon(command):
+    """
+    run this process's command line in the daemon, if AWSCFNCTL_DAEMON is set and it is running
+
+    :param command:  command name, e.g. cfnctl, the arguments are taken from sys.argv
+    :return:  exit code of the command, or None if it has to run in this process
+    """
+
+    if _in_process or os.environ.get(DAEMON_ENV, '') in ('', '0'):
+        return None
+
+    sock = connect()
+    if sock is None:
+        return None
+
+    started = False
+    with sock, sock.makefile('rw', encoding='utf-8', newline='\n') as f:
+        try:
+            send_message(f, {
+                'argv': [command] + sys.argv[1:],
+                'cwd': os.getcwd(),
+                'env': forwarded_env(),
+                'tty': sys.stdout.isatty(),
+                'stamp': code_stamp(),
+            })
+
+            for line in f:
+                message = json.loads(line)
+                if 'out' in message:
+                    sys.stdout.write(message['out'])
+                    sys.stdout.flush()
+                elif 'err' in message:
+                    sys.stderr.write(message['err'])
+                    sys.stderr.flush()
+                elif 'input' in message:
+                    try:
+                        send_message(f, {'line': input(message['input'])})
+                    except EOFError:
+                        send_message(f, {'eof': True})
+                elif 'started' in message:
+                    started = True
+                elif 'rc' in message:
+                    return message['rc']
+                elif 'fallback' in message:
+                    return None
+        except OSError:
+            pass
+
+    if not started:
+        return None
+
+    # the command may have done part of its work, running it again here could do it twice
+    print('ERROR: lost the connection to the awscfnctl daemon while it ran the command', file=sys.stderr)
+
+    return 1
+
+
+class WarmSessions:
+
+    def __init__(self):
+
+        """
+        Session factory for CfnControl.session_factory that makes new sessions cheap: every
+        session shares one loader, so the service models are read once, and the credentials of
+        each profile (and set of AWS_* variables and config files) are kept, see CachedCredentials.
+        The clients of every session to the same endpoint share one connection pool, so a command
+        reuses the connections (and TLS sessions) of the ones before it.  Each session still has its
+        own events, so the hooks of one command never see another's calls.
+        """
+
+        self.lock = threading.Lock()
+        self.loader = None
+        self.credentials = dict()
+        self.http_sessions = dict()
+
+    def __call__(self, profile_name=None):
+
+        import boto3
+        import botocore.session
+
+        core = botocore.session.Session(profile=profile_name)
+
+        with self.lock:
+            if self.loader is None:
+                self.loader = core.get_component('data_loader')
+            else:
+                core.register_component('data_loader', self.loader)
+
+            key = (profile_name, tuple(sorted((k, v) for k, v in os.environ.items() if k.startswith('AWS'))),
+                   connection_env(), config_files())
+            if key not in self.credentials:
+                self.credentials[key] = CachedCredentials()
+            cached = self.credentials[key]
+            cached.use(core.get_component('credential_provider'))
+            core.register_component('credential_provider', cached)
+
+        # credentials that AWS turned down are resolved again by the next command
+        core.register('after-call', cached.check_response)
+
+        session = boto3.session.Session(botocore_session=core)
+
+        # resources make their clients with session.client() too
+        make_client = session.client
+
+        def client(*args, **kwargs):
+            return self.share_connections(make_client(*args, **kwargs))
+
+        session.client = client
+
+        # boto3 adds its resource models to the loader's search path for each session
+        with self.lock:
+            paths = self.loader.search_paths
+            paths[:] = [p for n, p in enumerate(paths) if p not in paths[:n]]
+
+        return session
+
+    def share_connections(self, client):
+        """
+        give a client the connection pool of the earlier clients to its endpoint
+        """
+
+        endpoint = client._endpoint
+        key = (endpoint.host, client.meta.config.max_pool_connections, connection_env())
+
+        with self.lock:
+            endpoint.http_session = self.http_sessions.setdefault(key, endpoint.http_session)
+
+        return client
+
+    def forget_credentials(self):
+
+        with self.lock:
+            for cached in self.credentials.values():
+                cached.forget()
+
+
+def config_files():
+    """
+    returns tuple() of the AWS config and credentials file names
+    """
+
+    return (os.path.expanduser(os.environ.get('AWS_CONFIG_FILE') or os.path.join('~', '.aws', 'config')),
+            os.path.expanduser(os.environ.get('AWS_SHARED_CREDENTIALS_FILE') or
+                               os.path.join('~', '.aws', 'credentials')))
+
+
+def config_stamp():
+    """
+    returns the modification times of the AWS config and credentials files, None for a missing one
+    """
+
+    stamp = list()
+    for path in config_files():
+        try:
+            stamp.append(os.stat(path).st_mtime)
+        except OSError:
+            stamp.append(None)
+
+    return tuple(stamp)
+
+
+# errors that mean the credentials are missing, expired or no longer valid
+CREDENTIAL_ERRORS = ['ExpiredToken', 'ExpiredTokenException', 'RequestExpired', 'InvalidClientTokenId',
+                     'UnrecognizedClientException', 'AuthFailure']
+
+
+class CachedCredentials:
+
+    def __init__(self):
+
+        """
+        Credential provider that keeps what was resolved from one command to the next.
+        Refreshable credentials (e.g. an assumed role) are kept, they refresh themselves.  Static
+        ones are kept until the AWS config or credentials file changes, and no credentials at all
+        are never kept, so keys added or rotated in the files are picked up by the next command.
+        """
+
+        self.lock = threading.Lock()
+        self.resolver = None
+        self.credentials = None
+        self.stamp = None
+
+    def use(self, resolver):
+        """
+        resolve with this botocore credential resolver, the one of the newest session, from now on
+        """
+
+        with self.lock:
+            self.resolver = resolver
+
+    def load_credentials(self):
+
+        from botocore.credentials import RefreshableCredentials
+
+        with self.lock:
+            stamp = config_stamp()
+            if self.credentials is not None and not isinstance(self.credentials, RefreshableCredentials) \
+                    and stamp != self.stamp:
+                self.credentials = None
+            if self.credentials is None:
+                self.credentials = self.resolver.load_credentials()
+                self.stamp = stamp
+
+            return self.credentials
+
+    def forget(self):
+
+        with self.lock:
+            self.credentials = None
+
+    def check_response(self, parsed=None, **kwargs):
+
+        if parsed and parsed.get('Error', dict()).get('Code') in CREDENTIAL_ERRORS:
+            self.forget()
+
+
+class _Channel:
+
+    def __init__(self, conn, f):
+
+        self.conn = conn
+        self.f = f
+        self.lock = threading.Lock()
+        self.closed = False
+        self.running = False
+
+    def send(self, message):
+
+        with self.lock:
+            if self.closed:
+                return
+            try:
+                send_message(self.f, message)
+            except OSError:
+                self.closed = True
+                # the caller is gone (e.g. Ctrl-C), stop its command the same way
+                if self.running:
+                    import _thread
+                    _thread.interrupt_main()
+
+    def receive(self):
+
+        line = self.f.readline()
+
+        return json.loads(line) if line else None
+
+
+class _Stream:
+
+    def __init__(self, channel, name, tty):
+
+        """
+        stdout or stderr of a command run by the daemon, sent to the caller a line at a time
+        """
+
+        self.channel = channel
+        self.name = name
+        self.tty = tty
+        self.lock = threading.Lock()
+        self.buffer = ''
+
+    def write(self, s):
+
+        with self.lock:
+            self.buffer += s
+            if '\n' not in s and len(self.buffer) < 8192:
+                return len(s)
+            data, self.buffer = self.buffer, ''
+        self.channel.send({self.name: data})
+
+        return len(s)
+
+    def flush(self):
+
+        with self.lock:
+            data, self.buffer = self.buffer, ''
+        if data:
+            self.channel.send({self.name: data})
+
+    def isatty(self):
+
+        return self.tty
+
+    @property
+    def encoding(self):
+
+        return 'utf-8'
+
+
+class Daemon:
+
+    def __init__(self, path=None, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+
+        """
+        Serves commands on a Unix socket, see the module documentation
+
+        :param path:  socket path
+        :param idle_timeout:  seconds without a command before serve() returns
+        """
+
+        self.path = path or socket_path()
+        self.idle_timeout = idle_timeout
+        self.stamp = code_stamp()
+        self.started = time.time()
+        self.served = 0
+        self.fallbacks = 0
+
+        self.lock = threading.Lock()
+        self.pending = None
+        self.busy = False
+        self.ready = threading.Condition(self.lock)
+        self.stopping = False
+        self.sessions = WarmSessions()
+        self.server = None
+
+    def warm_up(self):
+        """
+        import the commands and boto3, and load the service models they use
+        """
+
+        import importlib
+        from .awscfnctl import CfnControl
+        from .cassette import COMMANDS
+
+        for command in COMMANDS:
+            importlib.import_module('awscfnctl.{0}'.format(command))
+
+        if CfnControl.session_factory is None:
+            CfnControl.session_factory = self.sessions
+        if not CfnControl.warm_cache_ttl:
+            CfnControl.warm_cache_ttl = WARM_CACHE_TTL
+
+        session = self.sessions()
+        for service in ['cloudformation', 'ec2', 'autoscaling', 's3']:
+            session.client(service, region_name=session.region_name or 'us-east-1')
+
+    def status(self):
+
+        return {
+            'pid': os.getpid(),
+            'started': self.started,
+            'served': self.served,
+            'fallbacks': self.fallbacks,
+            'busy': self.busy,
+            'stamp': self.stamp,
+        }
+
+    def bind(self):
+
+        if os.path.exists(self.path):
+            if request({'ping': True}, self.path) is not None:
+                raise ValueError('A daemon is already listening on {0}'.format(self.path))
+            os.unlink(self.path)
+
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        # only this user may connect
+        saved_umask = os.umask(0o077)
+        try:
+            self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.server.bind(self.path)
+        finally:
+            os.umask(saved_umask)
+        self.server.listen(16)
+
+    def accept(self):
+        """
+        reads each caller's request on a thread of its own, so one that is slow to send it doesn't
+        hold up the others
+        """
+
+        while not self.stopping:
+            try:
+                conn, address = self.server.accept()
+            except OSError:
+                break
+
+            threading.Thread(target=self.answer, args=(conn,), name='awscfnctl-daemon-request',
+                             daemon=True).start()
+
+    def answer(self, conn):
+        """
+        answers a control message, or hands a command to the main thread when it is free
+        """
+
+        f = conn.makefile('rw', encoding='utf-8', newline='\n')
+        try:
+            # socket.timeout is an OSError
+            conn.settimeout(REQUEST_TIMEOUT)
+            line = f.readline()
+            message = json.loads(line) if line else dict()
+            conn.settimeout(None)
+        except (OSError, ValueError):
+            hang_up(conn, f)
+            return
+
+        reply = None
+        with self.lock:
+            if 'ping' in message:
+                reply = self.status()
+            elif 'stop' in message:
+                reply = {'stopping': True}
+                self.stopping = True
+            elif 'argv' not in message:
+                reply = {'fallback': 'unknown request'}
+            elif message.get('stamp') != self.stamp:
+                # the code changed since the daemon started, let the next command start a new one
+                reply = {'fallback': 'daemon started from other code'}
+                self.stopping = True
+            elif self.busy:
+                reply = {'fallback': 'busy'}
+                self.fallbacks += 1
+            else:
+                self.busy = True
+                self.pending = (conn, f, message)
+            self.ready.notify()
+
+        if reply is not None:
+            try:
+                send_message(f, reply)
+            except OSError:
+                pass
+            hang_up(conn, f)
+
+    def serve(self):
+        """
+        run commands until stopped or idle for idle_timeout seconds
+        """
+
+        self.bind()
+        self.warm_up()
+
+        threading.Thread(target=self.accept, name='awscfnctl-daemon-accept', daemon=True).start()
+
+        try:
+            with in_process():
+                while True:
+                    with self.lock:
+                        deadline = time.monotonic() + self.idle_timeout
+                        while self.pending is None and not self.stopping and time.monotonic() < deadline:
+                            self.ready.wait(deadline - time.monotonic())
+                        if self.stopping or self.pending is None:
+                            break
+                        conn, f, message = self.pending
+                        self.pending = None
+
+                    try:
+                        self.run(conn, f, message)
+                    except KeyboardInterrupt:
+                        # a caller that went away just as its command ended
+                        pass
+                    finally:
+                        hang_up(conn, f)
+                        with self.lock:
+                            self.busy = False
+                            self.served += 1
+        finally:
+            self.server.close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def run(self, conn, f, message):
+        """
+        run one command with the caller's working directory, environment, output and prompts
+        """
+
+        import atexit
+        import builtins
+        import traceback
+        import boto3
+        from botocore.exceptions import NoCredentialsError
+        from .cassette import run_command
+
+        channel = _Channel(conn, f)
+        out = _Stream(channel, 'out', message.get('tty', False))
+        err = _Stream(channel, 'err', message.get('tty', False))
+
+        def prompt(text=''):
+            out.flush()
+            channel.send({'input': str(text)})
+            reply = channel.receive()
+            if not reply or 'eof' in reply:
+                raise EOFError
+            return reply['line']
+
+        # what a command registers to run at exit (e.g. --stats) runs when it ends
+        exit_funcs = list()
+
+        def register(func, *args, **kwargs):
+            exit_funcs.append((func, args, kwargs))
+            return func
+
+        saved_env = dict(os.environ)
+        saved_cwd = os.getcwd()
+        saved = (sys.stdout, sys.stderr, builtins.input, atexit.register, boto3.DEFAULT_SESSION)
+
+        rc = 1
+        try:
+            for k in list(os.environ):
+                if k in FORWARDED_ENV or any(k.startswith(p) for p in FORWARDED_ENV_PREFIXES):
+                    del os.environ[k]
+            os.environ.update(message.get('env', dict()))
+            os.chdir(message.get('cwd', saved_cwd))
+
+            sys.stdout, sys.stderr = out, err
+            builtins.input = prompt
+            atexit.register = register
+            boto3.DEFAULT_SESSION = self.sessions()
+
+            channel.send({'started': True})
+            channel.running = True
+            try:
+                rc = run_command(message['argv'])
+            finally:
+                channel.running = False
+                for func, args, kwargs in reversed(exit_funcs):
+                    func(*args, **kwargs)
+        except KeyboardInterrupt:
+            rc = 130
+        except NoCredentialsError:
+            # e.g. credentials that were removed, the next command resolves them again
+            self.sessions.forget_credentials()
+            traceback.print_exc()
+        except Exception:
+            traceback.print_exc()
+        finally:
+            out.flush()
+            err.flush()
+            sys.stdout, sys.stderr, builtins.input, atexit.register, boto3.DEFAULT_SESSION = saved
+            os.chdir(saved_cwd)
+            os.environ.clear()
+            os.environ.update(saved_env)
+
+        channel.send({'rc': rc})
+
+
+def start(path=None, idle_timeout=DEFAULT_IDLE_TIMEOUT, timeout=30.0):
+    """
+    start a daemon in the background and wait until it answers
+
+    :return:  its status
+    """
+
+    import subprocess
+
+    path = path or socket_path()
+
+    status = request({'ping': True}, path)
+    if status is not None:
+        return status
+
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    env = dict(os.environ)
+    env.pop(DAEMON_ENV, None)
+    env['PYTHONPATH'] = os.pathsep.join([os.path.dirname(os.path.dirname(os.path.abspath(__file__)))] +
+                                        [p for p in [env.get('PYTHONPATH')] if p])
+
+    with open(path + '.log', 'a') as log:
+        subprocess.Popen([sys.executable, '-m', 'awscfnctl.daemon', 'serve', '--socket', path,
+                          '--idle-timeout', str(idle_timeout)], stdin=subprocess.DEVNULL, stdout=log, stderr=log,
+                         env=env, start_new_session=True)
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = request({'ping': True}, path)
+        if status is not None:
+            return status
+        time.sleep(0.05)
+
+    raise ValueError('The daemon did not start, see {0}.log'.format(path))
+
+
+def arg_parse():
+
+    parser = argparse.ArgumentParser(prog=progname, description='Run the awscfnctl commands in a long running '
+                                                                'local process, set {0}=1 to use it'.format(DAEMON_ENV))
+
+    opt_group = parser.add_argument_group('optional arguments')
+    opt_group.add_argument('--socket', dest='socket', required=False,
+                           help='Unix socket path (default ${0} or ~/.cfnparam/.cache/daemon.sock)'.format(
+                               DAEMON_SOCKET_ENV))
+    opt_group.add_argument('--idle-timeout', dest='idle_timeout', type=float, default=DEFAULT_IDLE_TIMEOUT,
+                           required=False, help='Exit after this many seconds without a command (default {0})'.format(
+                               DEFAULT_IDLE_TIMEOUT))
+
+    req_group = parser.add_argument_group('required arguments')
+    req_group.add_argument('action', choices=['start', 'stop', 'status', 'serve'],
+                           help='start in the background, stop, show status, or serve in the foreground')
+
+    return parser.parse_args()
+
+
+def print_status(status):
+
+    print('Daemon pid {0}, up {1:.0f}s, {2} commands run, {3} sent back to run in their own process{4}'.format(
+        status['pid'], time.time() - status['started'], status['served'], status['fallbacks'],
+        ', running a command' if status['busy'] else ''))
+
+
+def main():
+
+    rc = 0
+
+    args = arg_parse()
+    path = args.socket or socket_path()
+
+    if args.action == 'serve':
+        Daemon(path, idle_timeout=args.idle_timeout).serve()
+    elif args.action == 'start':
+        print_status(start(path, idle_timeout=args.idle_timeout))
+    elif args.action == 'stop':
+        if request({'stop': True}, path) is None:
+            print('No daemon listening on {0}'.format(path))
+            rc = 1
+    else:
+        status = request({'ping': True}, path)
+        if status is None:
+            print('No daemon listening on {0}'.format(path))
+            rc = 1
+        else:
+            print_status(status)
+
+    return rc
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print('\nReceived Keyboard interrupt.')
+        print('Exiting...')
+    except ValueError as e:
+        print('ERROR: {0}'.format(e))
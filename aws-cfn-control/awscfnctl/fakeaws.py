@@ -0,0 +1,1304 @@
+#
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file
+# except in compliance with the License. A copy of the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+"""
+In-process stand-in for the CloudFormation, EC2, Auto Scaling and S3 calls awscfnctl makes
+
+  fake = FakeAws(latency=0.01)
+  fake.add_stack('cluster1', asg_size=100)
+  with fake.installed(), fake.patched_sleep():
+      client = CfnControl(region='us-east-1')
+      client.cr_stack('cluster2', param_file)
+
+Requests are answered from the botocore before-call event, so nothing is sent over the
+network and no credentials are needed.  State changes (stack creation, instances stopping,
+standby, ENI attachment) happen on a virtual clock, patched_sleep() makes time.sleep()
+advance that clock instead of waiting.
+"""
+
+import json
+import time
+import zlib
+import heapq
+import datetime
+import threading
+import contextlib
+
+
+# keep a reference, patched_sleep() replaces time.sleep
+_real_sleep = time.sleep
+
+DEFAULT_REGION = 'us-east-1'
+ACCOUNT_ID = '123456789012'
+
+INSTANCE_STATE_CODES = {
+    'pending': 0,
+    'running': 16,
+    'shutting-down': 32,
+    'terminated': 48,
+    'stopping': 64,
+    'stopped': 80,
+}
+
+# Virtual seconds each state change takes
+DEFAULT_TIMINGS = {
+    'resource': 20,         # per stack resource
+    'delete': 60,
+    'boot': 30,             # pending -> running
+    'stop': 60,             # stopping -> stopped
+    'terminate': 30,
+    'standby': 5,           # EnteringStandby -> Standby
+    'exit_standby': 10,     # Pending -> InService
+    'attach': 2,            # ENI attaching -> attached
+}
+
+# EnterStandby and ExitStandby take at most this many instances per call
+MAX_STANDBY_INSTANCES = 20
+
+
+class FakeAwsError(Exception):
+    pass
+
+
+class VirtualClock:
+
+    def __init__(self, start=None):
+
+        """
+        Clock for the fake backend, only moves when advanced or slept on
+
+        :param start:  datetime to start at
+        """
+
+        if start is None:
+            start = datetime.datetime(2021, 9, 16, 14, 0, 0, tzinfo=datetime.timezone.utc)
+
+        self.lock = threading.Lock()
+        self.epoch = start
+        self.elapsed = 0.0
+        self.slept = 0.0
+
+    def time(self):
+
+        with self.lock:
+            return self.elapsed
+
+    def now(self):
+
+        return self.epoch + datetime.timedelta(seconds=self.time())
+
+    def datetime_at(self, t):
+
+        return self.epoch + datetime.timedelta(seconds=t)
+
+    def advance(self, seconds):
+
+        with self.lock:
+            self.elapsed += max(0.0, seconds)
+
+    def sleep(self, seconds):
+
+        with self.lock:
+            self.elapsed += max(0.0, seconds)
+            self.slept += max(0.0, seconds)
+
+
+class FakeRegion:
+
+    def __init__(self, name):
+
+        self.name = name
+        self.stacks = dict()            # name -> stack, deleted stacks are kept with their StackId
+        self.deleted_stacks = list()
+        self.asgs = dict()
+        self.instances = dict()
+        self.enis = dict()
+        self.addresses = dict()
+        self.images = dict()
+        self.key_pairs = ['{0}-key'.format(name)]
+        self.vpc_id = 'vpc-{0:017x}'.format(zlib.crc32(name.encode()))
+        self.subnets = ['subnet-{0:017x}'.format(zlib.crc32((name + az).encode())) for az in 'abc']
+        self.security_group = 'sg-{0:017x}'.format(zlib.crc32((name + 'sg').encode()))
+
+
+class FakeAws:
+
+    def __init__(self, regions=None, latency=0.0, real_latency=True, timings=None, default_asg_size=2,
+                 clock=None):
+
+        """
+        Fake AWS backend
+
+        :param regions:  list of region names returned by DescribeRegions
+        :param latency:  seconds added to every call, or a callable(service, operation) returning seconds
+        :param real_latency:  True sleeps for the latency, False only advances the virtual clock
+        :param timings:  dict() overriding DEFAULT_TIMINGS
+        :param default_asg_size:  instances per ASG when the template doesn't say
+        :param clock:  VirtualClock, one is created if this is not given
+        """
+
+        self.lock = threading.RLock()
+        self.clock = clock or VirtualClock()
+        self.latency = latency
+        self.real_latency = real_latency
+        self.timings = dict(DEFAULT_TIMINGS)
+        if timings:
+            self.timings.update(timings)
+        self.default_asg_size = default_asg_size
+
+        self.region_names = list(regions or [DEFAULT_REGION])
+        self.regions = dict()
+        self.scheduled = list()
+        self.counter = 0
+        self.call_counts = dict()
+        # called with every new session, e.g. ApiStats().register
+        self.session_hooks = list()
+
+    # ------------------------------------------------------------------------------------
+    # plumbing
+
+    def region(self, name=None):
+
+        name = name or DEFAULT_REGION
+
+        with self.lock:
+            if name not in self.regions:
+                self.regions[name] = FakeRegion(name)
+            return self.regions[name]
+
+    def next_id(self, prefix, width=17):
+
+        with self.lock:
+            self.counter += 1
+            return '{0}-{1:0{2}x}'.format(prefix, self.counter, width)
+
+    def schedule(self, delay, action):
+        """
+        run action() once the virtual clock passes now + delay
+        """
+
+        with self.lock:
+            self.counter += 1
+            heapq.heappush(self.scheduled, (self.clock.time() + delay, self.counter, action))
+
+    def tick(self):
+        """
+        run the scheduled actions that are due
+        """
+
+        with self.lock:
+            now = self.clock.time()
+            while self.scheduled and self.scheduled[0][0] <= now:
+                due, n, action = heapq.heappop(self.scheduled)
+                action(due)
+
+    def session(self, profile_name=None):
+        """
+        returns a new boto3 session answered by this backend, usable as CfnControl.session_factory
+        """
+
+        import boto3
+
+        session = boto3.session.Session(aws_access_key_id='AKIDFAKEAWS', aws_secret_access_key='fakeaws',
+                                        region_name=DEFAULT_REGION)
+        self.register(session)
+        for hook in self.session_hooks:
+            hook(session)
+
+        return session
+
+    def register(self, session):
+
+        session.events.register('before-parameter-build', self._before_parameter_build,
+                                unique_id='awscfnctl-fakeaws-params')
+        session.events.register('before-call', self._before_call, unique_id='awscfnctl-fakeaws')
+
+        return session
+
+    @contextlib.contextmanager
+    def installed(self):
+        """
+        point CfnControl, and the commands that use boto3.client() directly, at this backend
+        """
+
+        import boto3
+        from .awscfnctl import CfnControl
+
+        saved_factory = CfnControl.session_factory
+        saved_default_session = boto3.DEFAULT_SESSION
+        saved_refresh = CfnControl.completion_refresh
+
+        CfnControl.session_factory = self.session
+        boto3.DEFAULT_SESSION = self.session()
+        # the completion index would be refreshed from the real account
+        CfnControl.completion_refresh = False
+        try:
+            yield self
+        finally:
+            CfnControl.session_factory = saved_factory
+            boto3.DEFAULT_SESSION = saved_default_session
+            CfnControl.completion_refresh = saved_refresh
+
+    @contextlib.contextmanager
+    def patched_sleep(self):
+        """
+        time.sleep() advances the virtual clock instead of waiting
+        """
+
+        time.sleep = self.clock.sleep
+        try:
+            yield self.clock
+        finally:
+            time.sleep = _real_sleep
+
+    @staticmethod
+    def _before_parameter_build(params, context, **kwargs):
+
+        # before-call only sees the serialized request, keep the API parameters for it
+        context['awscfnctl_fakeaws_params'] = dict(params)
+
+    def _before_call(self, event_name, model, context, request_signer, **kwargs):
+
+        from botocore.awsrequest import AWSResponse
+
+        service = model.service_model.service_name
+        operation = model.name
+        params = context.get('awscfnctl_fakeaws_params', dict())
+
+        delay = self.latency(service, operation) if callable(self.latency) else self.latency
+        if delay:
+            if self.real_latency:
+                _real_sleep(delay)
+            else:
+                self.clock.advance(delay)
+
+        handler = getattr(self, 'op_{0}_{1}'.format(service.replace('-', ''), operation), None)
+        if handler is None:
+            errmsg = 'FakeAws does not implement {0} {1}'.format(service, operation)
+            raise FakeAwsError(errmsg)
+
+        with self.lock:
+            key = (service, operation)
+            self.call_counts[key] = self.call_counts.get(key, 0) + 1
+            self.tick()
+            parsed = handler(self.region(request_signer.region_name), params)
+
+        status = 200
+        if 'Error' in parsed:
+            status = parsed.pop('Status', 400)
+        parsed['ResponseMetadata'] = {'HTTPStatusCode': status, 'RetryAttempts': 0,
+                                      'RequestId': self.next_id('request', 8)}
+
+        return AWSResponse(None, status, {}, None), parsed
+
+    @staticmethod
+    def error(code, message, status=400):
+
+        return {'Error': {'Code': code, 'Message': message, 'Type': 'Sender'}, 'Status': status}
+
+    @staticmethod
+    def page(items, params, key, size, size_param='MaxResults'):
+
+        start = int(params.get('NextToken') or 0)
+        size = int(params.get(size_param) or size)
+        response = {key: items[start:start + size]}
+        if start + size < len(items):
+            response['NextToken'] = str(start + size)
+
+        return response
+
+    @staticmethod
+    def filter_values(params):
+
+        return dict((f['Name'], f['Values']) for f in params.get('Filters', list()))
+
+    # ------------------------------------------------------------------------------------
+    # seeding
+
+    def add_stack(self, stack_name, region=None, asg_size=0, status='CREATE_COMPLETE', resources=None,
+                  outputs=None, tags=None, parameters=None, parent=None, asg_count=1):
+        """
+        add an existing stack, optionally with asg_count ASGs of asg_size running instances each
+
+        :param resources:  list() of (logical id, resource type) for extra resources
+        :param parent:  stack dictionary, the new stack is added to it as a nested stack
+        :return:  the stack dictionary
+        """
+
+        with self.lock:
+            r = self.region(region)
+            stack = self._new_stack(r, stack_name, parameters or dict(), tags or list(), parent=parent)
+            if parent is not None:
+                nested = [res for res in parent['resources'] if res['ResourceType'] == 'AWS::CloudFormation::Stack']
+                self._add_resource(parent, 'Nested{0}'.format(len(nested) + 1), 'AWS::CloudFormation::Stack',
+                                   stack['StackId'], 'CREATE_COMPLETE')
+            stack['StackStatus'] = status
+            stack['Outputs'] = [{'OutputKey': k, 'OutputValue': v} for k, v in sorted((outputs or dict()).items())]
+
+            for n in range(asg_count if asg_size else 0):
+                logical_id = 'Cluster' if n == 0 else 'Cluster{0}'.format(n + 1)
+                asg_name = '{0}-{1}-{2}'.format(stack_name, logical_id, self.next_id('', 8)[1:])
+                self._new_asg(r, stack, asg_name, asg_size, state='running')
+                self._add_resource(stack, logical_id, 'AWS::AutoScaling::AutoScalingGroup', asg_name,
+                                   'CREATE_COMPLETE')
+
+            for logical_id, resource_type in (resources or list()):
+                physical_id = '{0}-{1}-{2}'.format(stack_name, logical_id, self.next_id('', 8)[1:])
+                self._add_resource(stack, logical_id, resource_type, physical_id, 'CREATE_COMPLETE')
+
+            self._stack_event(stack, stack_name, 'AWS::CloudFormation::Stack', stack['StackId'], status,
+                              self.clock.time())
+            return stack
+
+    def add_instances(self, count, region=None, state='running', asg=None, tags=None, instance_type='c5n.18xlarge'):
+        """
+        add instances, not part of any stack unless asg is given
+
+        :return:  list() of instance IDs
+        """
+
+        with self.lock:
+            r = self.region(region)
+            return [self._new_instance(r, state=state, asg=asg, tags=tags, instance_type=instance_type)
+                    for n in range(count)]
+
+    def add_image(self, name, region=None, owner=ACCOUNT_ID, image_id=None):
+
+        with self.lock:
+            image_id = image_id or self.next_id('ami')
+            self.region(region).images[image_id] = {
+                'ImageId': image_id,
+                'Name': name,
+                'OwnerId': owner,
+                'Description': name,
+                'State': 'available',
+                'EnaSupport': True,
+                'SriovNetSupport': 'simple',
+                'Architecture': 'x86_64',
+                'VirtualizationType': 'hvm',
+                'RootDeviceType': 'ebs',
+                'CreationDate': '2021-09-16T14:00:00.000Z',
+            }
+            return image_id
+
+    # ------------------------------------------------------------------------------------
+    # internal state changes
+
+    def _new_stack(self, r, stack_name, parameters, tags, parent=None, description='', template_parameters=None):
+
+        stack_id = 'arn:aws:cloudformation:{0}:{1}:stack/{2}/{3}'.format(r.name, ACCOUNT_ID, stack_name,
+                                                                        self.next_id('stack', 12))
+        stack = {
+            'StackId': stack_id,
+            'StackName': stack_name,
+            'Description': description,
+            'Parameters': [{'ParameterKey': k, 'ParameterValue': str(v)} for k, v in sorted(parameters.items())],
+            'CreationTime': self.clock.now(),
+            'StackStatus': 'CREATE_IN_PROGRESS',
+            'DisableRollback': False,
+            'Outputs': list(),
+            'Tags': list(tags),
+            'resources': list(),
+            'events': list(),
+        }
+        if parent is not None:
+            stack['ParentId'] = parent['StackId']
+            stack['RootId'] = parent.get('RootId', parent['StackId'])
+
+        r.stacks[stack_name] = stack
+
+        return stack
+
+    def _add_resource(self, stack, logical_id, resource_type, physical_id, status):
+
+        resource = {
+            'StackName': stack['StackName'],
+            'StackId': stack['StackId'],
+            'LogicalResourceId': logical_id,
+            'PhysicalResourceId': physical_id,
+            'ResourceType': resource_type,
+            'Timestamp': self.clock.now(),
+            'ResourceStatus': status,
+        }
+        stack['resources'].append(resource)
+
+        return resource
+
+    def _stack_event(self, stack, logical_id, resource_type, physical_id, status, t, reason=None):
+
+        event = {
+            'StackId': stack['StackId'],
+            'EventId': self.next_id('event', 12),
+            'StackName': stack['StackName'],
+            'LogicalResourceId': logical_id,
+            'PhysicalResourceId': physical_id,
+            'ResourceType': resource_type,
+            'Timestamp': self.clock.datetime_at(t),
+            'ResourceStatus': status,
+        }
+        if reason:
+            event['ResourceStatusReason'] = reason
+        stack['events'].append(event)
+
+    def _new_instance(self, r, state='running', asg=None, tags=None, instance_type='c5n.18xlarge', stack=None):
+
+        n = len(r.instances) + 1
+        instance_id = self.next_id('i')
+        all_tags = dict(tags or dict())
+        all_tags.setdefault('Name', 'node-{0}'.format(n))
+        if asg is not None:
+            all_tags['aws:autoscaling:groupName'] = asg
+        if stack is not None:
+            all_tags['aws:cloudformation:stack-name'] = stack['StackName']
+
+        r.instances[instance_id] = {
+            'InstanceId': instance_id,
+            'ImageId': 'ami-0fa1ceaf0fa1ceaf0',
+            'InstanceType': instance_type,
+            'KeyName': r.key_pairs[0],
+            'LaunchTime': self.clock.now() + datetime.timedelta(milliseconds=n),
+            'State': state,
+            'PrivateIpAddress': '10.{0}.{1}.{2}'.format(n // 62500 % 256, n // 250 % 250, n % 250 + 4),
+            'SubnetId': r.subnets[n % len(r.subnets)],
+            'AvailabilityZone': r.name + 'abc'[n % 3],
+            'Tags': all_tags,
+            'SriovNetSupport': None,
+            'EnaSupport': False,
+        }
+        self._new_eni(r, r.instances[instance_id]['SubnetId'], 'Primary network interface',
+                      [r.security_group], instance_id=instance_id, device_index=0)
+
+        return instance_id
+
+    def _new_eni(self, r, subnet_id, description, groups, instance_id=None, device_index=None):
+
+        eni_id = self.next_id('eni')
+        eni = {
+            'NetworkInterfaceId': eni_id,
+            'SubnetId': subnet_id,
+            'VpcId': r.vpc_id,
+            'Description': description or '',
+            'Groups': [{'GroupId': g, 'GroupName': g} for g in groups],
+            'Status': 'available',
+            'PrivateIpAddress': '10.255.{0}.{1}'.format(len(r.enis) // 250 % 250, len(r.enis) % 250 + 4),
+            'InterfaceType': 'interface',
+        }
+        r.enis[eni_id] = eni
+
+        if instance_id is not None:
+            eni['Status'] = 'in-use'
+            eni['Attachment'] = {
+                'AttachmentId': self.next_id('eni-attach'),
+                'InstanceId': instance_id,
+                'DeviceIndex': device_index,
+                'Status': 'attached',
+                'DeleteOnTermination': True,
+            }
+
+        return eni
+
+    def _new_asg(self, r, stack, asg_name, size, state='pending'):
+
+        asg = {
+            'AutoScalingGroupName': asg_name,
+            'MinSize': 0,
+            'MaxSize': max(size, 1),
+            'DesiredCapacity': size,
+            'lifecycle': dict(),
+            'stack': stack['StackName'] if stack else None,
+        }
+        r.asgs[asg_name] = asg
+
+        for n in range(size):
+            instance_id = self._new_instance(r, state=state, asg=asg_name, stack=stack)
+            asg['lifecycle'][instance_id] = 'InService' if state == 'running' else 'Pending'
+            if state == 'pending':
+                self._transition_instance(r, instance_id, 'running', self.timings['boot'])
+
+        return asg
+
+    def _transition_instance(self, r, instance_id, state, delay, asg_state=None):
+
+        def action(due):
+            instance = r.instances.get(instance_id)
+            if instance is None:
+                return
+            instance['State'] = state
+            if state == 'running':
+                instance['LaunchTime'] = self.clock.datetime_at(due)
+            for asg in r.asgs.values():
+                if instance_id in asg['lifecycle']:
+                    if asg_state is not None:
+                        asg['lifecycle'][instance_id] = asg_state
+                    elif state == 'running' and asg['lifecycle'][instance_id] == 'Pending':
+                        asg['lifecycle'][instance_id] = 'InService'
+                    elif state == 'terminated':
+                        del asg['lifecycle'][instance_id]
+
+        self.schedule(delay, action)
+
+    @staticmethod
+    def _template(params):
+
+        body = params.get('TemplateBody')
+        if not body:
+            return dict()
+
+        try:
+            return json.loads(body)
+        except ValueError:
+            pass
+
+        try:
+            from cfn_flip import to_json
+            return json.loads(to_json(body))
+        except Exception:
+            return dict()
+
+    @staticmethod
+    def _resolve(value, parameters, physical_ids):
+
+        if isinstance(value, dict):
+            if 'Ref' in value:
+                ref = value['Ref']
+                if ref in physical_ids:
+                    return physical_ids[ref]
+                return parameters.get(ref, ref)
+            if 'Fn::GetAtt' in value:
+                return '{0}.{1}'.format(*value['Fn::GetAtt'])
+            return json.dumps(value, default=str)
+
+        return value
+
+    def _create_stack(self, r, stack_name, params, parent=None):
+
+        template = self._template(params)
+
+        parameters = dict()
+        for k, v in template.get('Parameters', dict()).items():
+            if 'Default' in v:
+                parameters[k] = str(v['Default'])
+        for p in params.get('Parameters', list()):
+            parameters[p['ParameterKey']] = p.get('ParameterValue', '')
+
+        resources = list(template.get('Resources', dict()).items())
+        if not resources:
+            resources = [('Cluster', {'Type': 'AWS::AutoScaling::AutoScalingGroup',
+                                      'Properties': {'DesiredCapacity': self.default_asg_size}})]
+
+        stack = self._new_stack(r, stack_name, parameters, params.get('Tags', list()), parent=parent,
+                                description=template.get('Description', ''))
+        stack['DisableRollback'] = params.get('OnFailure') == 'DO_NOTHING' or params.get('DisableRollback', False)
+
+        t0 = self.clock.time()
+        self._stack_event(stack, stack_name, 'AWS::CloudFormation::Stack', stack['StackId'], 'CREATE_IN_PROGRESS',
+                          t0, reason='User Initiated')
+
+        physical_ids = dict()
+        step = self.timings['resource']
+        for n, (logical_id, resource) in enumerate(sorted(resources)):
+            self.schedule(n * step, self._resource_action(r, stack, logical_id, resource, parameters,
+                                                          physical_ids, 'CREATE_IN_PROGRESS'))
+            self.schedule((n + 1) * step, self._resource_action(r, stack, logical_id, resource, parameters,
+                                                                physical_ids, 'CREATE_COMPLETE'))
+
+        def complete(due):
+            outputs = list()
+            for k, v in sorted(template.get('Outputs', dict()).items()):
+                outputs.append({'OutputKey': k,
+                                'OutputValue': str(self._resolve(v.get('Value', ''), parameters, physical_ids)),
+                                'Description': v.get('Description', '')})
+            stack['Outputs'] = outputs
+            stack['StackStatus'] = 'CREATE_COMPLETE'
+            self._stack_event(stack, stack_name, 'AWS::CloudFormation::Stack', stack['StackId'],
+                              'CREATE_COMPLETE', due)
+
+        self.schedule(len(resources) * step, complete)
+
+        return stack
+
+    def _resource_action(self, r, stack, logical_id, resource, parameters, physical_ids, status):
+
+        resource_type = resource.get('Type', 'AWS::CloudFormation::WaitConditionHandle')
+        properties = resource.get('Properties', dict())
+
+        def action(due):
+            if stack['StackStatus'] != 'CREATE_IN_PROGRESS':
+                return
+
+            if status == 'CREATE_IN_PROGRESS':
+                self._stack_event(stack, logical_id, resource_type, '', status, due)
+                return
+
+            if resource_type == 'AWS::AutoScaling::AutoScalingGroup':
+                physical_id = '{0}-{1}-{2}'.format(stack['StackName'], logical_id, self.next_id('', 12)[1:])
+                try:
+                    size = int(self._resolve(properties.get('DesiredCapacity', properties.get('MinSize')),
+                                             parameters, physical_ids))
+                except (TypeError, ValueError):
+                    size = self.default_asg_size
+                self._new_asg(r, stack, physical_id, size, state='running')
+            elif resource_type == 'AWS::CloudFormation::Stack':
+                child_name = '{0}-{1}-{2}'.format(stack['StackName'], logical_id, self.next_id('', 12)[1:].upper())
+                child = self._create_stack(r, child_name, {'Parameters': list()}, parent=stack)
+                physical_id = child['StackId']
+            elif resource_type == 'AWS::EC2::EIP':
+                physical_id = self._allocate_address(r)['PublicIp']
+            else:
+                physical_id = '{0}-{1}-{2}'.format(stack['StackName'], logical_id, self.next_id('', 12)[1:])
+
+            physical_ids[logical_id] = physical_id
+            self._add_resource(stack, logical_id, resource_type, physical_id, status)
+            self._stack_event(stack, logical_id, resource_type, physical_id, status, due)
+
+        return action
+
+    def _allocate_address(self, r):
+
+        n = len(r.addresses) + 1
+        address = {
+            'PublicIp': '54.{0}.{1}.{2}'.format(n // 62500 % 256, n // 250 % 250, n % 250 + 1),
+            'AllocationId': self.next_id('eipalloc'),
+            'Domain': 'vpc',
+        }
+        r.addresses[address['AllocationId']] = address
+
+        return address
+
+    # ------------------------------------------------------------------------------------
+    # rendering
+
+    def _render_instance(self, r, instance):
+
+        state = instance['State']
+        rendered = {
+            'InstanceId': instance['InstanceId'],
+            'ImageId': instance['ImageId'],
+            'InstanceType': instance['InstanceType'],
+            'KeyName': instance['KeyName'],
+            'LaunchTime': instance['LaunchTime'],
+            'State': {'Code': INSTANCE_STATE_CODES[state], 'Name': state},
+            'PrivateIpAddress': instance['PrivateIpAddress'],
+            'PrivateDnsName': 'ip-{0}.ec2.internal'.format(instance['PrivateIpAddress'].replace('.', '-')),
+            'PublicDnsName': '',
+            'SubnetId': instance['SubnetId'],
+            'VpcId': r.vpc_id,
+            'Placement': {'AvailabilityZone': instance['AvailabilityZone']},
+            'Tags': [{'Key': k, 'Value': v} for k, v in sorted(instance['Tags'].items())],
+            'EnaSupport': instance['EnaSupport'],
+            'NetworkInterfaces': list(),
+        }
+        if instance['SriovNetSupport']:
+            rendered['SriovNetSupport'] = instance['SriovNetSupport']
+
+        for eni in r.enis.values():
+            attachment = eni.get('Attachment')
+            if attachment and attachment['InstanceId'] == instance['InstanceId']:
+                rendered['NetworkInterfaces'].append(self._render_eni(eni))
+                association = eni.get('Association')
+                if association and state == 'running' and attachment['DeviceIndex'] == 0:
+                    rendered['PublicIpAddress'] = association['PublicIp']
+
+        if state == 'running' and 'PublicIpAddress' not in rendered:
+            n = int(instance['InstanceId'][2:], 16)
+            rendered['PublicIpAddress'] = '3.{0}.{1}.{2}'.format(n // 62500 % 256, n // 250 % 250, n % 250 + 1)
+
+        return rendered
+
+    @staticmethod
+    def _render_eni(eni):
+
+        rendered = dict(eni)
+        if 'Attachment' in eni:
+            rendered['Attachment'] = dict(eni['Attachment'])
+        if 'Association' in eni:
+            rendered['Association'] = dict(eni['Association'])
+
+        return rendered
+
+    @staticmethod
+    def _render_stack(stack):
+
+        return dict((k, v) for k, v in stack.items() if k not in ('resources', 'events'))
+
+    def _find_stack(self, r, stack_name):
+
+        stack = r.stacks.get(stack_name)
+        if stack is None:
+            for s in list(r.stacks.values()) + r.deleted_stacks:
+                if s['StackId'] == stack_name:
+                    return s
+        return stack
+
+    def _instance_filter(self, r, filters):
+
+        def matches(instance):
+            for name, values in filters.items():
+                if name == 'instance-state-name':
+                    value = instance['State']
+                elif name == 'instance-id':
+                    value = instance['InstanceId']
+                elif name == 'instance-type':
+                    value = instance['InstanceType']
+                elif name == 'vpc-id':
+                    value = r.vpc_id
+                elif name == 'subnet-id':
+                    value = instance['SubnetId']
+                elif name == 'availability-zone':
+                    value = instance['AvailabilityZone']
+                elif name == 'private-ip-address':
+                    value = instance['PrivateIpAddress']
+                elif name == 'tag-key':
+                    if not set(values) & set(instance['Tags']):
+                        return False
+                    continue
+                elif name.startswith('tag:'):
+                    value = instance['Tags'].get(name[4:])
+                else:
+                    errmsg = 'FakeAws does not implement DescribeInstances filter {0}'.format(name)
+                    raise FakeAwsError(errmsg)
+                if value not in values and not ('*' in values and value is not None):
+                    return False
+            return True
+
+        return matches
+
+    # ------------------------------------------------------------------------------------
+    # S3
+
+    def op_s3_ListBuckets(self, r, params):
+
+        return {'Buckets': [{'Name': 'fakeaws-bucket', 'CreationDate': self.clock.epoch}],
+                'Owner': {'ID': ACCOUNT_ID}}
+
+    # ------------------------------------------------------------------------------------
+    # CloudFormation
+
+    def op_cloudformation_ValidateTemplate(self, r, params):
+
+        template = self._template(params)
+        parameters = [{'ParameterKey': k, 'DefaultValue': str(v.get('Default', '')), 'NoEcho': False,
+                       'Description': v.get('Description', '')}
+                      for k, v in sorted(template.get('Parameters', dict()).items())]
+
+        return {'Parameters': parameters, 'Description': template.get('Description', '')}
+
+    def op_cloudformation_CreateStack(self, r, params):
+
+        stack_name = params['StackName']
+        if stack_name in r.stacks:
+            return self.error('AlreadyExistsException', 'Stack [{0}] already exists'.format(stack_name))
+
+        stack = self._create_stack(r, stack_name, params)
+
+        return {'StackId': stack['StackId']}
+
+    def op_cloudformation_DeleteStack(self, r, params):
+
+        stack = self._find_stack(r, params['StackName'])
+        if stack is None or stack['StackStatus'] in ('DELETE_IN_PROGRESS', 'DELETE_COMPLETE'):
+            return dict()
+
+        t0 = self.clock.time()
+        stack['StackStatus'] = 'DELETE_IN_PROGRESS'
+        self._stack_event(stack, stack['StackName'], 'AWS::CloudFormation::Stack', stack['StackId'],
+                          'DELETE_IN_PROGRESS', t0, reason='User Initiated')
+
+        for asg in list(r.asgs.values()):
+            if asg['stack'] == stack['StackName']:
+                for instance_id in list(asg['lifecycle']):
+                    r.instances[instance_id]['State'] = 'shutting-down'
+                    self._transition_instance(r, instance_id, 'terminated', self.timings['terminate'])
+
+        def complete(due):
+            stack['StackStatus'] = 'DELETE_COMPLETE'
+            stack['DeletionTime'] = self.clock.datetime_at(due)
+            self._stack_event(stack, stack['StackName'], 'AWS::CloudFormation::Stack', stack['StackId'],
+                              'DELETE_COMPLETE', due)
+            for asg_name in [a for a, asg in r.asgs.items() if asg['stack'] == stack['StackName']]:
+                del r.asgs[asg_name]
+            if r.stacks.get(stack['StackName']) is stack:
+                del r.stacks[stack['StackName']]
+            r.deleted_stacks.append(stack)
+
+        self.schedule(self.timings['delete'], complete)
+
+        return dict()
+
+    def op_cloudformation_DescribeStacks(self, r, params):
+
+        stack_name = params.get('StackName')
+
+        if stack_name is None:
+            stacks = [self._render_stack(s) for s in sorted(r.stacks.values(), key=lambda s: s['CreationTime'],
+                                                             reverse=True)]
+            return self.page(stacks, params, 'Stacks', 100, size_param='NoSuchParam')
+
+        stack = self._find_stack(r, stack_name)
+        if stack is None or (stack['StackStatus'] == 'DELETE_COMPLETE' and not stack_name.startswith('arn:')):
+            return self.error('ValidationError', 'Stack with id {0} does not exist'.format(stack_name))
+
+        return {'Stacks': [self._render_stack(stack)]}
+
+    def op_cloudformation_ListStacks(self, r, params):
+
+        wanted = params.get('StackStatusFilter')
+        summaries = list()
+
+        for stack in sorted(list(r.stacks.values()) + r.deleted_stacks, key=lambda s: s['CreationTime'],
+                            reverse=True):
+            if wanted and stack['StackStatus'] not in wanted:
+                continue
+            summary = {
+                'StackId': stack['StackId'],
+                'StackName': stack['StackName'],
+                'TemplateDescription': stack['Description'],
+                'CreationTime': stack['CreationTime'],
+                'StackStatus': stack['StackStatus'],
+            }
+            for k in ('LastUpdatedTime', 'DeletionTime', 'ParentId', 'RootId'):
+                if k in stack:
+                    summary[k] = stack[k]
+            summaries.append(summary)
+
+        return self.page(summaries, params, 'StackSummaries', 100, size_param='NoSuchParam')
+
+    def op_cloudformation_DescribeStackEvents(self, r, params):
+
+        stack = self._find_stack(r, params['StackName'])
+        if stack is None:
+            return self.error('ValidationError', 'Stack [{0}] does not exist'.format(params['StackName']))
+
+        # newest first, like the API
+        return self.page(list(reversed(stack['events'])), params, 'StackEvents', 100, size_param='NoSuchParam')
+
+    def op_cloudformation_DescribeStackResources(self, r, params):
+
+        stack = self._find_stack(r, params['StackName'])
+        if stack is None:
+            return self.error('ValidationError', 'Stack with id {0} does not exist'.format(params['StackName']))
+
+        # the API only returns the first 100 resources
+        return {'StackResources': [dict(res) for res in stack['resources'][:100]]}
+
+    def op_cloudformation_ListStackResources(self, r, params):
+
+        stack = self._find_stack(r, params['StackName'])
+        if stack is None:
+            return self.error('ValidationError', 'Stack with id {0} does not exist'.format(params['StackName']))
+
+        summaries = [{
+            'LogicalResourceId': res['LogicalResourceId'],
+            'PhysicalResourceId': res['PhysicalResourceId'],
+            'ResourceType': res['ResourceType'],
+            'LastUpdatedTimestamp': res['Timestamp'],
+            'ResourceStatus': res['ResourceStatus'],
+        } for res in stack['resources']]
+
+        return self.page(summaries, params, 'StackResourceSummaries', 100, size_param='NoSuchParam')
+
+    # ------------------------------------------------------------------------------------
+    # Auto Scaling
+
+    def op_autoscaling_DescribeAutoScalingGroups(self, r, params):
+
+        names = params.get('AutoScalingGroupNames')
+        groups = list()
+
+        for asg_name in sorted(r.asgs):
+            if names and asg_name not in names:
+                continue
+            asg = r.asgs[asg_name]
+            instances = list()
+            for instance_id, lifecycle in asg['lifecycle'].items():
+                instance = r.instances[instance_id]
+                instances.append({
+                    'InstanceId': instance_id,
+                    'InstanceType': instance['InstanceType'],
+                    'AvailabilityZone': instance['AvailabilityZone'],
+                    'LifecycleState': lifecycle,
+                    'HealthStatus': 'Healthy',
+                    'ProtectedFromScaleIn': False,
+                })
+            groups.append({
+                'AutoScalingGroupName': asg_name,
+                'AutoScalingGroupARN': 'arn:aws:autoscaling:{0}:{1}:autoScalingGroup:{2}'.format(
+                    r.name, ACCOUNT_ID, asg_name),
+                'MinSize': asg['MinSize'],
+                'MaxSize': asg['MaxSize'],
+                'DesiredCapacity': asg['DesiredCapacity'],
+                'DefaultCooldown': 300,
+                'AvailabilityZones': [r.name + az for az in 'abc'],
+                'HealthCheckType': 'EC2',
+                'CreatedTime': self.clock.epoch,
+                'Instances': instances,
+                'Tags': [{'Key': 'aws:cloudformation:stack-name', 'Value': asg['stack'] or ''}],
+            })
+
+        return self.page(groups, params, 'AutoScalingGroups', 50, size_param='MaxRecords')
+
+    def _standby_change(self, r, params, from_states, to_state, final_state, delay, capacity_change):
+
+        asg = r.asgs.get(params['AutoScalingGroupName'])
+        if asg is None:
+            return self.error('ValidationError', 'AutoScalingGroup name not found')
+
+        instance_ids = params.get('InstanceIds', list())
+        if len(instance_ids) > MAX_STANDBY_INSTANCES:
+            return self.error('ValidationError', 'The number of instance IDs must not exceed {0}'.format(
+                MAX_STANDBY_INSTANCES))
+        for instance_id in instance_ids:
+            if asg['lifecycle'].get(instance_id) not in from_states:
+                return self.error('ValidationError', 'The instance {0} is not in {1}'.format(
+                    instance_id, ' or '.join(from_states)))
+
+        activities = list()
+        for instance_id in instance_ids:
+            asg['lifecycle'][instance_id] = to_state
+
+            def action(due, instance_id=instance_id):
+                if asg['lifecycle'].get(instance_id) == to_state:
+                    asg['lifecycle'][instance_id] = final_state
+
+            self.schedule(delay, action)
+            activities.append({
+                'ActivityId': self.next_id('activity', 12),
+                'AutoScalingGroupName': asg['AutoScalingGroupName'],
+                'Description': '{0} {1}'.format(to_state, instance_id),
+                'Cause': 'At {0} instance {1} was moved to {2}'.format(self.clock.now(), instance_id, to_state),
+                'StartTime': self.clock.now(),
+                'StatusCode': 'InProgress',
+                'Progress': 50,
+            })
+
+        if capacity_change:
+            asg['DesiredCapacity'] = max(0, asg['DesiredCapacity'] + capacity_change * len(instance_ids))
+
+        return {'Activities': activities}
+
+    def op_autoscaling_EnterStandby(self, r, params):
+
+        change = -1 if params.get('ShouldDecrementDesiredCapacity') else 0
+
+        return self._standby_change(r, params, ['InService'], 'EnteringStandby', 'Standby',
+                                    self.timings['standby'], change)
+
+    def op_autoscaling_ExitStandby(self, r, params):
+
+        return self._standby_change(r, params, ['Standby'], 'Pending', 'InService',
+                                    self.timings['exit_standby'], 1)
+
+    # ------------------------------------------------------------------------------------
+    # EC2
+
+    def op_ec2_DescribeKeyPairs(self, r, params):
+
+        return {'KeyPairs': [{'KeyName': k, 'KeyPairId': 'key-{0}'.format(k)} for k in r.key_pairs]}
+
+    def op_ec2_DescribeRegions(self, r, params):
+
+        return {'Regions': [{'RegionName': name, 'Endpoint': 'ec2.{0}.amazonaws.com'.format(name),
+                             'OptInStatus': 'opt-in-not-required'} for name in self.region_names]}
+
+    def op_ec2_DescribeImages(self, r, params):
+
+        image_ids = params.get('ImageIds')
+        if image_ids:
+            images = list()
+            for image_id in image_ids:
+                if image_id not in r.images:
+                    # images asked for by ID always exist in the default region
+                    if r.name != DEFAULT_REGION:
+                        return self.error('InvalidAMIID.NotFound',
+                                          "The image id '[{0}]' does not exist".format(image_id))
+                    self.add_image('image-{0}'.format(image_id), region=r.name, image_id=image_id)
+                images.append(dict(r.images[image_id]))
+            return {'Images': images}
+
+        names = self.filter_values(params).get('name', list())
+        images = [dict(i) for i in r.images.values() if i['Name'] in names]
+        if not images:
+            # every region has a copy of every named image
+            for name in names:
+                image_id = self.add_image(name, region=r.name)
+                images.append(dict(r.images[image_id]))
+
+        return {'Images': images}
+
+    def op_ec2_DescribeVpcs(self, r, params):
+
+        return {'Vpcs': [{'VpcId': r.vpc_id, 'CidrBlock': '10.0.0.0/8', 'IsDefault': True, 'State': 'available',
+                          'InstanceTenancy': 'default', 'DhcpOptionsId': 'dopt-fakeaws',
+                          'Tags': [{'Key': 'Name', 'Value': 'fakeaws-vpc'}]}]}
+
+    def op_ec2_DescribeSubnets(self, r, params):
+
+        return {'Subnets': [{'SubnetId': subnet_id, 'VpcId': r.vpc_id, 'AvailabilityZone': r.name + 'abc'[n],
+                             'CidrBlock': '10.{0}.0.0/16'.format(n), 'State': 'available',
+                             'AvailableIpAddressCount': 65000, 'DefaultForAz': True,
+                             'MapPublicIpOnLaunch': True,
+                             'Tags': [{'Key': 'Name', 'Value': 'fakeaws-subnet-{0}'.format(n)}]}
+                            for n, subnet_id in enumerate(r.subnets)]}
+
+    def op_ec2_DescribeSecurityGroups(self, r, params):
+
+        return {'SecurityGroups': [{'GroupId': r.security_group, 'GroupName': 'default', 'VpcId': r.vpc_id,
+                                    'Description': 'default VPC security group', 'OwnerId': ACCOUNT_ID,
+                                    'IpPermissions': list(), 'IpPermissionsEgress': list()}]}
+
+    def op_ec2_DescribeInstances(self, r, params):
+
+        instance_ids = params.get('InstanceIds')
+        matches = self._instance_filter(r, self.filter_values(params))
+
+        if instance_ids:
+            missing = [i for i in instance_ids if i not in r.instances]
+            if missing:
+                return self.error('InvalidInstanceID.NotFound',
+                                  "The instance ID '{0}' does not exist".format(', '.join(missing)))
+            instances = [r.instances[i] for i in instance_ids]
+        else:
+            instances = list(r.instances.values())
+
+        rendered = [self._render_instance(r, i) for i in instances if matches(i)]
+        response = self.page(rendered, params, 'Instances', 1000)
+
+        response['Reservations'] = [{'ReservationId': 'r-fakeaws', 'OwnerId': ACCOUNT_ID,
+                                     'Instances': response.pop('Instances')}]
+
+        return response
+
+    def op_ec2_DescribeInstanceStatus(self, r, params):
+
+        instance_ids = params.get('InstanceIds') or list(r.instances)
+        statuses = list()
+
+        for instance_id in instance_ids:
+            instance = r.instances.get(instance_id)
+            if instance is None:
+                return self.error('InvalidInstanceID.NotFound',
+                                  "The instance ID '{0}' does not exist".format(instance_id))
+            if instance['State'] != 'running' and not params.get('IncludeAllInstances'):
+                continue
+            status = 'ok' if instance['State'] == 'running' else 'not-applicable'
+            statuses.append({
+                'InstanceId': instance_id,
+                'AvailabilityZone': instance['AvailabilityZone'],
+                'InstanceState': {'Code': INSTANCE_STATE_CODES[instance['State']], 'Name': instance['State']},
+                'InstanceStatus': {'Status': status},
+                'SystemStatus': {'Status': status},
+            })
+
+        return self.page(statuses, params, 'InstanceStatuses', 1000)
+
+    def _state_change(self, r, params, result_key, from_states, to_state, final_state, delay):
+
+        changes = list()
+
+        for instance_id in params['InstanceIds']:
+            instance = r.instances.get(instance_id)
+            if instance is None:
+                return self.error('InvalidInstanceID.NotFound',
+                                  "The instance ID '{0}' does not exist".format(instance_id))
+            previous = instance['State']
+            if previous in from_states:
+                instance['State'] = to_state
+                self._transition_instance(r, instance_id, final_state, delay)
+            elif previous not in (to_state, final_state):
+                return self.error('IncorrectInstanceState',
+                                  "The instance '{0}' is not in a state from which it can be {1}".format(
+                                      instance_id, final_state))
+            changes.append({
+                'InstanceId': instance_id,
+                'CurrentState': {'Code': INSTANCE_STATE_CODES[instance['State']], 'Name': instance['State']},
+                'PreviousState': {'Code': INSTANCE_STATE_CODES[previous], 'Name': previous},
+            })
+
+        return {result_key: changes}
+
+    def op_ec2_StopInstances(self, r, params):
+
+        return self._state_change(r, params, 'StoppingInstances', ['running', 'pending'], 'stopping', 'stopped',
+                                  self.timings['stop'])
+
+    def op_ec2_StartInstances(self, r, params):
+
+        return self._state_change(r, params, 'StartingInstances', ['stopped'], 'pending', 'running',
+                                  self.timings['boot'])
+
+    def op_ec2_TerminateInstances(self, r, params):
+
+        return self._state_change(r, params, 'TerminatingInstances', ['running', 'pending', 'stopped', 'stopping'],
+                                  'shutting-down', 'terminated', self.timings['terminate'])
+
+    def op_ec2_DescribeInstanceAttribute(self, r, params):
+
+        instance = r.instances.get(params['InstanceId'])
+        if instance is None:
+            return self.error('InvalidInstanceID.NotFound',
+                              "The instance ID '{0}' does not exist".format(params['InstanceId']))
+
+        response = {'InstanceId': instance['InstanceId']}
+        if params['Attribute'] == 'sriovNetSupport' and instance['SriovNetSupport']:
+            response['SriovNetSupport'] = {'Value': instance['SriovNetSupport']}
+        elif params['Attribute'] == 'enaSupport':
+            response['EnaSupport'] = {'Value': instance['EnaSupport']}
+        elif params['Attribute'] == 'instanceType':
+            response['InstanceType'] = {'Value': instance['InstanceType']}
+
+        return response
+
+    def op_ec2_ModifyInstanceAttribute(self, r, params):
+
+        instance = r.instances.get(params['InstanceId'])
+        if instance is None:
+            return self.error('InvalidInstanceID.NotFound',
+                              "The instance ID '{0}' does not exist".format(params['InstanceId']))
+
+        if ('SriovNetSupport' in params or 'EnaSupport' in params) and instance['State'] != 'stopped':
+            return self.error('IncorrectInstanceState',
+                              "The instance '{0}' is not in the 'stopped' state.".format(instance['InstanceId']))
+
+        if 'SriovNetSupport' in params:
+            instance['SriovNetSupport'] = params['SriovNetSupport']['Value']
+        if 'EnaSupport' in params:
+            instance['EnaSupport'] = params['EnaSupport']['Value']
+
+        return dict()
+
+    def op_ec2_CreateNetworkInterface(self, r, params):
+
+        eni = self._new_eni(r, params['SubnetId'], params.get('Description'),
+                            params.get('Groups') or [r.security_group])
+
+        return {'NetworkInterface': self._render_eni(eni)}
+
+    def op_ec2_AttachNetworkInterface(self, r, params):
+
+        eni = r.enis.get(params['NetworkInterfaceId'])
+        instance = r.instances.get(params['InstanceId'])
+        if eni is None:
+            return self.error('InvalidNetworkInterfaceID.NotFound',
+                              "The networkInterface ID '{0}' does not exist".format(params['NetworkInterfaceId']))
+        if instance is None:
+            return self.error('InvalidInstanceID.NotFound',
+                              "The instance ID '{0}' does not exist".format(params['InstanceId']))
+        if 'Attachment' in eni:
+            return self.error('InvalidNetworkInterface.InUse',
+                              'Interface: [{0}] in use.'.format(eni['NetworkInterfaceId']))
+
+        for other in r.enis.values():
+            attachment = other.get('Attachment')
+            if attachment and attachment['InstanceId'] == instance['InstanceId'] and \
+                    attachment['DeviceIndex'] == params['DeviceIndex']:
+                return self.error('InvalidParameterValue',
+                                  "Instance '{0}' already has an interface attached at device index '{1}'.".format(
+                                      instance['InstanceId'], params['DeviceIndex']))
+
+        attachment_id = self.next_id('eni-attach')
+        eni['Status'] = 'in-use'
+        eni['Attachment'] = {
+            'AttachmentId': attachment_id,
+            'InstanceId': instance['InstanceId'],
+            'DeviceIndex': params['DeviceIndex'],
+            'Status': 'attaching',
+            'DeleteOnTermination': False,
+        }
+
+        def action(due):
+            if eni.get('Attachment', dict()).get('AttachmentId') == attachment_id:
+                eni['Attachment']['Status'] = 'attached'
+
+        self.schedule(self.timings['attach'], action)
+
+        return {'AttachmentId': attachment_id}
+
+    def op_ec2_DescribeNetworkInterfaces(self, r, params):
+
+        eni_ids = params.get('NetworkInterfaceIds')
+        filters = self.filter_values(params)
+
+        enis = list()
+        for eni_id in (eni_ids or list(r.enis)):
+            eni = r.enis.get(eni_id)
+            if eni is None:
+                return self.error('InvalidNetworkInterfaceID.NotFound',
+                                  "The networkInterface ID '{0}' does not exist".format(eni_id))
+            attachment = eni.get('Attachment', dict())
+            values = {
+                'attachment.instance-id': attachment.get('InstanceId'),
+                'attachment.status': attachment.get('Status'),
+                'attachment.device-index': str(attachment.get('DeviceIndex')),
+                'network-interface-id': eni['NetworkInterfaceId'],
+                'subnet-id': eni['SubnetId'],
+                'status': eni['Status'],
+                'description': eni['Description'],
+                'vpc-id': eni['VpcId'],
+            }
+            for name in filters:
+                if name not in values:
+                    errmsg = 'FakeAws does not implement DescribeNetworkInterfaces filter {0}'.format(name)
+                    raise FakeAwsError(errmsg)
+            if all(values[name] in wanted for name, wanted in filters.items()):
+                enis.append(self._render_eni(eni))
+
+        return self.page(enis, params, 'NetworkInterfaces', 1000)
+
+    def op_ec2_AllocateAddress(self, r, params):
+
+        return dict(self._allocate_address(r))
+
+    def op_ec2_AssociateAddress(self, r, params):
+
+        address = r.addresses.get(params.get('AllocationId'))
+        if address is None:
+            return self.error('InvalidAllocationID.NotFound',
+                              "The allocation ID '{0}' does not exist".format(params.get('AllocationId')))
+
+        eni = r.enis.get(params.get('NetworkInterfaceId'))
+        if eni is None and params.get('InstanceId'):
+            for candidate in r.enis.values():
+                attachment = candidate.get('Attachment')
+                if attachment and attachment['InstanceId'] == params['InstanceId'] and \
+                        attachment['DeviceIndex'] == 0:
+                    eni = candidate
+        if eni is None:
+            return self.error('InvalidNetworkInterfaceID.NotFound', 'The network interface does not exist')
+
+        association_id = self.next_id('eipassoc')
+        address['AssociationId'] = association_id
+        address['NetworkInterfaceId'] = eni['NetworkInterfaceId']
+        if 'Attachment' in eni:
+            address['InstanceId'] = eni['Attachment']['InstanceId']
+        eni['Association'] = {'PublicIp': address['PublicIp'], 'AllocationId': address['AllocationId'],
+                              'AssociationId': association_id, 'IpOwnerId': ACCOUNT_ID}
+
+        return {'AssociationId': association_id}
+
+    def op_ec2_DescribeAddresses(self, r, params):
+
+        public_ips = params.get('PublicIps')
+        allocation_ids = params.get('AllocationIds')
+
+        addresses = list()
+        for address in r.addresses.values():
+            if public_ips and address['PublicIp'] not in public_ips:
+                continue
+            if allocation_ids and address['AllocationId'] not in allocation_ids:
+                continue
+            addresses.append(dict(address))
+
+        if public_ips and len(addresses) < len(public_ips):
+            return self.error('InvalidAddress.NotFound', 'Address does not exist')
+
+        return {'Addresses': addresses}
@@ -0,0 +1,169 @@
+#
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file
+# except in compliance with the License. A copy of the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+
+import sys
+import queue
+import threading
+
+
+# marks the end of one task's records on the queue
+_done = object()
+
+
+def add_region_args(parser):
+    """
+    add --regions and --all-regions to a command's argument parser, next to its -r
+    """
+
+    parser.add_argument('--regions', dest='regions', required=False,
+                        help='Comma separated regions to run in, at the same time')
+    parser.add_argument('--all-regions', dest='all_regions', required=False, action='store_true',
+                        help='Run in every region enabled for the account, at the same time')
+    parser.add_argument('--max-workers', dest='max_workers', type=int, default=8, required=False,
+                        help='Regions read at the same time with --regions or --all-regions (default 8)')
+
+
+def get_regions(client_ec2):
+    """
+    returns list() of the regions enabled for the account, sorted
+    """
+
+    from botocore.exceptions import ClientError
+
+    try:
+        response = client_ec2.describe_regions()
+    except ClientError as e:
+        raise ValueError(e)
+
+    return sorted(r['RegionName'] for r in response['Regions'])
+
+
+def selected_regions(args, client_ec2):
+    """
+    returns list() of regions from --regions or --all-regions, or None if neither was given
+
+    :param client_ec2:  EC2 client, used to list the regions for --all-regions
+    """
+
+    if args.all_regions:
+        return get_regions(client_ec2)
+
+    if args.regions:
+        return [r.strip() for r in args.regions.split(',') if r.strip()]
+
+    return None
+
+
+class FanOut:
+
+    def __init__(self, max_workers=8, queue_size=1000):
+
+        """
+        Runs a generator function for each of several keys (e.g. regions) on a thread pool, and
+        merges what they yield into one stream as it arrives.  A task that fails doesn't stop the
+        others, its error is kept in errors.
+
+        The queue between the threads and the reader is bounded, so a slow reader holds the
+        threads back instead of the records piling up in memory.
+
+        :param max_workers:  tasks running at the same time
+        :param queue_size:  records waiting to be read, at most
+        """
+
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+        self.errors = dict()
+        self.counts = dict()
+
+    def run(self, tasks):
+        """
+        yields (key, item) for every item each task yields, in the order they arrive
+
+        :param tasks:  list() of (key, func), func is called without arguments and returns an iterable
+        """
+
+        tasks = list(tasks)
+        q = queue.Queue(maxsize=self.queue_size)
+        pending = queue.Queue()
+        stop = threading.Event()
+
+        for task in tasks:
+            pending.put(task)
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def worker():
+            while not stop.is_set():
+                try:
+                    key, func = pending.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    for item in func():
+                        if not put((key, item, None)):
+                            return
+                    put((key, _done, None))
+                except Exception as e:
+                    put((key, _done, e))
+
+        threads = [threading.Thread(target=worker, daemon=True)
+                   for n in range(min(self.max_workers, len(tasks)))]
+        for t in threads:
+            t.start()
+
+        remaining = len(tasks)
+        try:
+            while remaining:
+                key, item, error = q.get()
+                if item is _done:
+                    remaining -= 1
+                    if error is not None:
+                        self.errors[key] = error
+                    continue
+                self.counts[key] = self.counts.get(key, 0) + 1
+                yield key, item
+        finally:
+            # the reader stopped early, let the threads go
+            stop.set()
+
+    def print_errors(self, out=None):
+        """
+        print one line per failed task, to stderr
+
+        :return:  number of failed tasks
+        """
+
+        return print_errors(self.errors, out=out)
+
+
+def print_errors(errors, out=None):
+    """
+    print one line per error, to stderr
+
+    :param errors:  dictionary of key (e.g. region) -> exception
+    :return:  number of errors
+    """
+
+    out = out or sys.stderr
+    for key, e in sorted(errors.items()):
+        print('ERROR: {0}: {1}'.format(key, e), file=out)
+
+    return len(errors)
@@ -14,9 +14,8 @@
 #
 
 import sys
-import boto3
 import argparse
-from awscfnctl import CfnControl
+from awscfnctl.daemon import run_in_daemon
 
 progname = 'get_asg_from_stack'
 
@@ -26,6 +25,7 @@ def arg_parse():
 
     opt_group = parser.add_argument_group()
     opt_group.add_argument('-r', dest='region', required=False, help="Region name")
+    opt_group.add_argument('--stats', dest='stats', required=False, help='Print AWS API call statistics at exit', action='store_true')
 
     req_group = parser.add_argument_group('required arguments')
     req_group.add_argument('-s', dest='stack_name', required=True)
@@ -33,33 +33,32 @@ def arg_parse():
     return parser.parse_args()
 
 
-def get_asg_from_stack(stack_name, client):
-
-    asg = list()
-
-    stk_response = client.describe_stack_resources(StackName=stack_name)
-
-    for resp in stk_response['StackResources']:
-        for resrc_type in resp:
-            if resrc_type == "ResourceType":
-                if resp[resrc_type] == "AWS::AutoScaling::AutoScalingGroup":
-                    asg.append(resp['PhysicalResourceId'])
-
-    return asg
-
-
 def main():
 
+    # run by the daemon, if AWSCFNCTL_DAEMON is set and it is running
+    rc = run_in_daemon(progname)
+    if rc is not None:
+        return rc
+
     rc = 0
 
     args = arg_parse()
 
+    from awscfnctl import CfnControl
+
     region = args.region
     stack = args.stack_name
 
-    cfn_client = boto3.client('cloudformation', region_name=region)
+    client = CfnControl(region=region)
+
+    if args.stats:
+        client.api_stats.print_at_exit()
+
+    # keep the shell completion index of this region fresh
+    client.schedule_completion_refresh()
 
-    asg = get_asg_from_stack(stack, cfn_client)
+    # includes the ASGs of nested stacks
+    asg = client.get_asg_from_stack(stack_name=stack)
 
     for a in asg:
         print(' {}'.format(a))
@@ -14,9 +14,8 @@
 #
 
 import sys
-import boto3
 import argparse
-from awscfnctl import CfnControl
+from awscfnctl.daemon import run_in_daemon
 
 progname = 'get_inst_from_asg'
 
@@ -26,6 +25,7 @@ def arg_parse():
 
     opt_group = parser.add_argument_group()
     opt_group.add_argument('-r', dest='region', required=False, help="Region name")
+    opt_group.add_argument('--stats', dest='stats', required=False, help='Print AWS API call statistics at exit', action='store_true')
 
     req_group = parser.add_argument_group('required arguments')
     req_group.add_argument('-a', dest='asg_name', required=True)
@@ -35,15 +35,28 @@ def arg_parse():
 
 def main():
 
+    # run by the daemon, if AWSCFNCTL_DAEMON is set and it is running
+    rc = run_in_daemon(progname)
+    if rc is not None:
+        return rc
+
     rc = 0
 
     args = arg_parse()
 
+    from awscfnctl import CfnControl
+
     region = args.region
     asg = args.asg_name
 
     cfn_client = CfnControl(region=region)
 
+    if args.stats:
+        cfn_client.api_stats.print_at_exit()
+
+    # keep the shell completion index of this region fresh
+    cfn_client.schedule_completion_refresh()
+
     instances = cfn_client.get_inst_from_asg(asg)
 
     for i in instances:
@@ -13,8 +13,9 @@
 
 
 import sys
-import boto3
 import argparse
+from awscfnctl import ApiStats
+from awscfnctl.daemon import run_in_daemon
 
 progname = 'get_priv_dns_asg'
 
@@ -29,6 +30,7 @@ def arg_parse():
     parser.add_argument('-i', dest='print_inst_id', action='store_true',
                         help='Print the instance IDs with the private DNS names'
                         )
+    parser.add_argument('--stats', dest='stats', required=False, help='Print AWS API call statistics at exit', action='store_true')
 
     req_group = parser.add_argument_group('required arguments')
 
@@ -41,11 +43,23 @@ def arg_parse():
 
 def main():
 
+    # run by the daemon, if AWSCFNCTL_DAEMON is set and it is running
+    rc = run_in_daemon(progname)
+    if rc is not None:
+        return rc
+
     args = arg_parse()
 
+    import boto3
+
     region = args.region
     asg = args.asg
 
+    if args.stats:
+        api_stats = ApiStats()
+        api_stats.register()
+        api_stats.print_at_exit()
+
     asg_client = boto3.client('autoscaling', region_name=region)
     asg_response = asg_client.describe_auto_scaling_groups(AutoScalingGroupNames=[asg])
     ec2 = boto3.resource('ec2', region_name=region)
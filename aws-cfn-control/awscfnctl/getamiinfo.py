@@ -14,8 +14,8 @@
 #
 
 import sys
-import boto3
 import argparse
+from awscfnctl import ApiStats
 
 
 _PROPS = [
@@ -61,6 +61,7 @@ def arg_parse():
 
     opt_group = parser.add_argument_group('optional arguments')
     opt_group.add_argument('-r', dest='region', required=False, help="Region name (default is us-east-1)")
+    opt_group.add_argument('--stats', dest='stats', required=False, help='Print AWS API call statistics at exit', action='store_true')
 
     return parser.parse_args()
 
@@ -135,12 +136,20 @@ def main():
     rc = 0
 
     args = arg_parse()
+
+    import boto3
+
     region = args.region
     ami = args.ami_id
 
     if region == "":
         region = 'us-east-1'
 
+    if args.stats:
+        api_stats = ApiStats()
+        api_stats.register()
+        api_stats.print_at_exit()
+
     client = boto3.client('ec2', region_name=region)
     print("Checking region {0} for AMI info...".format(region))
     print_image_info(ami, client)
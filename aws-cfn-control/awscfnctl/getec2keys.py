@@ -13,9 +13,82 @@
 # License for the specific language governing permissions and limitations under the License.
 #
 
-import boto3
+import sys
+import argparse
+from awscfnctl import ApiStats
+from awscfnctl.fanout import add_region_args
+from awscfnctl.daemon import run_in_daemon
 
-ec2 = boto3.client('ec2')
-response = ec2.describe_key_pairs()
-for pair in (response['KeyPairs']):
-    print(pair['KeyName'])
+progname = 'getec2keys'
+
+
+def arg_parse():
+
+    parser = argparse.ArgumentParser(prog=progname, description='List EC2 key pairs')
+
+    opt_group = parser.add_argument_group()
+    opt_group.add_argument('-r', dest='region', required=False, help="Region name")
+    opt_group.add_argument('--stats', dest='stats', required=False, help='Print AWS API call statistics at exit',
+                           action='store_true')
+    add_region_args(opt_group)
+
+    return parser.parse_args()
+
+
+def main():
+
+    # run by the daemon, if AWSCFNCTL_DAEMON is set and it is running
+    rc = run_in_daemon(progname)
+    if rc is not None:
+        return rc
+
+    rc = 0
+
+    args = arg_parse()
+
+    import boto3
+
+    if args.stats:
+        api_stats = ApiStats()
+        api_stats.register()
+        api_stats.print_at_exit()
+
+    from awscfnctl.fanout import FanOut
+    from awscfnctl.fanout import selected_regions
+
+    ec2 = boto3.client('ec2', region_name=args.region)
+
+    regions = selected_regions(args, ec2)
+
+    if regions is None:
+        response = ec2.describe_key_pairs()
+        for pair in (response['KeyPairs']):
+            print(pair['KeyName'])
+        return rc
+
+    def key_names(client):
+        response = client.describe_key_pairs()
+        return [pair['KeyName'] for pair in response['KeyPairs']]
+
+    # boto3 clients are made here, the threads only make API calls
+    fan_out = FanOut(max_workers=args.max_workers)
+    tasks = list()
+    for r in regions:
+        client = boto3.client('ec2', region_name=r)
+        tasks.append((r, lambda c=client: key_names(c)))
+    for r, key_name in fan_out.run(tasks):
+        print('{0:<16} {1}'.format(r, key_name))
+
+    if fan_out.print_errors():
+        rc = 1
+
+    return rc
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print('\nReceived Keyboard interrupt.')
+        print('Exiting...')
+    except ValueError as e:
+        print('ERROR: {0}'.format(e))
@@ -17,8 +17,11 @@
 
 import sys
 import argparse
-import datetime
-from awscfnctl import CfnControl
+from awscfnctl.output import add_output_args
+from awscfnctl.output import parse_fields
+from awscfnctl.output import parse_tags
+from awscfnctl.fanout import add_region_args
+from awscfnctl.daemon import run_in_daemon
 
 def prRed(prt): return("\033[91m{}\033[00m".format(prt))
 def prGreen(prt): return("\033[92m{}\033[00m".format(prt))
@@ -33,18 +36,12 @@ def prBlack(prt): return("\033[98m{}\033[00m".format(prt))
 progname = 'getinstinfo'
 
 
-def Sort(sub_li):
+line_fmt = '{:<20} {:<20} {:<20.20}  {:<30}  {:<15}  {:<7}  {:<15}  {:<20}'
 
-    # reverse = None (Sorts in Ascending order)
-    # key is set to sort using second element of
-    # sublist lambda has been used
-    sub_li.sort(key = lambda x: x[1])
-    return sub_li
 
+def print_header(regions=False):
 
-def print_header():
-
-    print('{:<20} {:<20} {:<20.20} {:<30}  {:<15}  {:<7}  {:<15}  {:<20}'.format(
+    header = line_fmt.format(
         'Instance ID',
         'Launch Date',
         'Name',
@@ -53,7 +50,12 @@ def print_header():
         'State',
         'Public IP',
         'Instance type'
-    ))
+    )
+    if regions:
+        header += '{:<15}'.format('Region')
+
+    print(header)
+    print((170 if regions else 155) * '-')
 
 
 def arg_parse():
@@ -64,37 +66,127 @@ def arg_parse():
     opt_group.add_argument('-s', dest='instance_state', required=False,
                            help='Instance State (pending | running | shutting-down | terminated | stopping | stopped)'
                            )
-
-    req_group = parser.add_argument_group('required arguments')
-    req_group.add_argument('-r', dest='region', required=True)
-
-    return parser.parse_args()
+    opt_group.add_argument('-t', dest='tags', action='append', required=False, metavar='KEY[=VALUE]',
+                           help='Only instances with this tag (any value without =VALUE), can be repeated')
+    opt_group.add_argument('-a', dest='asg', action='append', required=False,
+                           help='Only instances in this Auto Scaling group, can be repeated')
+    opt_group.add_argument('--vpc', dest='vpc_id', required=False, help='Only instances in this VPC')
+    opt_group.add_argument('--type', dest='instance_types', action='append', required=False,
+                           help='Only instances of this instance type, can be repeated')
+    opt_group.add_argument('--sort', dest='sort', required=False,
+                           help='Sort by this field (default Name), e.g. LaunchTime, InstanceType, PrivateIpAddress')
+    opt_group.add_argument('--reverse', dest='reverse', required=False, action='store_true',
+                           help='Sort largest first')
+    opt_group.add_argument('--top', dest='top', type=int, required=False,
+                           help='Only the first TOP instances in the sort order')
+    opt_group.add_argument('--stats', dest='stats', required=False, help='Print AWS API call statistics at exit', action='store_true')
+    add_output_args(opt_group)
+
+    opt_group.add_argument('-r', dest='region', required=False,
+                           help='Region name, required unless --regions lists the regions')
+    add_region_args(opt_group)
+
+    args = parser.parse_args()
+
+    if not args.region and not (args.regions or '').strip(', '):
+        parser.error('-r is required without --regions')
+
+    return args
 
 def main():
 
+    # run by the daemon, if AWSCFNCTL_DAEMON is set and it is running
+    rc = run_in_daemon(progname)
+    if rc is not None:
+        return rc
+
     rc = 0
 
     args = arg_parse()
+
+    import functools
+    from awscfnctl import CfnControl
+    from awscfnctl.fanout import FanOut
+    from awscfnctl.fanout import selected_regions
+    from awscfnctl.inventory import top_records
+    from awscfnctl.inventory import DEFAULT_INSTANCE_FIELDS
+
     region = args.region
+    if not region:
+        # the client the regional ones are made from, in the first of the listed regions
+        region = [r.strip() for r in args.regions.split(',') if r.strip()][0]
     instance_state = args.instance_state
 
-    inst_info_all = list()
-
-    client = CfnControl(region=region)
-    for inst, info in client.get_instance_info(instance_state=instance_state).items():
-        inst_info = list()
-        inst_info.append(inst)
-        for k, v in info.items():
-            if isinstance(v, datetime.datetime):
-                v = str(v)[:-6]
-            inst_info.append(v)
-        inst_info_all.append(inst_info)
-
-    print
-    print_header()
-    print(155 * '-')
-    print('\n'.join('{:<20} {:<20} {:<20.20}  {:<30}  {:<15}  {:<7}  {:<15}  {:<20}'.format(*i) for i in Sort(inst_info_all)))
-    print
+    client = CfnControl(region=region, quiet=(args.output != 'table'))
+
+    if args.stats:
+        client.api_stats.print_at_exit()
+
+    # keep the shell completion index of this region fresh
+    client.schedule_completion_refresh()
+
+    regions = selected_regions(args, client.client_ec2)
+
+    fields = parse_fields(args.fields) if args.output != 'table' else None
+    sort_by = args.sort or 'Name'
+
+    # the fields written, with several regions each record says which region it came from
+    shown = list(fields or DEFAULT_INSTANCE_FIELDS)
+    if regions is not None and 'Region' not in shown:
+        shown = ['Region'] + shown
+
+    # the sort field is read even when it isn't written
+    projection = shown
+    if sort_by not in shown:
+        projection = shown + [sort_by]
+
+    query = {
+        'instance_state': instance_state,
+        'tags': parse_tags(args.tags),
+        'vpc_id': args.vpc_id,
+        'instance_types': args.instance_types,
+        'asg': args.asg,
+        'fields': projection,
+    }
+
+    fan_out = None
+    if regions is None:
+        records = client.iter_instance_info(**query)
+    else:
+        # the regional clients are made here, the threads only make API calls
+        fan_out = FanOut(max_workers=args.max_workers)
+        tasks = [(r, functools.partial(client.for_region(r).iter_instance_info, **query)) for r in regions]
+        records = (record for r, record in fan_out.run(tasks))
+
+    if args.output != 'table':
+        # without --sort or --top the records are written as they arrive
+        from awscfnctl.output import RecordWriter
+        writer = RecordWriter(args.output, fields=shown)
+        if args.sort or args.top is not None:
+            records = top_records(records, sort_by, top=args.top, reverse=args.reverse)
+        writer.write_all(records)
+    else:
+        print
+        print_header(regions=regions is not None)
+        for i in top_records(records, sort_by, top=args.top, reverse=args.reverse):
+            line = line_fmt.format(
+                i.InstanceId,
+                i.LaunchTime.strftime('%Y-%m-%d %H:%M:%S'),
+                i.Name,
+                i.PrivateDnsName or '',
+                i.PrivateIpAddress or '',
+                i.State,
+                i.PublicIpAddress or '',
+                i.InstanceType
+            )
+            if regions is not None:
+                line += '{:<15}'.format(i.Region)
+            print(line)
+        print
+
+    # a region that failed is reported, the others are still listed
+    if fan_out is not None and fan_out.print_errors():
+        rc = 1
 
     return rc
 
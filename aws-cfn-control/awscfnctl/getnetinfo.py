@@ -15,7 +15,8 @@
 
 import sys
 import argparse
-from awscfnctl import CfnControl
+from awscfnctl.fanout import add_region_args
+from awscfnctl.daemon import run_in_daemon
 
 progname = 'getnetinfo'
 
@@ -26,6 +27,8 @@ def arg_parse():
 
     opt_group = parser.add_argument_group()
     opt_group.add_argument('-r', dest='region', required=False, help="Region name")
+    opt_group.add_argument('--stats', dest='stats', required=False, help='Print AWS API call statistics at exit', action='store_true')
+    add_region_args(opt_group)
 
     return parser.parse_args()
 
@@ -59,14 +62,12 @@ def get_sec_groups(client, vpc):
     return ' '.join(security_groups)
 
 
-def main():
-
-    rc = 0
+def vpc_blocks(client, region=None):
+    """
+    yields the printable description of each VPC in the client's region
 
-    args = arg_parse()
-    region = args.region
-
-    client = CfnControl(region=region)
+    :param region:  added to the VPC heading, when several regions are listed
+    """
 
     vpc_keys_to_print = [
         'Tag_Name',
@@ -77,16 +78,66 @@ def main():
     all_vpcs = client.get_vpcs()
 
     for vpc_id, vpc_info in all_vpcs.items():
-        lines = '=' * len(vpc_id)
-        print('{0}\n{1}\n{2}'.format(lines, vpc_id, lines))
-        print('   Subnets: {0}'.format(get_subnets(client,vpc_id)))
+        heading = vpc_id
+        if region is not None:
+            heading = '{0} ({1})'.format(vpc_id, region)
+        lines = '=' * len(heading)
+        block = list()
+        block.append('{0}\n{1}\n{2}'.format(lines, heading, lines))
+        block.append('   Subnets: {0}'.format(get_subnets(client, vpc_id)))
         for vpc_k in vpc_keys_to_print:
             try:
-                print('   {0} = {1}'.format(vpc_k, vpc_info[vpc_k]))
+                block.append('   {0} = {1}'.format(vpc_k, vpc_info[vpc_k]))
             except KeyError:
                 pass
-        print('   Security Groups: {0}'.format(get_sec_groups(client,vpc_id)))
-        print("")
+        block.append('   Security Groups: {0}'.format(get_sec_groups(client, vpc_id)))
+        block.append("")
+        yield '\n'.join(block)
+
+
+def main():
+
+    # run by the daemon, if AWSCFNCTL_DAEMON is set and it is running
+    rc = run_in_daemon(progname)
+    if rc is not None:
+        return rc
+
+    rc = 0
+
+    args = arg_parse()
+
+    from awscfnctl import CfnControl
+    from awscfnctl.fanout import FanOut
+    from awscfnctl.fanout import selected_regions
+
+    region = args.region
+
+    client = CfnControl(region=region)
+
+    if args.stats:
+        client.api_stats.print_at_exit()
+
+    # keep the shell completion index of this region fresh
+    client.schedule_completion_refresh()
+
+    regions = selected_regions(args, client.client_ec2)
+
+    if regions is None:
+        for block in vpc_blocks(client):
+            print(block)
+        return rc
+
+    # the VPCs of each region are printed as soon as that region has been read
+    fan_out = FanOut(max_workers=args.max_workers)
+    tasks = list()
+    for r in regions:
+        regional = client.for_region(r)
+        tasks.append((r, lambda c=regional: vpc_blocks(c, region=c.region)))
+    for r, block in fan_out.run(tasks):
+        print(block)
+
+    if fan_out.print_errors():
+        rc = 1
 
     return rc
 
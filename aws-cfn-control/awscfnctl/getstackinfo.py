@@ -14,69 +14,101 @@
 #
 
 import sys
-import time
 import argparse
-from awscfnctl import CfnControl
+from awscfnctl.output import add_output_args
+from awscfnctl.output import parse_fields
+from awscfnctl.daemon import run_in_daemon
 
 progname = 'getstackinfo'
 
 
 def arg_parse():
 
-    parser = argparse.ArgumentParser(prog=progname, description='Get information for a stack')
+    parser = argparse.ArgumentParser(prog=progname, description='Get information for a stack, and tail the events '
+                                                                'of one or more stacks until they are done')
 
     opt_group = parser.add_argument_group()
     opt_group.add_argument('-r', dest='region', required=False)
+    opt_group.add_argument('--stats', dest='stats', required=False, help='Print AWS API call statistics at exit', action='store_true')
+    opt_group.add_argument('--max-interval', dest='max_interval', type=float, default=30.0, required=False,
+                           help='Longest wait between polls of a quiet stack, in seconds (default 30)')
+    opt_group.add_argument('-w', '--watch', dest='watch', required=False, action='store_true',
+                           help='Watch many stacks: one list of all stack statuses per tick, events only for '
+                                'the stacks that changed, and a status table')
+    opt_group.add_argument('--interval', dest='interval', type=float, default=5.0, required=False,
+                           help='Seconds between ticks with --watch (default 5)')
+    add_output_args(opt_group)
 
-    req_group = parser.add_argument_group('required arguments')
-    req_group.add_argument('-s', dest='stack_name', required=True)
+    req_group = parser.add_argument_group('stacks (at least one of)')
+    req_group.add_argument('-s', dest='stack_name', action='append', required=False,
+                           help='Stack name, repeat for more than one')
+    req_group.add_argument('-p', dest='prefix', required=False, help='All stacks whose name starts with this')
 
-    return parser.parse_args()
+    args = parser.parse_args()
 
+    if not args.stack_name and not args.prefix:
+        parser.error('a stack (-s) or a stack name prefix (-p) is required')
 
-def get_stack_events(client, stack_name):
-
-    try:
-        paginator = client.get_paginator('describe_stack_events')
-        pages = paginator.paginate(StackName=stack_name, PaginationConfig={'MaxItems': 100})
-        return next(iter(pages))["StackEvents"]
-    except Exception as e:
-        raise ValueError(e)
+    return args
 
 
 def main():
 
+    # run by the daemon, if AWSCFNCTL_DAEMON is set and it is running
+    rc = run_in_daemon(progname)
+    if rc is not None:
+        return rc
+
     rc = 0
 
     args = arg_parse()
+
+    from awscfnctl import CfnControl
+    from awscfnctl.stacktail import find_stacks
+    from awscfnctl.stacktail import StackTail
+    from awscfnctl.stacktail import StackWatch
+    from awscfnctl.stacktail import FAILED_STATUSES
+
     region = args.region
-    stack_name = args.stack_name
 
+    client = CfnControl(region=region, quiet=(args.output != 'table'))
+
+    if args.stats:
+        client.api_stats.print_at_exit()
+
+    # keep the shell completion index of this region fresh
+    client.schedule_completion_refresh()
+
+    stacks = find_stacks(client.client_cfn, stack_names=args.stack_name, prefix=args.prefix)
 
-    client = CfnControl(region=region)
-    client.get_stack_info(stack_name=stack_name)
+    if not stacks:
+        raise ValueError('No stacks found starting with {0}'.format(args.prefix))
 
-    all_events = list()
+    writer = None
+    if args.output != 'table':
+        # one record per event: StackName, StackId, EventId, Timestamp, LogicalResourceId, ...
+        from awscfnctl.output import RecordWriter
+        writer = RecordWriter(args.output, fields=parse_fields(args.fields))
+    elif len(stacks) == 1:
+        client.get_stack_info(stack_name=stacks[0][0])
 
-    events = True
+    if args.watch:
+        tail = StackWatch(client.client_cfn, interval=args.interval, prefix=len(stacks) > 1, writer=writer)
+    else:
+        tail = StackTail(client.client_cfn, max_interval=args.max_interval, prefix=len(stacks) > 1,
+                         writer=writer)
+    for stack_name, stack_id, stack_status in stacks:
+        tail.add(stack_name, stack_id, stack_status)
 
-    while events:
-        stk_status = get_stack_events(client.client_cfn, stack_name)
+    final = tail.run()
 
-        for s in reversed(stk_status):
-            event_id = s['EventId']
-            if event_id not in all_events:
-                all_events.append(event_id)
-                try:
-                    print('{0} {1} {2}'.format(s['LogicalResourceId'], s['ResourceStatus'], s['ResourceStatusReason']))
-                except KeyError:
-                    print('{0} {1}'.format(s['LogicalResourceId'], s['ResourceStatus']))
-                except Exception as e:
-                    raise ValueError(e)
+    if len(stacks) > 1 and not args.watch and writer is None:
+        print('')
+        for stack_name, stack_status in sorted(final.items()):
+            print('{0:<40} {1}'.format(stack_name, stack_status))
 
-                if s['LogicalResourceId'] == stack_name and s['ResourceStatus'] == 'ROLLBACK_COMPLETE':
-                    events = False
-        time.sleep(1)
+    if [s for s in final.values() if s in FAILED_STATUSES]:
+        rc = 1
 
     return rc
 
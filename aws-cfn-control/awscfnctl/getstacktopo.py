@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+#
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file
+# except in compliance with the License. A copy of the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+
+import sys
+import argparse
+from awscfnctl.output import add_output_args
+from awscfnctl.output import parse_fields
+from awscfnctl.daemon import run_in_daemon
+
+progname = 'getstacktopo'
+
+
+def arg_parse():
+
+    parser = argparse.ArgumentParser(prog=progname, description='Show the ASGs, instances, network interfaces and '
+                                                                'Elastic IPs of a stack and its nested stacks')
+
+    opt_group = parser.add_argument_group()
+    opt_group.add_argument('-r', dest='region', required=False)
+    opt_group.add_argument('--stats', dest='stats', required=False, help='Print AWS API call statistics at exit', action='store_true')
+    opt_group.add_argument('--save', dest='save', required=False, metavar='FILE',
+                           help='Save the topology to a JSON snapshot')
+    opt_group.add_argument('--load', dest='load', required=False, metavar='FILE',
+                           help='Read the topology from a snapshot saved with --save, no AWS calls are made')
+    opt_group.add_argument('--ip', dest='ip', action='append', required=False,
+                           help='Only show the instance with this private or Elastic IP, repeat for more than one')
+    add_output_args(opt_group)
+
+    req_group = parser.add_argument_group('stack (unless --load is given)')
+    req_group.add_argument('-n', dest='stack_name', required=False, help='Stack name')
+
+    args = parser.parse_args()
+
+    if not args.stack_name and not args.load:
+        parser.error('a stack (-n) or a snapshot (--load) is required')
+
+    return args
+
+
+def main():
+
+    # run by the daemon, if AWSCFNCTL_DAEMON is set and it is running
+    rc = run_in_daemon(progname)
+    if rc is not None:
+        return rc
+
+    rc = 0
+
+    args = arg_parse()
+
+    from awscfnctl.topology import StackTopology
+
+    if args.load:
+        topology = StackTopology.load(args.load)
+        if args.stack_name and args.stack_name not in (topology.stack['StackName'], topology.stack['StackId']):
+            raise ValueError('Snapshot {0} is of stack {1}, not {2}'.format(args.load, topology.stack['StackName'],
+                                                                          args.stack_name))
+    else:
+        from awscfnctl import CfnControl
+
+        client = CfnControl(region=args.region, quiet=(args.output != 'table'))
+
+        if args.stats:
+            client.api_stats.print_at_exit()
+
+        # keep the shell completion index of this region fresh
+        client.schedule_completion_refresh()
+
+        topology = client.get_stack_topology(args.stack_name)
+
+    if args.save:
+        topology.save(args.save)
+
+    records = list(topology.records())
+    if args.ip:
+        found = [topology.find_ip(ip) for ip in args.ip]
+        for ip, i in zip(args.ip, found):
+            if i is None:
+                print('No instance with IP {0} in stack {1}'.format(ip, topology.stack['StackName']), file=sys.stderr)
+                rc = 1
+        wanted = set(i['InstanceId'] for i in found if i is not None)
+        records = [r for r in records if r['InstanceId'] in wanted]
+
+    if args.output != 'table':
+        from awscfnctl.output import RecordWriter
+        RecordWriter(args.output, fields=parse_fields(args.fields)).write_all(records)
+    elif args.ip:
+        line_fmt = '{0:<16} {1:<20} {2:<40} {3:<15} {4}'
+        print(line_fmt.format('IP', 'Instance', 'ASG', 'Private IP', 'Elastic IP'))
+        print(110 * '-')
+        for ip in args.ip:
+            i = topology.find_ip(ip)
+            if i is not None:
+                r = [r for r in records if r['InstanceId'] == i['InstanceId']][0]
+                print(line_fmt.format(ip, r['InstanceId'], r['AutoScalingGroup'] or '', r['PrivateIpAddress'] or '',
+                                      r['ElasticIp'] or ''))
+    else:
+        if args.load:
+            print('Snapshot of {0}, taken {1}'.format(topology.region, topology.taken))
+        print(topology.format_tree())
+
+    return rc
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print('\nReceived Keyboard interrupt.')
+        print('Exiting...')
+    except ValueError as e:
+        print('ERROR: {0}'.format(e))
+
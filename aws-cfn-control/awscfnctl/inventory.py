@@ -0,0 +1,209 @@
+#
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file
+# except in compliance with the License. A copy of the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+
+import heapq
+
+
+# every field an instance record can have, in output order
+INSTANCE_FIELDS = (
+    'InstanceId',
+    'Name',
+    'InstanceType',
+    'State',
+    'PrivateIpAddress',
+    'PrivateDnsName',
+    'PublicIpAddress',
+    'LaunchTime',
+    'ImageId',
+    'KeyName',
+    'VpcId',
+    'SubnetId',
+    'AvailabilityZone',
+    'AutoScalingGroup',
+    'StackName',
+    'Region',
+)
+
+# the fields of a record when none are asked for
+DEFAULT_INSTANCE_FIELDS = INSTANCE_FIELDS[:8]
+
+_instance_getters = {
+    'InstanceId': lambda i, tags, region: i['InstanceId'],
+    'Name': lambda i, tags, region: tags.get('Name', 'NULL'),
+    'InstanceType': lambda i, tags, region: i['InstanceType'],
+    'State': lambda i, tags, region: i['State']['Name'],
+    'PrivateIpAddress': lambda i, tags, region: i.get('PrivateIpAddress'),
+    'PrivateDnsName': lambda i, tags, region: i.get('PrivateDnsName'),
+    'PublicIpAddress': lambda i, tags, region: i.get('PublicIpAddress'),
+    'LaunchTime': lambda i, tags, region: i['LaunchTime'],
+    'ImageId': lambda i, tags, region: i.get('ImageId'),
+    'KeyName': lambda i, tags, region: i.get('KeyName'),
+    'VpcId': lambda i, tags, region: i.get('VpcId'),
+    'SubnetId': lambda i, tags, region: i.get('SubnetId'),
+    'AvailabilityZone': lambda i, tags, region: i.get('Placement', dict()).get('AvailabilityZone'),
+    'AutoScalingGroup': lambda i, tags, region: tags.get('aws:autoscaling:groupName'),
+    'StackName': lambda i, tags, region: tags.get('aws:cloudformation:stack-name'),
+    'Region': lambda i, tags, region: region,
+}
+
+# fields tuple -> record class
+_record_classes = dict()
+
+
+class InstanceRecord:
+
+    """
+    One instance, holding only the projected fields.  The subclasses made by record_class() have
+    a __slots__ entry per field, so a record has no per instance dictionary.  Records read like a
+    read only dictionary (get, [], iteration over the field names), which is what RecordWriter uses.
+    """
+
+    __slots__ = ()
+    fields = ()
+
+    def __init__(self, instance, region=None):
+
+        tags = dict((t['Key'], t['Value']) for t in instance.get('Tags', list()))
+        for f in self.fields:
+            setattr(self, f, _instance_getters[f](instance, tags, region))
+
+    def __getitem__(self, field):
+
+        if field not in self.fields:
+            raise KeyError(field)
+
+        return getattr(self, field)
+
+    def __iter__(self):
+
+        return iter(self.fields)
+
+    def get(self, field, default=None):
+
+        if field not in self.fields:
+            return default
+
+        return getattr(self, field)
+
+    def as_dict(self):
+
+        return dict((f, getattr(self, f)) for f in self.fields)
+
+    def __repr__(self):
+
+        return '{0}({1})'.format(self.__class__.__name__,
+                                 ', '.join('{0}={1!r}'.format(f, getattr(self, f)) for f in self.fields))
+
+
+def record_class(fields=None):
+    """
+    returns the InstanceRecord class for a projection, one class is made per distinct field list
+
+    :param fields:  list() of field names from INSTANCE_FIELDS, default DEFAULT_INSTANCE_FIELDS
+    """
+
+    fields = tuple(fields or DEFAULT_INSTANCE_FIELDS)
+
+    unknown = [f for f in fields if f not in _instance_getters]
+    if unknown:
+        errmsg = 'Unknown instance field(s) {0}, choose from {1}'.format(', '.join(unknown),
+                                                                         ', '.join(INSTANCE_FIELDS))
+        raise ValueError(errmsg)
+
+    if fields not in _record_classes:
+        _record_classes[fields] = type('InstanceRecord', (InstanceRecord,), {'__slots__': fields, 'fields': fields})
+
+    return _record_classes[fields]
+
+
+def instance_filters(instance_state=None, tags=None, vpc_id=None, instance_types=None, asg=None):
+    """
+    returns the describe_instances Filters for the given conditions, so EC2 only sends the
+    instances that match
+
+    :param instance_state:  pending | running | shutting-down | terminated | stopping | stopped
+    :param tags:  dictionary of tag key -> value, a value of None matches any value of the key
+    :param vpc_id:  VPC ID
+    :param instance_types:  list() of instance types
+    :param asg:  list() of Auto Scaling group names the instances belong to
+    """
+
+    filters = list()
+
+    if instance_state:
+        filters.append({'Name': 'instance-state-name', 'Values': [instance_state]})
+    if vpc_id:
+        filters.append({'Name': 'vpc-id', 'Values': [vpc_id]})
+    if instance_types:
+        filters.append({'Name': 'instance-type', 'Values': list(instance_types)})
+    if asg:
+        filters.append({'Name': 'tag:aws:autoscaling:groupName', 'Values': list(asg)})
+    for k, v in sorted((tags or dict()).items()):
+        if v is None:
+            filters.append({'Name': 'tag-key', 'Values': [k]})
+        else:
+            filters.append({'Name': 'tag:{0}'.format(k), 'Values': [v]})
+
+    return filters
+
+
+def sort_key(field, fields=INSTANCE_FIELDS):
+    """
+    returns a key function ordering records by field, IP addresses in numeric order and a missing
+    value after any other
+
+    :param fields:  the fields the records can have, default those of an instance record
+    """
+
+    if field not in fields:
+        errmsg = 'Unknown field {0}, choose from {1}'.format(field, ', '.join(fields))
+        raise ValueError(errmsg)
+
+    if field in ('PrivateIpAddress', 'PublicIpAddress'):
+        def value(v):
+            return tuple(int(n) for n in v.split('.'))
+    else:
+        def value(v):
+            return v
+
+    def key(record):
+        v = record.get(field)
+        if v is None:
+            return (1, ())
+        return (0, value(v))
+
+    return key
+
+
+def top_records(records, sort_by, top=None, reverse=False, fields=INSTANCE_FIELDS):
+    """
+    returns list() of records ordered by the sort_by field.  With top only that many are kept
+    while reading, in a heap, so the memory used doesn't grow with the number of records.
+
+    :param records:  iterable of records, e.g. from CfnControl.iter_instance_info()
+    :param sort_by:  field name
+    :param top:  number of records to return, default all
+    :param reverse:  largest first
+    :param fields:  the fields the records can have, default those of an instance record
+    """
+
+    key = sort_key(sort_by, fields=fields)
+
+    if top is None:
+        return sorted(records, key=key, reverse=reverse)
+
+    if reverse:
+        return heapq.nlargest(top, records, key=key)
+
+    return heapq.nsmallest(top, records, key=key)
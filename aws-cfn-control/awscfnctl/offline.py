@@ -0,0 +1,170 @@
+#
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file
+# except in compliance with the License. A copy of the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+
+import os
+import json
+import datetime
+
+
+# parameter types whose values come from the account, an offline build marks them to be checked again at create
+ACCOUNT_PARAM_TYPES = [
+    'AWS::EC2::KeyPair::KeyName',
+    'AWS::EC2::VPC::Id',
+    'AWS::EC2::Subnet::Id',
+    'List<AWS::EC2::Subnet::Id>',
+    'AWS::EC2::SecurityGroup::Id',
+]
+
+# [AWS-Config] keys an offline build adds to the parameters file
+REVALIDATE_KEY = 'Revalidate'
+INVENTORY_TAKEN_KEY = 'InventoryTaken'
+
+SNAPSHOT_VERSION = 1
+
+
+def snapshot_path(cfn_param_file_dir, aws_profile, region):
+    """
+    returns the file name of the inventory snapshot of a profile and region
+    """
+
+    return os.path.join(cfn_param_file_dir, '.cache', 'inventory-{0}-{1}.json'.format(aws_profile, region))
+
+
+def block_api_calls(session):
+    """
+    make every AWS call made through the session's clients fail instead of going out
+    """
+
+    def before_call(model=None, **kwargs):
+        errmsg = 'Offline: {0}.{1} needs AWS, run without --offline'.format(model.service_model.service_name,
+                                                                          model.name)
+        raise ValueError(errmsg)
+
+    session.events.register_first('before-call', before_call, unique_id='awscfnctl-offline')
+
+
+class InventorySnapshot:
+
+    def __init__(self, path):
+
+        """
+        What "cfnctl build" asks the account for, saved so parameters files can be built without
+        network access: the key pairs, VPCs, subnets and security groups of one profile and region,
+        and the templates read from S3.  Saved by "cfnctl snapshot", read by "cfnctl build --offline".
+
+        :param path:  JSON file, see snapshot_path()
+        """
+
+        self.path = path
+        self.data = {
+            'version': SNAPSHOT_VERSION,
+            'taken': None,
+            'profile': None,
+            'region': None,
+            'KeyPairs': list(),
+            'Vpcs': list(),
+            'Subnets': list(),
+            'SecurityGroups': list(),
+            'Templates': dict(),
+        }
+
+    def capture(self, client, templates=None):
+        """
+        read the inventory through a CfnControl, one call per resource type
+
+        :param client:  CfnControl, online
+        :param templates:  list() of template S3 URLs to keep, templates saved earlier are kept too
+        """
+
+        try:
+            self.load()
+        except ValueError:
+            pass
+
+        self.data['taken'] = datetime.datetime.utcnow().replace(microsecond=0).isoformat() + 'Z'
+        self.data['profile'] = client.aws_profile
+        self.data['region'] = client.region
+        self.data['KeyPairs'] = list(client.key_pairs)
+        self.data['Vpcs'] = client.client_ec2.describe_vpcs()['Vpcs']
+        self.data['Subnets'] = client.client_ec2.describe_subnets()['Subnets']
+        self.data['SecurityGroups'] = client.client_ec2.describe_security_groups()['SecurityGroups']
+
+        for url in (templates or list()):
+            self.data['Templates'][url] = client.read_template_url(url)
+
+    def load(self):
+
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError) as e:
+            errmsg = 'No inventory snapshot {0}, save one with "cfnctl snapshot" while online: {1}'.format(self.path, e)
+            raise ValueError(errmsg)
+
+        if data.get('version') != SNAPSHOT_VERSION:
+            errmsg = 'Inventory snapshot {0} is from another version, save it again with "cfnctl snapshot"'.format(
+                self.path)
+            raise ValueError(errmsg)
+
+        self.data = data
+
+        return self
+
+    def save(self):
+
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmp = '{0}.{1}.tmp'.format(self.path, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(self.data, f, indent=1, sort_keys=True, default=str)
+        os.replace(tmp, self.path)
+
+    @property
+    def taken(self):
+
+        return self.data['taken']
+
+    def key_pairs(self):
+
+        return list(self.data['KeyPairs'])
+
+    def vpcs(self):
+
+        return list(self.data['Vpcs'])
+
+    def subnets(self, vpc=None):
+
+        return [s for s in self.data['Subnets'] if vpc is None or s['VpcId'] == vpc]
+
+    def security_groups(self, vpc=None):
+
+        return [g for g in self.data['SecurityGroups'] if vpc is None or g.get('VpcId') == vpc]
+
+    def template(self, url):
+        """
+        returns the saved content of a template read from S3
+        """
+
+        try:
+            return self.data['Templates'][url]
+        except KeyError:
+            errmsg = 'Template {0} is not in the inventory snapshot, save it with "cfnctl snapshot -t {0}"'.format(url)
+            raise ValueError(errmsg)
+
+    def summary(self):
+
+        return '{0} key pairs, {1} VPCs, {2} subnets, {3} security groups, {4} templates'.format(
+            len(self.data['KeyPairs']), len(self.data['Vpcs']), len(self.data['Subnets']),
+            len(self.data['SecurityGroups']), len(self.data['Templates']))
@@ -0,0 +1,132 @@
+#
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file
+# except in compliance with the License. A copy of the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+import sys
+import csv
+import json
+import datetime
+
+
+OUTPUT_FORMATS = ['table', 'jsonl', 'csv']
+
+
+def add_output_args(parser):
+    """
+    add --output and --fields to a command's argument parser
+    """
+
+    parser.add_argument('--output', dest='output', choices=OUTPUT_FORMATS, default='table', required=False,
+                        help='Output format: table (default), jsonl (one JSON object per line) or csv, '
+                             'records are written as they arrive')
+    parser.add_argument('--fields', dest='fields', required=False,
+                        help='Comma separated fields to output with jsonl or csv, default all')
+
+
+def parse_fields(fields):
+    """
+    returns list() of field names from "a,b,c", or None for all fields
+    """
+
+    if not fields:
+        return None
+
+    return [f.strip() for f in fields.split(',') if f.strip()]
+
+
+def parse_tags(tag_args):
+    """
+    returns dictionary of tag key -> value from KEY=VALUE arguments, a bare KEY matches any value
+    """
+
+    tags = dict()
+    for t in tag_args or list():
+        k, sep, v = t.partition('=')
+        tags[k] = v if sep else None
+
+    return tags
+
+
+def format_value(v):
+
+    if isinstance(v, datetime.datetime):
+        return v.isoformat()
+
+    return v
+
+
+def format_csv_value(v):
+
+    if v is None:
+        return ''
+
+    # e.g. the tags of a stack, kept as one JSON column
+    if isinstance(v, (dict, list)):
+        return json.dumps(v, sort_keys=True, default=str)
+
+    return format_value(v)
+
+
+class RecordWriter:
+
+    def __init__(self, output_format, fields=None, out=None):
+
+        """
+        Writes records (dictionaries) one at a time as JSON lines or CSV, nothing is kept after
+        a record is written
+
+        :param output_format:  jsonl or csv
+        :param fields:  list() of fields to write, in order, default all of the fields of the first
+                        record (csv) or of each record (jsonl)
+        :param out:  file to write to, default stdout
+        """
+
+        if output_format not in ('jsonl', 'csv'):
+            errmsg = 'Output format "{0}" is not jsonl or csv'.format(output_format)
+            raise ValueError(errmsg)
+
+        self.output_format = output_format
+        self.fields = fields
+        self.out = out or sys.stdout
+        self.csv_writer = None
+        self.count = 0
+
+    def write(self, record):
+
+        fields = self.fields or list(record)
+
+        if self.output_format == 'jsonl':
+            line = json.dumps(dict((f, format_value(record.get(f))) for f in fields), default=str)
+            self.out.write(line + '\n')
+        else:
+            if self.csv_writer is None:
+                # the columns are fixed by the first record
+                self.fields = fields
+                self.csv_writer = csv.writer(self.out)
+                self.csv_writer.writerow(fields)
+            self.csv_writer.writerow([format_csv_value(record.get(f)) for f in fields])
+
+        self.count += 1
+
+    def write_all(self, records):
+        """
+        write every record from an iterable, e.g. a generator reading pages from AWS
+
+        :return:  number of records written
+        """
+
+        for record in records:
+            self.write(record)
+
+        self.out.flush()
+
+        return self.count
@@ -0,0 +1,141 @@
+#
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file
+# except in compliance with the License. A copy of the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+import contextvars
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+
+
+def chunked(items, size):
+    """
+    split a list into lists of at most size items
+
+    :param items:  list
+    :param size:  maximum chunk size, e.g. the most IDs an API call accepts
+    """
+
+    items = list(items)
+
+    return [items[n:n + size] for n in range(0, len(items), size)]
+
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+
+    """
+    ThreadPoolExecutor that runs each function in a copy of the submitting thread's context, so
+    the API calls made on the pool count towards the caller's PhaseTimer phase
+    """
+
+    def submit(self, fn, *args, **kwargs):
+
+        return ThreadPoolExecutor.submit(self, contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+class TaskPipeline:
+
+    def __init__(self, max_workers=4, timer=None):
+
+        """
+        Runs named tasks on a thread pool, each one as soon as the tasks it requires have finished
+
+        A task that fails stops the tasks that require it, the others still run.  run() raises
+        ValueError at the end if any task failed.
+
+        :param max_workers:  tasks running at the same time
+        :param timer:  PhaseTimer, each task is timed as a phase of the same name
+        """
+
+        self.max_workers = max_workers
+        self.timer = timer
+        self.tasks = dict()
+        self.order = list()
+
+    def add(self, name, func, requires=None, with_results=False):
+        """
+        add a task
+
+        :param name:  task name
+        :param func:  callable, run without arguments, its return value is the task result
+        :param requires:  list of task names that have to finish first, they must already be added
+        :param with_results:  call func with a dictionary of required task name -> result instead
+        """
+
+        requires = list(requires or list())
+
+        for r in requires:
+            if r not in self.tasks:
+                errmsg = 'Task "{0}" requires unknown task "{1}"'.format(name, r)
+                raise ValueError(errmsg)
+
+        if name in self.tasks:
+            errmsg = 'Task "{0}" already added'.format(name)
+            raise ValueError(errmsg)
+
+        self.tasks[name] = {'func': func, 'requires': requires, 'with_results': with_results}
+        self.order.append(name)
+
+    def _call(self, name, required):
+
+        task = self.tasks[name]
+        args = [required] if task['with_results'] else list()
+
+        if self.timer is None:
+            return task['func'](*args)
+
+        with self.timer.phase(name):
+            return task['func'](*args)
+
+    def run(self):
+        """
+        run all of the tasks
+
+        :return:  dictionary of task name -> result
+        """
+
+        results = dict()
+        errors = dict()
+        skipped = list()
+        pending = list(self.order)
+        running = dict()
+
+        with ContextThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                for name in list(pending):
+                    requires = self.tasks[name]['requires']
+                    if any(r in errors or r in skipped for r in requires):
+                        pending.remove(name)
+                        skipped.append(name)
+                    elif all(r in results for r in requires):
+                        pending.remove(name)
+                        required = dict((r, results[r]) for r in requires)
+                        running[pool.submit(self._call, name, required)] = name
+
+                if not running:
+                    break
+
+                done, not_done = wait(list(running), return_when=FIRST_COMPLETED)
+                for f in done:
+                    name = running.pop(f)
+                    try:
+                        results[name] = f.result()
+                    except Exception as e:
+                        errors[name] = e
+
+        if errors:
+            errmsg = '; '.join('{0} failed: {1}'.format(name, e) for name, e in errors.items())
+            if skipped:
+                errmsg += '; not run: {0}'.format(', '.join(skipped))
+            raise ValueError(errmsg)
+
+        return results
@@ -0,0 +1,252 @@
+#
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file
+# except in compliance with the License. A copy of the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+import os
+import time
+import threading
+from .apistats import event_op
+from .apistats import is_throttle_error
+
+
+# Requests per second and burst size, looked up as "<service id>.<Operation>" first and then
+# "<service id>".  Service ids are the botocore event names: cloudformation, ec2, auto-scaling, s3
+DEFAULT_RATE_LIMITS = {
+    'cloudformation': (5.0, 10),
+    'cloudformation.DescribeStackEvents': (4.0, 8),
+    'ec2': (20.0, 100),
+    'auto-scaling': (10.0, 20),
+    's3': (100.0, 200),
+}
+
+DEFAULT_RATE_LIMIT = (10.0, 20)
+
+# Environment variable with extra limits, e.g. "cloudformation.DescribeStacks=2:4,ec2=10"
+RATE_LIMITS_ENV = 'AWSCFNCTL_RATE_LIMITS'
+
+
+def parse_rate_limits(spec):
+    """
+    parse a rate limit string into a dictionary
+
+    :param spec:  "<name>=<rate>[:<burst>],..."
+    :return: dictionary of name -> (rate, burst)
+    """
+
+    limits = dict()
+
+    if not spec:
+        return limits
+
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            name, value = item.split('=')
+            if ':' in value:
+                rate, burst = value.split(':')
+            else:
+                rate, burst = value, None
+            rate = float(rate)
+            burst = int(burst) if burst else max(1, int(rate * 2))
+        except ValueError:
+            errmsg = 'Rate limit "{0}" not valid, use <service>[.<Operation>]=<rate>[:<burst>]'.format(item)
+            raise ValueError(errmsg)
+        limits[name.strip()] = (rate, burst)
+
+    return limits
+
+
+class TokenBucket:
+
+    def __init__(self, rate, burst, min_rate=0.5, backoff=0.5, increase=0.05):
+
+        """
+        Token bucket whose refill rate adapts to throttling
+
+        :param rate:  configured (and maximum) requests per second
+        :param burst:  bucket size
+        :param min_rate:  lowest rate after backing off
+        :param backoff:  multiply the rate by this on a throttle
+        :param increase:  fraction of the configured rate added back on each success
+        """
+
+        self.lock = threading.Lock()
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.burst = burst
+        self.min_rate = min(min_rate, self.max_rate)
+        self.backoff = backoff
+        self.increase = increase * self.max_rate
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+        self.last_throttle = 0.0
+        self.throttles = 0
+
+    def _refill(self, now):
+
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def acquire(self):
+        """
+        take a token, sleeping until one is available
+
+        Callers reserve a token even when the bucket is empty, so waiting threads are
+        served in arrival order instead of all waking up at once.
+
+        :return: seconds slept
+        """
+
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            wait = -self.tokens / self.rate
+
+        time.sleep(wait)
+        return wait
+
+    def throttled(self):
+
+        with self.lock:
+            now = time.monotonic()
+            self.throttles += 1
+            # one burst of requests usually comes back throttled together, only back off once for it
+            if now - self.last_throttle < 1.0 / self.rate:
+                return
+            self.last_throttle = now
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate * self.backoff)
+            self.tokens = min(self.tokens, 0.0)
+
+    def succeeded(self):
+
+        with self.lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+
+
+class RateLimiter:
+
+    def __init__(self, limits=None):
+
+        """
+        Client side rate limiting, one adaptive token bucket per region, service and operation
+
+        The same RateLimiter can be registered on any number of clients, all of the clients share
+        the buckets, so concurrent callers back off together when AWS starts throttling.
+
+        :param limits:  dictionary of "<service id>[.<Operation>]" -> (rate, burst)
+        """
+
+        self.lock = threading.Lock()
+        self.limits = dict(DEFAULT_RATE_LIMITS)
+        self.buckets = dict()
+
+        if limits:
+            self.limits.update(limits)
+
+    def configure(self, name, rate, burst=None):
+        """
+        set the rate limit for a service, or one operation of a service
+
+        :param name:  "<service id>" or "<service id>.<Operation>", e.g. "cloudformation.DescribeStacks"
+        :param rate:  requests per second
+        :param burst:  bucket size, defaults to two seconds worth of requests
+        """
+
+        if burst is None:
+            burst = max(1, int(rate * 2))
+
+        with self.lock:
+            self.limits[name] = (float(rate), burst)
+            # buckets pick up the new limit the next time they are used
+            for key in list(self.buckets):
+                if name in (key[1], '{0}.{1}'.format(key[1], key[2])):
+                    del self.buckets[key]
+
+    def limit_for(self, service, operation):
+
+        try:
+            return self.limits['{0}.{1}'.format(service, operation)]
+        except KeyError:
+            return self.limits.get(service, DEFAULT_RATE_LIMIT)
+
+    def bucket(self, region, service, operation):
+
+        key = (region, service, operation)
+
+        with self.lock:
+            try:
+                return self.buckets[key]
+            except KeyError:
+                rate, burst = self.limit_for(service, operation)
+                self.buckets[key] = TokenBucket(rate, burst)
+                return self.buckets[key]
+
+    def register(self, client):
+        """
+        rate limit all requests from a client, including botocore retries
+
+        :param client:  boto3 client
+        :return:  the client
+        """
+
+        region = client.meta.region_name
+        events = client.meta.events
+
+        def before_send(event_name, **kwargs):
+            self.bucket(region, *event_op(event_name)).acquire()
+
+        def needs_retry(event_name, response, **kwargs):
+            if response is not None and is_throttle_error(response[1]):
+                self.bucket(region, *event_op(event_name)).throttled()
+
+        def after_call(event_name, parsed, **kwargs):
+            if 'Error' not in parsed:
+                self.bucket(region, *event_op(event_name)).succeeded()
+
+        events.register('before-send', before_send, unique_id='awscfnctl-ratelimit-before-send')
+        events.register('needs-retry', needs_retry, unique_id='awscfnctl-ratelimit-needs-retry')
+        events.register('after-call', after_call, unique_id='awscfnctl-ratelimit-after-call')
+
+        return client
+
+    def status(self):
+        """
+        returns dictionary of (region, service, operation) -> (current rate, configured rate, throttles)
+        """
+
+        with self.lock:
+            return dict((key, (b.rate, b.max_rate, b.throttles)) for key, b in self.buckets.items())
+
+
+_shared_rate_limiter = None
+_shared_rate_limiter_lock = threading.Lock()
+
+
+def shared_rate_limiter():
+    """
+    returns the process wide RateLimiter, used by every CfnControl unless one is passed in
+    """
+
+    global _shared_rate_limiter
+
+    with _shared_rate_limiter_lock:
+        if _shared_rate_limiter is None:
+            _shared_rate_limiter = RateLimiter(parse_rate_limits(os.environ.get(RATE_LIMITS_ENV)))
+
+    return _shared_rate_limiter
@@ -0,0 +1,150 @@
+#
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file
+# except in compliance with the License. A copy of the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+
+import os
+import json
+import time
+import threading
+
+
+# seconds the stack outputs saved by an earlier run are used for, 0 (the default) never uses them
+OUTPUT_CACHE_TTL_ENV = 'AWSCFNCTL_OUTPUT_CACHE_TTL'
+
+# a stack in one of these stays as it is until someone changes it again
+SETTLED_STATUSES = [
+    'CREATE_COMPLETE',
+    'UPDATE_COMPLETE',
+    'UPDATE_ROLLBACK_COMPLETE',
+    'IMPORT_COMPLETE',
+    'IMPORT_ROLLBACK_COMPLETE',
+]
+
+
+def output_cache_path(cfn_param_file_dir, aws_profile):
+    """
+    returns the file name of the output cache of a profile, each profile can be another account
+    with stacks of the same names
+    """
+
+    return os.path.join(cfn_param_file_dir, '.cache', 'stack-outputs-{0}.json'.format(aws_profile))
+
+
+class OutputCache:
+
+    def __init__(self, path, ttl=None):
+
+        """
+        Stack outputs saved in a JSON file, so the next run can skip describe_stacks for stacks
+        that were settled (e.g. CREATE_COMPLETE) when last described.  Only used for ttl seconds
+        after they were saved, a stack can still be updated afterwards by something else.
+
+        :param path:  file to keep the outputs in, one per profile, see output_cache_path()
+        :param ttl:  seconds, default from the AWSCFNCTL_OUTPUT_CACHE_TTL environment variable, 0 disables
+                     the cache
+        """
+
+        if ttl is None:
+            try:
+                ttl = float(os.environ.get(OUTPUT_CACHE_TTL_ENV) or 0)
+            except ValueError:
+                errmsg = '{0} must be a number of seconds'.format(OUTPUT_CACHE_TTL_ENV)
+                raise ValueError(errmsg)
+
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = None
+
+    def load(self):
+
+        if self.entries is None:
+            try:
+                with open(self.path) as f:
+                    self.entries = json.load(f)
+            except (IOError, OSError, ValueError):
+                # missing or unreadable, start over
+                self.entries = dict()
+
+        return self.entries
+
+    def save(self):
+
+        directory = os.path.dirname(self.path)
+        try:
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            tmp = '{0}.{1}.tmp'.format(self.path, os.getpid())
+            with open(tmp, 'w') as f:
+                json.dump(self.entries, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+        except (IOError, OSError):
+            # the cache is only an optimization
+            pass
+
+    @staticmethod
+    def key(region, stack_name):
+
+        return '{0}/{1}'.format(region, stack_name)
+
+    def get(self, region, stack_name):
+        """
+        returns the saved outputs dictionary of a stack, or None if there are none young enough
+        """
+
+        if not self.ttl:
+            return None
+
+        with self.lock:
+            entry = self.load().get(self.key(region, stack_name))
+
+        if entry is None or time.time() - entry['saved'] > self.ttl:
+            return None
+
+        return entry['outputs']
+
+    def put(self, region, stack):
+        """
+        save the outputs of a described stack if it is settled, or forget them if it isn't
+
+        :param stack:  a stack from describe_stacks
+        """
+
+        if not self.ttl:
+            return
+
+        key = self.key(region, stack['StackName'])
+
+        with self.lock:
+            entries = self.load()
+            if stack['StackStatus'] in SETTLED_STATUSES:
+                entry = {
+                    'status': stack['StackStatus'],
+                    'outputs': dict((o['OutputKey'], o['OutputValue']) for o in stack.get('Outputs', list())),
+                    'saved': time.time(),
+                }
+                entries[key] = entry
+            elif key in entries:
+                del entries[key]
+            else:
+                return
+            self.save()
+
+    def forget(self, region, stack_name):
+
+        if not self.ttl:
+            return
+
+        with self.lock:
+            if self.load().pop(self.key(region, stack_name), None) is not None:
+                self.save()
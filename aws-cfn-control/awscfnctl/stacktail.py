@@ -0,0 +1,354 @@
+#
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file
+# except in compliance with the License. A copy of the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+import time
+import heapq
+from botocore.exceptions import ClientError
+
+
+# stack statuses that nothing follows until the stack is changed again
+TERMINAL_STATUSES = [
+    'CREATE_COMPLETE',
+    'CREATE_FAILED',
+    'ROLLBACK_COMPLETE',
+    'ROLLBACK_FAILED',
+    'DELETE_COMPLETE',
+    'DELETE_FAILED',
+    'UPDATE_COMPLETE',
+    'UPDATE_FAILED',
+    'UPDATE_ROLLBACK_COMPLETE',
+    'UPDATE_ROLLBACK_FAILED',
+    'IMPORT_COMPLETE',
+    'IMPORT_ROLLBACK_COMPLETE',
+    'IMPORT_ROLLBACK_FAILED',
+]
+
+# the fields of an event record, for --output jsonl|csv
+EVENT_FIELDS = ['StackName', 'StackId', 'EventId', 'Timestamp', 'LogicalResourceId', 'PhysicalResourceId',
+                'ResourceType', 'ResourceStatus', 'ResourceStatusReason']
+
+# terminal statuses where the change didn't go through
+FAILED_STATUSES = [s for s in TERMINAL_STATUSES if 'FAILED' in s or 'ROLLBACK' in s]
+
+
+def find_stacks(client_cfn, stack_names=None, prefix=None):
+    """
+    returns list() of (stack name, stack ID, stack status) for the named stacks and the stacks
+    whose name starts with prefix, deleted stacks are left out
+
+    :param client_cfn:  CloudFormation client
+    :param stack_names:  list() of stack names (or IDs), a name that doesn't exist raises ValueError
+    :param prefix:  stack name prefix
+    """
+
+    stacks = list()
+
+    for stack_name in (stack_names or list()):
+        try:
+            s = client_cfn.describe_stacks(StackName=stack_name)['Stacks'][0]
+        except ClientError as e:
+            raise ValueError(e)
+        stacks.append((s['StackName'], s['StackId'], s['StackStatus']))
+
+    if prefix:
+        paginator = client_cfn.get_paginator('list_stacks')
+        for page in paginator.paginate():
+            for s in page['StackSummaries']:
+                if s['StackName'].startswith(prefix) and s['StackStatus'] != 'DELETE_COMPLETE':
+                    stacks.append((s['StackName'], s['StackId'], s['StackStatus']))
+
+    found = list()
+    for s in stacks:
+        if s[1] not in [f[1] for f in found]:
+            found.append(s)
+
+    return found
+
+
+class StackTail:
+
+    def __init__(self, client_cfn, min_interval=2.0, max_interval=30.0, backoff=1.5, prefix=True, writer=None):
+
+        """
+        Tails the events of several stacks from one loop.  Each stack is polled on its own
+        schedule: right after new events it is polled every min_interval seconds, and each quiet
+        poll makes the interval backoff times longer, up to max_interval.  A stack is done once
+        one of its own events has a terminal status.
+
+        :param client_cfn:  CloudFormation client
+        :param prefix:  start each event line with the stack name
+        :param writer:  RecordWriter, events are written to it as records instead of printed
+        """
+
+        self.client_cfn = client_cfn
+        self.writer = writer
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.prefix = prefix
+
+        self.stacks = dict()
+        self.queue = list()
+        self.seq = 0
+
+    def add(self, stack_name, stack_id, stack_status=None):
+        """
+        tail a stack, the most recent events (up to 100) are printed on the first poll.  If
+        stack_status is already terminal, only those are printed.
+        """
+
+        self.stacks[stack_id] = {
+            'name': stack_name,
+            'status': stack_status,
+            'last_event': None,
+            'interval': self.min_interval,
+            'polls': 0,
+            'events': 0,
+            'done': False,
+        }
+        self.schedule(stack_id, 0)
+
+    def schedule(self, stack_id, delay):
+
+        self.seq += 1
+        heapq.heappush(self.queue, (time.monotonic() + delay, self.seq, stack_id))
+
+    def new_events(self, stack_id):
+        """
+        returns list() of the events since the last poll, oldest first
+        """
+
+        stack = self.stacks[stack_id]
+        events = list()
+        kwargs = {'StackName': stack_id}
+
+        while True:
+            try:
+                response = self.client_cfn.describe_stack_events(**kwargs)
+            except ClientError as e:
+                raise ValueError(e)
+
+            for e in response['StackEvents']:
+                if e['EventId'] == stack['last_event']:
+                    return list(reversed(events))
+                events.append(e)
+
+            # the first poll only shows the most recent page
+            if stack['last_event'] is None or not response.get('NextToken'):
+                return list(reversed(events))
+
+            kwargs['NextToken'] = response['NextToken']
+
+    def print_event(self, stack, e):
+
+        if self.writer is not None:
+            self.writer.write(dict((f, e.get(f)) for f in EVENT_FIELDS))
+            return
+
+        line = '{0} {1}'.format(e['LogicalResourceId'], e['ResourceStatus'])
+        if e.get('ResourceStatusReason'):
+            line += ' {0}'.format(e['ResourceStatusReason'])
+        if self.prefix:
+            line = '[{0}] {1}'.format(stack['name'], line)
+
+        print(line)
+
+    def poll(self, stack_id):
+        """
+        print the new events of one stack and schedule its next poll
+        """
+
+        stack = self.stacks[stack_id]
+        stack['polls'] += 1
+
+        events = self.new_events(stack_id)
+
+        for e in events:
+            self.print_event(stack, e)
+            if e.get('PhysicalResourceId') == stack_id and e['ResourceType'] == 'AWS::CloudFormation::Stack':
+                stack['status'] = e['ResourceStatus']
+
+        if events:
+            stack['last_event'] = events[-1]['EventId']
+            stack['events'] += len(events)
+            stack['interval'] = self.min_interval
+        elif stack['polls'] > 1:
+            stack['interval'] = min(stack['interval'] * self.backoff, self.max_interval)
+
+        if events and self.writer is not None:
+            self.writer.out.flush()
+
+        if stack['status'] in TERMINAL_STATUSES:
+            stack['done'] = True
+        else:
+            self.schedule(stack_id, stack['interval'])
+
+    def run(self):
+        """
+        poll until every stack is done
+
+        :return:  dictionary of stack name -> final stack status
+        """
+
+        while self.queue:
+            due, seq, stack_id = heapq.heappop(self.queue)
+            wait = due - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self.poll(stack_id)
+
+        return dict((s['name'], s['status']) for s in self.stacks.values())
+
+
+class StackWatch(StackTail):
+
+    def __init__(self, client_cfn, interval=5.0, prefix=True, writer=None):
+
+        """
+        Follows many stacks with about the same number of API calls however many there are.  Each
+        tick reads the status of every stack in one paginated list_stacks, and only the stacks
+        whose status or update time changed since the last tick have their new events read.  A
+        table of the watched stacks is printed after each tick that changed something.
+
+        :param client_cfn:  CloudFormation client
+        :param interval:  seconds between ticks
+        :param prefix:  start each event line with the stack name
+        :param writer:  RecordWriter, events are written to it as records and no tables are printed
+        """
+
+        StackTail.__init__(self, client_cfn, prefix=prefix, writer=writer)
+
+        self.interval = interval
+        self.ticks = 0
+
+    def add(self, stack_name, stack_id, stack_status=None):
+        """
+        watch a stack, a stack that is already done only shows up in the table
+        """
+
+        self.stacks[stack_id] = {
+            'name': stack_name,
+            'status': stack_status,
+            'changed': None,
+            'changed_tick': 0,
+            'last_event': None,
+            'polls': 0,
+            'events': 0,
+            'done': False,
+        }
+
+    def list_stacks(self):
+        """
+        returns dictionary of stack ID -> stack summary, for the watched stacks
+        """
+
+        summaries = dict()
+
+        paginator = self.client_cfn.get_paginator('list_stacks')
+        try:
+            for page in paginator.paginate():
+                for s in page['StackSummaries']:
+                    if s['StackId'] in self.stacks:
+                        summaries[s['StackId']] = s
+        except ClientError as e:
+            raise ValueError(e)
+
+        return summaries
+
+    def tick(self):
+        """
+        read the stack statuses, and the new events of the stacks that changed
+
+        :return:  True if any stack changed
+        """
+
+        self.ticks += 1
+        changed = False
+
+        for stack_id, summary in self.list_stacks().items():
+            stack = self.stacks[stack_id]
+            key = (summary['StackStatus'], summary.get('LastUpdatedTime'), summary.get('DeletionTime'))
+
+            if key == stack['changed']:
+                continue
+
+            first = stack['changed'] is None
+            stack['changed'] = key
+            stack['changed_tick'] = self.ticks
+            stack['status'] = summary['StackStatus']
+            changed = True
+
+            # stacks that were already done when the watch started don't need their history
+            if first and stack['status'] in TERMINAL_STATUSES:
+                continue
+
+            stack['polls'] += 1
+            events = self.new_events(stack_id)
+            for e in events:
+                self.print_event(stack, e)
+            if events:
+                stack['last_event'] = events[-1]['EventId']
+                stack['events'] += len(events)
+
+        for stack in self.stacks.values():
+            stack['done'] = stack['status'] in TERMINAL_STATUSES
+
+        return changed
+
+    def format_table(self, all_stacks=True):
+        """
+        returns the stack statuses as a printable table, ending with the number of stacks in each status
+
+        :param all_stacks:  False leaves out the stacks that are done, unless they changed in the last tick
+        """
+
+        line_fmt = '{0:<40.40} {1:<32} {2:>7}'
+
+        counts = dict()
+        lines = list()
+        lines.append(line_fmt.format('Stack', 'Status', 'Events'))
+        lines.append(81 * '-')
+        for stack in sorted(self.stacks.values(), key=lambda s: s['name']):
+            counts[stack['status']] = counts.get(stack['status'], 0) + 1
+            if all_stacks or not stack['done'] or stack['changed_tick'] == self.ticks:
+                lines.append(line_fmt.format(stack['name'], stack['status'] or 'UNKNOWN', stack['events']))
+        lines.append(81 * '-')
+        lines.append(', '.join('{0} {1}'.format(n, s) for s, n in sorted(counts.items(), key=lambda c: str(c[0]))))
+
+        return '\n'.join(lines)
+
+    def run(self):
+        """
+        tick until every stack is done
+
+        :return:  dictionary of stack name -> final stack status
+        """
+
+        while True:
+            if self.tick():
+                if all(s['done'] for s in self.stacks.values()):
+                    break
+                if self.writer is None:
+                    print('\nStatus at {0}:'.format(time.strftime('%H:%M:%S')))
+                    print(self.format_table(all_stacks=False))
+                else:
+                    self.writer.out.flush()
+            time.sleep(self.interval)
+
+        if self.writer is None:
+            print('\nStatus at {0}:'.format(time.strftime('%H:%M:%S')))
+            print(self.format_table())
+        else:
+            self.writer.out.flush()
+
+        return dict((s['name'], s['status']) for s in self.stacks.values())
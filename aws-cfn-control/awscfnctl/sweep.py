@@ -0,0 +1,170 @@
+#
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file
+# except in compliance with the License. A copy of the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+
+import os
+import threading
+import boto3
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError
+from botocore.exceptions import ClientError
+from .apistats import ApiStats
+from .ratelimit import RateLimiter
+from .ratelimit import RATE_LIMITS_ENV
+from .ratelimit import parse_rate_limits
+from .coalesce import CallCoalescer
+from .fanout import FanOut
+from .fanout import get_regions
+from .fanout import print_errors
+from .awscfnctl import CfnControl
+from .awscfnctl import iter_stack_summaries
+
+
+# the fields of a swept stack record, in output order
+SWEEP_FIELDS = ['Profile', 'Account', 'Region', 'StackName', 'StackStatus', 'CreationTime', 'LastUpdatedTime',
+                'TemplateDescription', 'StackId']
+
+
+class StackSweep:
+
+    def __init__(self, profiles, regions=None, max_workers=8, api_stats=None):
+
+        """
+        Lists the stacks of several profiles (accounts) in several regions at once.  Only a
+        CloudFormation client is made for each profile and region, so none of the S3 and EC2
+        checks a CfnControl makes on start up are repeated per account.
+
+        Each profile gets its own rate limiter, accounts are throttled separately by AWS.
+
+        :param profiles:  list() of AWS credentials profile names, None for the default profile
+        :param regions:  list() of region names, None for every region enabled in each account
+        :param max_workers:  profile/region pairs read at the same time
+        :param api_stats:  ApiStats() to collect the API calls in, one is created if not given
+        """
+
+        self.profiles = list(profiles or [None])
+        self.regions = regions
+        self.max_workers = max_workers
+        self.api_stats = api_stats or ApiStats()
+        self.client_config = Config(retries={'max_attempts': 10, 'mode': 'standard'},
+                                    max_pool_connections=max(10, max_workers))
+
+        self.sessions = dict()
+        self.rate_limiters = dict()
+        self.coalescers = dict()
+        # a boto3 session isn't safe for making clients from several threads at once
+        self.session_locks = dict()
+        self.errors = dict()
+
+    def session(self, profile):
+        """
+        returns the boto3 session of a profile, made on first use in the calling thread
+        """
+
+        if profile not in self.sessions:
+            if CfnControl.session_factory is not None:
+                session = CfnControl.session_factory(profile_name=profile)
+            else:
+                session = boto3.session.Session(profile_name=profile)
+            self.api_stats.register(session)
+            self.sessions[profile] = session
+            self.rate_limiters[profile] = RateLimiter(parse_rate_limits(os.environ.get(RATE_LIMITS_ENV)))
+            self.coalescers[profile] = CallCoalescer()
+            self.session_locks[profile] = threading.Lock()
+
+        return self.sessions[profile]
+
+    def new_client(self, profile, service_name, region):
+
+        with self.session_locks[profile]:
+            client = self.sessions[profile].client(service_name, region_name=region, config=self.client_config)
+        self.coalescers[profile].register(client)
+
+        return self.rate_limiters[profile].register(client)
+
+    def profile_regions(self):
+        """
+        returns list() of (profile, region) pairs to read, reading each account's enabled regions
+        at the same time when no regions were given.  A profile that fails is left out and kept in
+        errors.
+        """
+
+        profiles = list()
+        for profile in self.profiles:
+            try:
+                self.session(profile)
+            except BotoCoreError as e:
+                self.errors[profile or 'default'] = e
+                continue
+            profiles.append(profile)
+
+        if self.regions is not None:
+            return [(p, r) for p in profiles for r in self.regions]
+
+        def enabled_regions(profile):
+            region = self.sessions[profile].region_name or 'us-east-1'
+            return get_regions(self.new_client(profile, 'ec2', region))
+
+        fan_out = FanOut(max_workers=self.max_workers)
+        pairs = list(fan_out.run([(p, lambda p=p: [(p, r) for r in enabled_regions(p)]) for p in profiles]))
+        for p, e in fan_out.errors.items():
+            self.errors[p or 'default'] = e
+
+        return sorted((pair for p, pair in pairs), key=lambda pair: (pair[0] or '', pair[1]))
+
+    def stacks(self, profile, region):
+        """
+        yields the stack records of one profile and region
+        """
+
+        client_cfn = self.new_client(profile, 'cloudformation', region)
+
+        try:
+            for r in iter_stack_summaries(client_cfn):
+                record = {
+                    'Profile': profile or 'default',
+                    'Account': r['StackId'].split(':')[4],
+                    'Region': region,
+                }
+                record.update(r)
+                yield record
+        except (BotoCoreError, ClientError) as e:
+            raise ValueError(e)
+
+    def run(self):
+        """
+        yields the stack records of every profile and region, in the order they arrive.  A
+        profile/region pair that fails doesn't stop the others, its error is kept in errors,
+        keyed "<profile>/<region>".
+        """
+
+        tasks = list()
+        for profile, region in self.profile_regions():
+            tasks.append(('{0}/{1}'.format(profile or 'default', region),
+                          lambda p=profile, r=region: self.stacks(p, r)))
+
+        fan_out = FanOut(max_workers=self.max_workers)
+        try:
+            for key, record in fan_out.run(tasks):
+                yield record
+        finally:
+            self.errors.update(fan_out.errors)
+
+    def print_errors(self, out=None):
+        """
+        print one line per failed profile or profile/region, to stderr
+
+        :return:  number of failures
+        """
+
+        return print_errors(self.errors, out=out)
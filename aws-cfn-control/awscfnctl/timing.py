@@ -0,0 +1,160 @@
+#
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file
+# except in compliance with the License. A copy of the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+import sys
+import time
+import atexit
+import threading
+import contextlib
+import contextvars
+
+
+# the counters of the phases the current context is in, see PhaseTimer.phase() and count_call()
+_phase_counters = contextvars.ContextVar('awscfnctl_phase_counters', default=())
+
+
+def count_call(seconds):
+    """
+    count an API call towards the phases the calling context is in
+
+    Each phase counts only the calls made inside it, also on the threads it hands work to (see
+    pipeline.ContextThreadPoolExecutor), so phases running at the same time don't count each
+    other's calls.
+
+    :param seconds:  time the call took
+    """
+
+    for counter in _phase_counters.get():
+        with counter['lock']:
+            counter['calls'] += 1
+            counter['api_time'] += seconds
+
+
+class PhaseTimer:
+
+    def __init__(self, api_stats=None):
+
+        """
+        Wall time of the named phases of a long running operation
+
+        Phases can run concurrently, each one counts the API calls made in its own context only.
+        A phase entered inside another counts towards both.
+
+        :param api_stats:  ApiStats, if given the API calls and API time of each phase are included
+        """
+
+        self.lock = threading.Lock()
+        self.api_stats = api_stats
+        self.phases = dict()
+        self.order = list()
+        self.started = time.monotonic()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        time the enclosed block, a phase entered more than once adds up
+        """
+
+        counter = {'lock': threading.Lock(), 'calls': 0, 'api_time': 0.0}
+        token = _phase_counters.set(_phase_counters.get() + (counter,))
+        start = time.monotonic()
+
+        try:
+            yield
+        finally:
+            seconds = time.monotonic() - start
+            _phase_counters.reset(token)
+            calls = counter['calls'] if self.api_stats else 0
+            api_time = counter['api_time'] if self.api_stats else 0.0
+            with self.lock:
+                if name not in self.phases:
+                    self.phases[name] = {'seconds': 0.0, 'calls': 0, 'api_time': 0.0}
+                    self.order.append(name)
+                p = self.phases[name]
+                p['seconds'] += seconds
+                p['calls'] += calls
+                p['api_time'] += api_time
+
+    def total(self):
+
+        return time.monotonic() - self.started
+
+    def format_table(self):
+
+        line_fmt = '{0:<24} {1:>10} {2:>7} {3:>8} {4:>10}'
+
+        total = self.total()
+
+        lines = list()
+        lines.append(line_fmt.format('Phase', 'Seconds', '%', 'Calls', 'API s'))
+        lines.append(63 * '-')
+        for name in self.order:
+            p = self.phases[name]
+            pct = 100.0 * p['seconds'] / total if total else 0.0
+            lines.append(line_fmt.format(name, '{0:.2f}'.format(p['seconds']), '{0:.1f}'.format(pct), p['calls'],
+                                         '{0:.2f}'.format(p['api_time'])))
+        lines.append(63 * '-')
+        lines.append(line_fmt.format('Total', '{0:.2f}'.format(total), '', '', ''))
+
+        return '\n'.join(lines)
+
+    def print_table(self):
+
+        print('\nTiming:')
+        print(self.format_table())
+
+
+def start_profile(profile_out):
+    """
+    profile the rest of the run and write pstats data to profile_out at exit
+
+    The profile measures CPU time, so time spent waiting on AWS or sleeping doesn't hide the
+    hot spots in the client itself.  Threads started from now on (e.g. the post-create pipeline
+    and the per-instance pools) are profiled too, each with its own CPU time, and merged into
+    the same file.
+
+    :param profile_out:  file name, read it with "python -m pstats <file>"
+    :return:  the cProfile.Profile of the calling thread
+    """
+
+    import pstats
+    import cProfile
+
+    lock = threading.Lock()
+    profiler = cProfile.Profile(time.thread_time)
+    profilers = [profiler]
+
+    def profile_thread(frame, event, arg):
+        # called once in each new thread, hands over to a profiler of its own
+        sys.setprofile(None)
+        thread_profiler = cProfile.Profile(time.thread_time)
+        with lock:
+            profilers.append(thread_profiler)
+        thread_profiler.enable()
+
+    def write_profile():
+        threading.setprofile(None)
+        profiler.disable()
+        with lock:
+            stats = pstats.Stats(profilers[0])
+            for p in profilers[1:]:
+                stats.add(p)
+        stats.dump_stats(profile_out)
+        print('Profile of {0} threads written to {1}, view it with: python -m pstats {1}'.format(
+            len(profilers), profile_out), file=sys.stderr)
+
+    atexit.register(write_profile)
+    threading.setprofile(profile_thread)
+    profiler.enable()
+
+    return profiler
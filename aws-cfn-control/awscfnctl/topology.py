@@ -0,0 +1,203 @@
+#
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file
+# except in compliance with the License. A copy of the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+
+import os
+import json
+import datetime
+
+
+# the fields of an instance record, for --output jsonl|csv
+TOPOLOGY_FIELDS = ['StackName', 'AutoScalingGroup', 'InstanceId', 'LifecycleState', 'State', 'InstanceType',
+                   'AvailabilityZone', 'PrivateIpAddress', 'PublicIpAddress', 'ElasticIp', 'NetworkInterfaces']
+
+SNAPSHOT_VERSION = 1
+
+
+class StackTopology:
+
+    def __init__(self, stack, asgs=None, instances=None, enis=None, eips=None, region=None, taken=None):
+
+        """
+        The resources of a stack as a small graph: stack -> ASGs -> instances -> network interfaces
+        -> Elastic IPs, with indexes by instance ID, private IP and ASG.  Everything is plain
+        dictionaries and lists, so a topology can be saved and loaded as JSON.
+
+        :param stack:  dictionary with StackName, StackId, StackStatus
+        :param asgs:  dictionary of ASG name -> {'Instances': [instance IDs], 'Desired', 'Min', 'Max', 'StackId'}
+        :param instances:  dictionary of instance ID -> instance record (see CfnControl.get_stack_topology)
+        :param enis:  dictionary of network interface ID -> network interface record
+        :param eips:  dictionary of public IP -> Elastic IP record
+        :param region:  region name
+        :param taken:  when the topology was read, ISO 8601
+        """
+
+        self.stack = stack
+        self.asgs = asgs or dict()
+        self.instances = instances or dict()
+        self.enis = enis or dict()
+        self.eips = eips or dict()
+        self.region = region
+        self.taken = taken or datetime.datetime.utcnow().replace(microsecond=0).isoformat() + 'Z'
+
+        self.by_private_ip = dict()
+        self.build_indexes()
+
+    def build_indexes(self):
+
+        self.by_private_ip = dict()
+        for eni in self.enis.values():
+            for ip in eni['PrivateIpAddresses']:
+                self.by_private_ip[ip] = eni['InstanceId']
+        for i in self.instances.values():
+            if i.get('PrivateIpAddress'):
+                self.by_private_ip.setdefault(i['PrivateIpAddress'], i['InstanceId'])
+
+    def instance(self, instance_id):
+        """
+        returns the record of an instance, or None
+        """
+
+        return self.instances.get(instance_id)
+
+    def find_ip(self, ip):
+        """
+        returns the record of the instance with this private IP (on any of its interfaces) or Elastic IP, or None
+        """
+
+        instance_id = self.by_private_ip.get(ip)
+        if instance_id is None and ip in self.eips:
+            instance_id = self.eips[ip].get('InstanceId')
+
+        return self.instances.get(instance_id)
+
+    def asg_instances(self, asg):
+        """
+        returns list() of the instance records of an ASG
+        """
+
+        return [self.instances[i] for i in self.asgs.get(asg, dict()).get('Instances', list()) if i in self.instances]
+
+    def records(self):
+        """
+        yields one flat dictionary per instance, TOPOLOGY_FIELDS
+        """
+
+        for instance_id in sorted(self.instances):
+            i = self.instances[instance_id]
+            enis = [self.enis[e] for e in i['NetworkInterfaces'] if e in self.enis]
+            elastic = [e['PublicIp'] for e in enis if e.get('AllocationId')]
+            yield {
+                'StackName': self.stack['StackName'],
+                'AutoScalingGroup': i.get('AutoScalingGroup'),
+                'InstanceId': instance_id,
+                'LifecycleState': i.get('LifecycleState'),
+                'State': i.get('State'),
+                'InstanceType': i.get('InstanceType'),
+                'AvailabilityZone': i.get('AvailabilityZone'),
+                'PrivateIpAddress': i.get('PrivateIpAddress'),
+                'PublicIpAddress': i.get('PublicIpAddress'),
+                'ElasticIp': elastic[0] if elastic else None,
+                'NetworkInterfaces': len(enis),
+            }
+
+    def format_tree(self):
+        """
+        returns the topology as a printable tree
+        """
+
+        lines = list()
+        lines.append('{0} ({1}), {2} ASGs, {3} instances, {4} network interfaces, {5} Elastic IPs'.format(
+            self.stack['StackName'], self.stack['StackStatus'], len(self.asgs), len(self.instances), len(self.enis),
+            len(self.eips)))
+
+        groups = [(name, asg['Instances']) for name, asg in sorted(self.asgs.items())]
+        in_asg = set(i for name, ids in groups for i in ids)
+        standalone = sorted(i for i in self.instances if i not in in_asg)
+        if standalone:
+            groups.append((None, standalone))
+
+        for name, ids in groups:
+            if name is None:
+                lines.append('  (not in an ASG)')
+            else:
+                asg = self.asgs[name]
+                lines.append('  {0}  desired {1}, min {2}, max {3}'.format(name, asg.get('Desired'), asg.get('Min'),
+                                                                           asg.get('Max')))
+            for instance_id in sorted(ids):
+                i = self.instances.get(instance_id)
+                if i is None:
+                    lines.append('    {0}  (not found)'.format(instance_id))
+                    continue
+                lines.append('    {0:<20} {1:<15} {2:<10} {3:<14} {4:<14} {5}'.format(
+                    instance_id, i.get('PrivateIpAddress') or '', i.get('State') or '',
+                    i.get('LifecycleState') or '', i.get('InstanceType') or '', i.get('AvailabilityZone') or ''))
+                for eni_id in i['NetworkInterfaces']:
+                    eni = self.enis.get(eni_id)
+                    if eni is None:
+                        continue
+                    line = '      {0:<22} dev {1}  {2}'.format(eni_id, eni.get('DeviceIndex'),
+                                                                 ', '.join(eni['PrivateIpAddresses']))
+                    if eni.get('PublicIp'):
+                        line += '  public {0}{1}'.format(eni['PublicIp'], ' (Elastic IP)' if eni.get('AllocationId')
+                                                          else '')
+                    lines.append(line)
+
+        return '\n'.join(lines)
+
+    def to_dict(self):
+
+        return {
+            'version': SNAPSHOT_VERSION,
+            'region': self.region,
+            'taken': self.taken,
+            'stack': self.stack,
+            'asgs': self.asgs,
+            'instances': self.instances,
+            'enis': self.enis,
+            'eips': self.eips,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+
+        if d.get('version') != SNAPSHOT_VERSION:
+            errmsg = 'Topology snapshot version {0} is not supported'.format(d.get('version'))
+            raise ValueError(errmsg)
+
+        return cls(d['stack'], asgs=d['asgs'], instances=d['instances'], enis=d['enis'], eips=d['eips'],
+                   region=d.get('region'), taken=d.get('taken'))
+
+    def save(self, path):
+        """
+        write the topology to a JSON file, replacing it only once it is complete
+        """
+
+        tmp = '{0}.{1}.tmp'.format(path, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(self.to_dict(), f, indent=1, sort_keys=True)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        returns the StackTopology saved in a JSON file
+        """
+
+        try:
+            with open(path) as f:
+                d = json.load(f)
+        except (IOError, OSError, ValueError) as e:
+            raise ValueError('Could not read topology snapshot {0}: {1}'.format(path, e))
+
+        return cls.from_dict(d)
@@ -32,7 +32,16 @@ _version = "1.0.11"
 
 console_scripts = [ 'cfnctl = awscfnctl.cfnctl:main',
                     'getamiinfo = awscfnctl.getamiinfo:main',
-                    'build_ami_maps = awscfnctl.build_ami_maps:main'
+                    'build_ami_maps = awscfnctl.build_ami_maps:main',
+                    'asgctl = awscfnctl.asgctl:main',
+                    'get_asg_from_stack = awscfnctl.get_asg_from_stack:main',
+                    'get_inst_from_asg = awscfnctl.get_inst_from_asg:main',
+                    'get_priv_dns_asg = awscfnctl.get_priv_dns_asg:main',
+                    'getec2keys = awscfnctl.getec2keys:main',
+                    'getinstinfo = awscfnctl.getinstinfo:main',
+                    'getnetinfo = awscfnctl.getnetinfo:main',
+                    'getstackinfo = awscfnctl.getstackinfo:main',
+                    'getstacktopo = awscfnctl.getstacktopo:main'
                    ]
 
 